@@ -0,0 +1,156 @@
+# Выдача номеров счетов.
+#
+# Номер - 18 цифр: префикс балансового счёта и валюты (8 цифр, например
+# 40817810), порядковый номер (9 цифр) и контрольная цифра Луна.
+# Порядковые номера берутся из account_number_sequences блоками (hi/lo):
+# один UPDATE резервирует block_size номеров, дальше процесс выдаёт их из
+# памяти без запросов. Блок резервируется в отдельной транзакции на своём
+# соединении, поэтому откат создания счёта не возвращает номера в
+# последовательность - номер просто пропускается, но никогда не выдаётся
+# дважды, сколько бы процессов ни работало.
+#
+# Номера прежней схемы (префикс + 10 цифр id) контрольной цифры не имеют.
+# Они остаются действительными: хвост такого номера не больше legacy_max
+# префикса, записанного миграцией 010, а новые номера начинаются выше.
+import threading
+
+import mysql.connector
+
+CURRENT_ACCOUNT_PREFIX = '40817810'    # текущий счёт физлица, рубли
+BUSINESS_ACCOUNT_PREFIX = '40817820'   # основной счёт бизнес-клиента
+
+SERIAL_DIGITS = 9
+ACCOUNT_NUMBER_LENGTH = 8 + SERIAL_DIGITS + 1
+
+LEGACY_BOUNDS_SQL = 'SELECT prefix, legacy_max FROM account_number_sequences'
+
+RESERVE_SQL = (
+    'UPDATE account_number_sequences SET next_value = LAST_INSERT_ID(next_value + %s) '
+    'WHERE prefix = %s'
+)
+
+
+class AccountNumberError(Exception):
+    pass
+
+
+def luhn_check_digit(digits):
+    """Контрольная цифра Луна для строки цифр"""
+    total = 0
+    # Справа налево, начиная с позиции, которая окажется второй после
+    # добавления контрольной цифры - её удваиваем
+    for i, ch in enumerate(reversed(digits)):
+        d = int(ch)
+        if i % 2 == 0:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return str((10 - total % 10) % 10)
+
+
+def format_account_number(prefix, serial):
+    if len(prefix) != 8 or not prefix.isdigit():
+        raise AccountNumberError(f'Неверный префикс счёта: {prefix}')
+    if not 0 < serial < 10 ** SERIAL_DIGITS:
+        raise AccountNumberError(f'Последовательность {prefix} исчерпана')
+    body = f'{prefix}{serial:0{SERIAL_DIGITS}d}'
+    return body + luhn_check_digit(body)
+
+
+def normalize_account_number(value):
+    """Номер из запроса без пробелов и дефисов; None, если это не строка"""
+    if not isinstance(value, str):
+        return None
+    return value.replace(' ', '').replace('-', '')
+
+
+def is_valid_account_number(number, legacy_bounds=None):
+    """Формат и контрольная цифра номера, выданного AccountNumberAllocator.
+    legacy_bounds - {префикс: legacy_max}: номер прежней схемы без
+    контрольной цифры принимается, если его хвост не выше границы"""
+    if not isinstance(number, str) or len(number) != ACCOUNT_NUMBER_LENGTH or not number.isdigit():
+        return False
+    if luhn_check_digit(number[:-1]) == number[-1]:
+        return True
+    bound = (legacy_bounds or {}).get(number[:8])
+    return bound is not None and int(number[8:]) <= bound
+
+
+class AccountNumberAllocator:
+    """Потокобезопасная выдача номеров счетов блоками из БД.
+
+    connect    -- функция, возвращающая соединение (db_pool.acquire)
+    block_size -- сколько номеров резервировать за один запрос
+    """
+
+    def __init__(self, connect, block_size=100):
+        self._connect = connect
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = {}   # префикс -> [следующий, граница (не включая)]
+        self._legacy_bounds = None
+        self.allocated = 0
+        self.reserved_blocks = 0
+
+    def _reserve(self, prefix):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(RESERVE_SQL, (self.block_size, prefix))
+                if cursor.rowcount != 1:
+                    conn.rollback()
+                    raise AccountNumberError(f'Нет последовательности для префикса {prefix}')
+                cursor.execute('SELECT LAST_INSERT_ID()')
+                end = cursor.fetchone()[0]
+                conn.commit()
+            except mysql.connector.Error:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+        self.reserved_blocks += 1
+        return [end - self.block_size, end]
+
+    def allocate(self, prefix=CURRENT_ACCOUNT_PREFIX):
+        with self._lock:
+            block = self._blocks.get(prefix)
+            if block is None or block[0] >= block[1]:
+                block = self._blocks[prefix] = self._reserve(prefix)
+            serial = block[0]
+            block[0] += 1
+            self.allocated += 1
+        return format_account_number(prefix, serial)
+
+    def legacy_bounds(self):
+        """{префикс: legacy_max}; границы не меняются, читаются один раз.
+        Нужны только для номеров без верной контрольной цифры"""
+        if self._legacy_bounds is None:
+            conn = self._connect()
+            try:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(LEGACY_BOUNDS_SQL)
+                    self._legacy_bounds = {prefix: legacy_max for prefix, legacy_max in cursor.fetchall()}
+                finally:
+                    cursor.close()
+            finally:
+                conn.close()
+        return self._legacy_bounds
+
+    def is_valid(self, number):
+        if is_valid_account_number(number):
+            return True
+        return is_valid_account_number(number, self.legacy_bounds())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'block_size': self.block_size,
+                'allocated': self.allocated,
+                'reserved_blocks': self.reserved_blocks,
+                'remaining': {prefix: end - nxt for prefix, (nxt, end) in self._blocks.items()},
+            }
@@ -0,0 +1,72 @@
+# Сводка активности пользователей для /api/admin/user-activity.
+# Обновляется приращениями в той же транзакции, что и денежная операция,
+# поэтому админская панель читает готовые числа вместо GROUP BY по всей базе.
+from datetime import datetime
+from decimal import Decimal
+
+
+class ActivityDelta:
+    """Накопитель изменений сводки в рамках одной транзакции"""
+
+    def __init__(self):
+        self._rows = {}
+
+    def add(self, user_id, transfers=0, balance=0, bonus=0, active=False):
+        row = self._rows.setdefault(user_id, [0, Decimal('0'), Decimal('0'), False])
+        row[0] += transfers
+        row[1] += Decimal(str(balance))
+        row[2] += Decimal(str(bonus))
+        row[3] = row[3] or active
+
+    # Строки сводки блокируются в порядке user_id
+    def rows(self):
+        return [(user_id, transfers, balance, bonus, datetime.now() if active else None)
+                for user_id, (transfers, balance, bonus, active) in sorted(self._rows.items())]
+
+    def apply(self, cursor):
+        if self._rows:
+            cursor.executemany(UPSERT_SQL, self.rows())
+
+
+UPSERT_SQL = '''
+    INSERT INTO user_activity_rollup
+    (user_id, total_transfers, total_balance, bonus_balance, last_activity_at)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        total_transfers = total_transfers + VALUES(total_transfers),
+        total_balance = total_balance + VALUES(total_balance),
+        bonus_balance = bonus_balance + VALUES(bonus_balance),
+        last_activity_at = COALESCE(VALUES(last_activity_at), last_activity_at)
+'''
+
+
+# Полный пересчёт сводки по исходным таблицам.
+# Запускать при остановленных денежных операциях (например, после миграции):
+# изменения, прошедшие во время пересчёта, могут быть учтены дважды.
+REBUILD_SQL = '''
+    INSERT INTO user_activity_rollup
+        (user_id, total_transfers, total_balance, bonus_balance, last_activity_at)
+    SELECT u.user_id,
+           (SELECT COUNT(*) FROM accounts a
+            JOIN transactions t ON t.from_account_id = a.account_id
+            WHERE a.user_id = u.user_id),
+           (SELECT COALESCE(SUM(a.balance), 0) FROM accounts a WHERE a.user_id = u.user_id),
+           u.bonus_balance,
+           (SELECT MAX(t.transaction_date) FROM accounts a
+            JOIN transactions t ON t.from_account_id = a.account_id
+                OR (t.to_account_id = a.account_id AND t.type_id = 3)
+            WHERE a.user_id = u.user_id)
+    FROM users u
+    ON DUPLICATE KEY UPDATE
+        total_transfers = VALUES(total_transfers),
+        total_balance = VALUES(total_balance),
+        bonus_balance = VALUES(bonus_balance),
+        last_activity_at = VALUES(last_activity_at)
+'''
+
+
+def rebuild(conn):
+    cursor = conn.cursor()
+    cursor.execute(REBUILD_SQL)
+    conn.commit()
+    cursor.close()
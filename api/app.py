@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, request, make_response
+from flask import Flask, jsonify, request, make_response, g, has_request_context, Response, stream_with_context
 from flask_cors import CORS
 import mysql.connector
 import bcrypt
@@ -12,48 +12,368 @@ import jwt
 import uuid
 from datetime import datetime, timedelta
 from decimal import Decimal
+import itertools
+from db_pool import ConnectionPool, ScopedConnection, PoolTimeoutError
+from caches import LRUTTLCache
+from transfer_engine import TransferEngine, TransferError, lock_accounts, move_funds
+from reference_data import ReferenceData
+from passwords import PasswordHasher, HashingPoolSaturated
+from activity_rollup import ActivityDelta, rebuild as rebuild_activity_rollup
+from bonus_outbox import BonusOutboxWorker, enqueue_accruals, pending_operations, settle_user, transfer_bonus
+from flight_catalog import FlightCatalog, FlightQuery
+from seat_reservations import HoldSweeper, claim_seat, consume_hold, release_hold
+from sync_outbox import SyncOutboxWorker
+from support_chat import (CHAT_RESOURCE, ChatNotifier, VersionedFetch, fetch_messages, parse_chat_cursor,
+                          format_chat_cursor, read_chat_version, stream_messages, wait_for_messages)
+from metrics import Metrics, RequestMetrics
+from json_provider import FastJSONProvider
+from dashboard import ACCOUNTS_SQL, PROFILE_SQL, SETTINGS_SQL, DashboardPlan, parse_fields
+from resource_versions import format_etag, read_version
+from account_numbers import (
+    AccountNumberAllocator, BUSINESS_ACCOUNT_PREFIX, CURRENT_ACCOUNT_PREFIX, normalize_account_number
+)
+from auth_tokens import (
+    LOCK_REFRESH_SQL, RevocationSet, RevocationSync, TokenIssuer, hash_refresh_token,
+    revoke_access_token, revoke_user, utcnow
+)
+from delta_sync import (
+    ChangeLog, SyncTokenExpired, bonus_balance, collect_changes, current_version, format_sync_token,
+    parse_sync_token, prune as prune_sync_changes
+)
+from support_queue import TicketCounterDelta, build_queue_query, claim_next, lock_ticket, read_counters, rebuild_counters
+import threading
+import time
+from werkzeug.serving import is_running_from_reloader
 
 # Конфигурация JWT
 JWT_SECRET = 'your_very_strong_secret_key_here'
 JWT_ALGORITHM = 'HS256'
-JWT_EXP_DELTA_SECONDS = 24 * 60 * 60  # 1 день
+# Токен доступа живёт недолго и несёт user_id, role_id, user_type;
+# продлевается через /api/token/refresh (см. auth_tokens.py)
+ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', 15 * 60))  # секунд
+REFRESH_TOKEN_TTL = int(os.environ.get('REFRESH_TOKEN_TTL', 30 * 24 * 60 * 60))  # секунд
+TOKEN_REVOCATION_SYNC_INTERVAL = float(os.environ.get('TOKEN_REVOCATION_SYNC_INTERVAL', 1))  # секунд
 FLASK_DEBUG = 1
 
+# Настройки подключения к БД и пула соединений
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'user': os.environ.get('DB_USER', 'flutter_user'),
+    'password': os.environ.get('DB_PASSWORD', '1234'),
+    'database': os.environ.get('DB_NAME', 'mbapp')
+}
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # секунд простоя
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+
+# Кэш данных авторизованного пользователя для token_required
+PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE', 10000))
+PRINCIPAL_CACHE_TTL = float(os.environ.get('PRINCIPAL_CACHE_TTL', 60))  # секунд
+
+# Размер страницы истории транзакций
+TRANSACTIONS_PAGE_DEFAULT = 100
+TRANSACTIONS_PAGE_MAX = 500
+
+# Сводка главного экрана: число последних транзакций по умолчанию
+DASHBOARD_TRANSACTIONS_DEFAULT = 20
+
+# Номера счетов резервируются в БД блоками такого размера (см. account_numbers.py)
+ACCOUNT_NUMBER_BLOCK_SIZE = int(os.environ.get('ACCOUNT_NUMBER_BLOCK_SIZE', 100))
+
+# Дельта-синхронизация: записей журнала за один ответ и срок хранения журнала
+SYNC_PAGE_DEFAULT = 500
+SYNC_PAGE_MAX = 2000
+SYNC_CHANGES_RETENTION_DAYS = int(os.environ.get('SYNC_CHANGES_RETENTION_DAYS', 30))
+
+# Кодирование Decimal в ответах: string (как раньше) или number
+JSON_DECIMAL_MODE = os.environ.get('JSON_DECIMAL_MODE', 'string')
+
+# Метрики: порог журнала медленных SQL-запросов и токен доступа к /metrics
+# (если не задан, /metrics открыт - закрывайте его на балансировщике)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Размер страницы очереди тикетов поддержки
+SUPPORT_QUEUE_PAGE_DEFAULT = 50
+SUPPORT_QUEUE_PAGE_MAX = 200
+
+# Максимальное число переводов в одном пакете
+BATCH_TRANSFER_MAX_ITEMS = int(os.environ.get('BATCH_TRANSFER_MAX_ITEMS', 1000))
+
+# Повторы денежной транзакции при deadlock / lock wait timeout
+TRANSFER_MAX_RETRIES = int(os.environ.get('TRANSFER_MAX_RETRIES', 5))
+
+# Время жизни кэша справочников (категории, типы счетов и транзакций)
+REFERENCE_DATA_TTL = float(os.environ.get('REFERENCE_DATA_TTL', 300))  # секунд
+
+# Фоновый перенос начислений бонусов из очереди bonus_accrual_outbox
+BONUS_WORKER_INTERVAL = float(os.environ.get('BONUS_WORKER_INTERVAL', 1))  # секунд
+BONUS_WORKER_BATCH_SIZE = int(os.environ.get('BONUS_WORKER_BATCH_SIZE', 500))
+
+# Фоновая запись изменений получателей переводов из очереди sync_change_outbox
+SYNC_OUTBOX_INTERVAL = float(os.environ.get('SYNC_OUTBOX_INTERVAL', 1))  # секунд
+SYNC_OUTBOX_BATCH_SIZE = int(os.environ.get('SYNC_OUTBOX_BATCH_SIZE', 500))
+
+# Запуск фоновых потоков (бонусы, журнал синхронизации, брони, отзыв
+# токенов) в процессе сервера; 0 - не запускать (тесты, отдельные процессы
+# flask bonus-worker и sync-outbox-worker)
+BACKGROUND_WORKERS = os.environ.get('BACKGROUND_WORKERS', '1') == '1'
+
+# Максимальное время жизни кэша каталога авиабилетов и интервал сверки с
+# общей версией каталога (брони из других процессов видны не позже него)
+FLIGHT_CATALOG_TTL = float(os.environ.get('FLIGHT_CATALOG_TTL', 60))  # секунд
+FLIGHT_CATALOG_VERSION_CHECK = float(os.environ.get('FLIGHT_CATALOG_VERSION_CHECK', 1))  # секунд
+
+# Временная бронь места на время оплаты и период снятия просроченных броней
+SEAT_HOLD_TTL = int(os.environ.get('SEAT_HOLD_TTL', 300))  # секунд
+SEAT_HOLD_SWEEP_INTERVAL = float(os.environ.get('SEAT_HOLD_SWEEP_INTERVAL', 5))  # секунд
+
+# Ожидание новых сообщений чата поддержки: long-poll и SSE
+CHAT_POLL_TIMEOUT = float(os.environ.get('CHAT_POLL_TIMEOUT', 25))  # секунд
+CHAT_STREAM_KEEPALIVE = float(os.environ.get('CHAT_STREAM_KEEPALIVE', 15))  # секунд
+CHAT_STREAM_MAX_DURATION = float(os.environ.get('CHAT_STREAM_MAX_DURATION', 300))  # секунд
+# Оповещения работают внутри процесса; сообщения из других процессов
+# ожидающий запрос находит, проверяя версию чата с этим интервалом
+CHAT_RECHECK_INTERVAL = float(os.environ.get('CHAT_RECHECK_INTERVAL', 5))  # секунд
+
+# Пул процессов для bcrypt: число процессов (0 - в потоке запроса) и длина очереди
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 4 * max(PASSWORD_HASH_WORKERS, 1)))
+# Схема для новых хешей; стоимость (раунды bcrypt / итерации PBKDF2) задаётся
+# явно, иначе берётся стандартная для схемы. Хеши дешевле неё пересчитываются
+# при входе, более дорогие остаются как есть.
+PASSWORD_SCHEME = os.environ.get('PASSWORD_SCHEME', 'bcrypt')
+PASSWORD_HASH_COST = int(os.environ.get('PASSWORD_HASH_COST', 0)) or None
+
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=['X-Next-Cursor', 'X-Bonus-Balance', 'X-Total-Count', 'ETag', 'X-Chat-Cursor'])
 app.config['SECRET_KEY'] = JWT_SECRET  # Секретный ключ для JWT
+# Decimal и даты кодируются провайдером, обработчикам не нужно обходить строки
+app.json = FastJSONProvider(app, decimal_mode=JSON_DECIMAL_MODE)
 
 def serialize_datetime(dt):
     if dt is None:
         return None
     return dt.isoformat()
 
-
-# Подключение к базе данных
+# Клиент запросил потоковую выдачу (NDJSON, по объекту на строку)
+def wants_stream():
+    if request.args.get('stream') == '1':
+        return True
+    return 'application/x-ndjson' in request.headers.get('Accept', '')
+
+# Потоковый ответ из небуферизованного курсора: строки читаются из MySQL
+# и отдаются клиенту по одной, не накапливаясь в памяти.
+# Соединение вернётся в пул после отправки последней строки.
+def stream_rows(cursor, prepare=None, headers=None, prefix=()):
+    def generate():
+        try:
+            for row in itertools.chain(prefix, cursor):
+                if prepare:
+                    prepare(row)
+                yield app.json.dumps(row) + '\n'
+        finally:
+            cursor.close()
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers=headers
+    )
+
+def prepare_transaction_row(row):
+    ref = reference_data.current()
+    row['type_name'] = ref.transaction_types.get(row.get('type_id'))
+    row['category_name'] = ref.categories.get(row.get('category_id'))
+
+# Название типа и ставка берутся из кэша справочников вместо JOIN account_types
+def prepare_account_row(row):
+    account_type = reference_data.current().account_types.get(row.get('type_id'), {})
+    row['type_name'] = account_type.get('type_name')
+    row['interest_rate'] = account_type.get('interest_rate')
+
+# ETag ресурса пользователя по версии из resource_versions (одна строка по PK).
+# Возвращает (etag, ответ 304 или None)
+def check_resource_etag(cursor, user_id, resource, extra=None):
+    etag = format_etag(resource, user_id, read_version(cursor, user_id, resource), extra)
+    if request.if_none_match.contains(etag):
+        return etag, with_etag(make_response('', 304), etag)
+    return etag, None
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+metrics = Metrics(
+    current=lambda: g.get('request_metrics') if has_request_context() else None,
+    slow_query_ms=SLOW_QUERY_MS
+)
+
+@app.before_request
+def start_request_metrics():
+    g.request_metrics = RequestMetrics()
+
+@app.after_request
+def remember_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+# Учитывается после отправки ответа, для потоковых - после последней строки
+@app.teardown_request
+def finish_request_metrics(exc):
+    request_metrics = g.pop('request_metrics', None)
+    if request_metrics is None:
+        return
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = 500 if exc is not None else g.get('response_status', 500)
+    metrics.observe_request(endpoint, request.method, status, request_metrics)
+
+db_pool = ConnectionPool(
+    DB_CONFIG,
+    size=DB_POOL_SIZE,
+    max_overflow=DB_POOL_MAX_OVERFLOW,
+    timeout=DB_POOL_TIMEOUT,
+    recycle=DB_POOL_RECYCLE,
+    pre_ping=DB_POOL_PRE_PING,
+    cursor_wrapper=metrics.cursor_wrapper
+)
+
+# Подключение к базе данных: внутри запроса декоратор и обработчик
+# получают одно и то же соединение из пула, conn.close() в обработчиках
+# ничего не делает, а соединение возвращается в пул в конце запроса
 def get_db_connection():
-    try:
-        conn = mysql.connector.connect(
-            host='localhost',
-            user='flutter_user',
-            password='1234',
-            database='mbapp'
-        )
-        print("Database connection successful")
-        return conn
-    except mysql.connector.Error as err:
-        print(f"Database connection error: {err}")
-        raise
+    if not has_request_context():
+        return db_pool.acquire()
+    conn = g.get('db_conn')
+    if conn is None:
+        started = time.perf_counter()
+        conn = g.db_conn = ScopedConnection(db_pool.acquire())
+        metrics.observe_acquire(time.perf_counter() - started)
+    return conn
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.release()
+
+# Досрочно возвращает соединение запроса в пул - перед долгим ожиданием,
+# чтобы ждущие клиенты не занимали соединения
+def release_request_connection():
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.release()
+
+@app.errorhandler(PoolTimeoutError)
+def handle_pool_timeout(err):
+    return jsonify({'message': 'Сервер перегружен, попробуйте позже'}), 503
+
+transfer_engine = TransferEngine(max_retries=TRANSFER_MAX_RETRIES)
+
+reference_data = ReferenceData(db_pool.acquire, ttl=REFERENCE_DATA_TTL)
+
+flight_catalog = FlightCatalog(
+    db_pool.acquire, app.json.dumps_bytes,
+    ttl=FLIGHT_CATALOG_TTL, version_check=FLIGHT_CATALOG_VERSION_CHECK
+)
+
+hold_sweeper = HoldSweeper(
+    db_pool.acquire,
+    interval=SEAT_HOLD_SWEEP_INTERVAL,
+    on_release=flight_catalog.invalidate
+)
+
+chat_notifier = ChatNotifier()
+
+bonus_worker = BonusOutboxWorker(
+    db_pool.acquire,
+    interval=BONUS_WORKER_INTERVAL,
+    batch_size=BONUS_WORKER_BATCH_SIZE
+)
+
+sync_outbox_worker = SyncOutboxWorker(
+    db_pool.acquire,
+    interval=SYNC_OUTBOX_INTERVAL,
+    batch_size=SYNC_OUTBOX_BATCH_SIZE
+)
+
+principal_cache = LRUTTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+account_numbers = AccountNumberAllocator(db_pool.acquire, block_size=ACCOUNT_NUMBER_BLOCK_SIZE)
+
+token_issuer = TokenIssuer(JWT_SECRET, JWT_ALGORITHM, access_ttl=ACCESS_TOKEN_TTL, refresh_ttl=REFRESH_TOKEN_TTL)
+revocations = RevocationSet()
+revocation_sync = RevocationSync(db_pool.acquire, revocations, interval=TOKEN_REVOCATION_SYNC_INTERVAL)
+
+# Фоновые потоки запускаются один раз на процесс, который обслуживает
+# запросы: при первом запросе (gunicorn, uwsgi, flask run - в каждом
+# рабочем процессе после fork) или из app_async перед началом работы.
+# Родитель перезагрузчика werkzeug запросов не получает и потоков не
+# запускает
+_workers_lock = threading.Lock()
+_workers_started = False
+
+def ensure_background_workers():
+    global _workers_started
+    if _workers_started or not BACKGROUND_WORKERS:
+        return
+    with _workers_lock:
+        if _workers_started:
+            return
+        bonus_worker.start()
+        sync_outbox_worker.start()
+        hold_sweeper.start()
+        revocation_sync.start()
+        _workers_started = True
+
+@app.before_request
+def start_background_workers():
+    ensure_background_workers()
+
+# Сбрасывать после любой записи в строку users, влияющей на права
+def invalidate_principal(user_id):
+    principal_cache.invalidate(user_id)
+
+password_hasher = PasswordHasher(
+    workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+    scheme=PASSWORD_SCHEME,
+    cost=PASSWORD_HASH_COST
+)
+
+@app.errorhandler(HashingPoolSaturated)
+def handle_hashing_saturated(err):
+    response = jsonify({'message': 'Сервер перегружен, попробуйте позже'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 def hash_password(password):
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+    return password_hasher.hash(password)
 
 def verify_password(stored_hash, provided_password):
+    return password_hasher.verify(stored_hash, provided_password)
+
+# После успешного входа пересчитывает хеш, если он сделан устаревшей схемой
+# или с меньшей стоимостью. Ошибка пересчёта не мешает входу.
+def upgrade_password_hash(conn, user_id, stored_hash, password):
+    if not password_hasher.needs_rehash(stored_hash):
+        return
     try:
-        return bcrypt.checkpw(provided_password.encode('utf-8'), stored_hash.encode('utf-8'))
-    except:
-        return False
+        new_hash = hash_password(password)
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE users SET password_hash = %s WHERE user_id = %s AND password_hash = %s',
+            (new_hash, user_id, stored_hash)
+        )
+        conn.commit()
+        cursor.close()
+    except HashingPoolSaturated:
+        pass
+    except mysql.connector.Error:
+        conn.rollback()
 
 # Декоратор для проверки JWT токена
 def token_required(f):
@@ -69,22 +389,39 @@ def token_required(f):
         if not token:
             return jsonify({'message': 'Токен отсутствует'}), 401
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user_id = data['user_id']
+            claims = token_issuer.decode(token)
+            current_user_id = claims['user_id']
         except jwt.ExpiredSignatureError:
             return jsonify({'message': 'Срок действия токена истёк'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'message': 'Недействительный токен'}), 401
-
-        # Загружаем данные пользователя из базы данных
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute('SELECT * FROM users WHERE user_id = %s', (current_user_id,))
-        current_user = cursor.fetchone()
-        conn.close()
-        if not current_user:
-            return jsonify({'message': 'Пользователь не найден'}), 404
-        return f(current_user, *args, **kwargs)  # Теперь это словарь
+        if revocations.is_revoked(claims):
+            return jsonify({'message': 'Токен отозван'}), 401
+        g.token_claims = claims
+
+        # Права берутся из токена; токены старого формата (только user_id)
+        # до истечения проверяются по кэшу или базе данных
+        if 'role_id' in claims and 'user_type' in claims:
+            current_user = {
+                'user_id': current_user_id,
+                'role_id': claims['role_id'],
+                'user_type': claims['user_type'],
+            }
+        else:
+            current_user = principal_cache.get(current_user_id)
+        if current_user is None:
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            cursor.execute(
+                'SELECT user_id, role_id, user_type FROM users WHERE user_id = %s',
+                (current_user_id,)
+            )
+            current_user = cursor.fetchone()
+            cursor.close()
+            if not current_user:
+                return jsonify({'message': 'Пользователь не найден'}), 404
+            principal_cache.set(current_user_id, current_user)
+        return f(dict(current_user), *args, **kwargs)  # Теперь это словарь
     return decorated
 
 # Регистрация пользователя (обновлено)
@@ -121,20 +458,25 @@ def register():
         )
 
         user_id = cursor.lastrowid
-        account_number = f'40817810{user_id:010d}'
-        
+        changes = ChangeLog()
+
         # Создаем основной счет (тип 1 - Текущий)
         cursor.execute(
             'INSERT INTO accounts (account_number, user_id, type_id, balance) VALUES (%s, %s, 1, 0)',
-            (account_number, user_id)
+            (account_numbers.allocate(CURRENT_ACCOUNT_PREFIX), user_id)
         )
+        changes.add(user_id, 'accounts', cursor.lastrowid)
         
         # Для бизнеса создаем дополнительный счет (тип 5 - Основной)
         if data['user_type'] == 'business':
             cursor.execute(
                 'INSERT INTO accounts (account_number, user_id, type_id, balance) VALUES (%s, %s, 5, 0)',
-                (f'40817820{user_id:010d}', user_id)
+                (account_numbers.allocate(BUSINESS_ACCOUNT_PREFIX), user_id)
             )
+            changes.add(user_id, 'accounts', cursor.lastrowid)
+
+        cursor.execute('INSERT INTO user_activity_rollup (user_id) VALUES (%s)', (user_id,))
+        changes.apply(cursor)
 
         conn.commit()
         return jsonify({'message': 'Регистрация успешна', 'user_id': user_id}), 201
@@ -162,15 +504,13 @@ def login():
         # Проверка пароля
         if not verify_password(user['password_hash'], auth['password']):
             return jsonify({'message': 'Неверный пароль'}), 401
-        # Генерация JWT токена
-        token = jwt.encode({
-            'user_id': user['user_id'],
-            'exp': datetime.utcnow() + timedelta(seconds=JWT_EXP_DELTA_SECONDS)
-        }, JWT_SECRET, algorithm=JWT_ALGORITHM)
-        print('Loaded user role_id:', user['role_id'])
+        upgrade_password_hash(conn, user['user_id'], user['password_hash'], auth['password'])
+        # Токен доступа и токен обновления
+        tokens = token_issuer.issue(cursor, user)
+        conn.commit()
 
         return jsonify({
-            'token': token,
+            **tokens,
             'user_id': user['user_id'],
             'first_name': user['first_name'],
             'last_name': user['last_name']
@@ -183,11 +523,70 @@ def login():
 def verify_token():
     token = request.headers.get('Authorization').split()[1]
     try:
-        jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        claims = token_issuer.decode(token)
+        if revocations.is_revoked(claims):
+            return jsonify({'valid': False, 'error': 'Token revoked'}), 401
         return jsonify({'valid': True}), 200
     except Exception as e:
         return jsonify({'valid': False, 'error': str(e)}), 401
 
+# Новая пара токенов по токену обновления. Использованный токен обновления
+# заменяется; повторное предъявление заменённого токена означает утечку -
+# отзываются все сессии пользователя
+@app.route('/api/token/refresh', methods=['POST'])
+def refresh_token():
+    data = request.json or {}
+    refresh = data.get('refresh_token')
+    if not refresh:
+        return jsonify({'message': 'Токен обновления отсутствует'}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(LOCK_REFRESH_SQL, (hash_refresh_token(refresh),))
+        row = cursor.fetchone()
+        if row is None or row['expires_at'] <= utcnow():
+            conn.rollback()
+            return jsonify({'message': 'Недействительный токен обновления'}), 401
+        if row['revoked_at'] is not None:
+            revoke_user(cursor, revocations, row['user_id'], ACCESS_TOKEN_TTL)
+            conn.commit()
+            return jsonify({'message': 'Недействительный токен обновления'}), 401
+        cursor.execute(
+            'UPDATE refresh_tokens SET revoked_at = %s WHERE token_hash = %s',
+            (utcnow(), row['token_hash'])
+        )
+        tokens = token_issuer.issue(cursor, row)
+        conn.commit()
+        return jsonify(tokens), 200
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+# Выход: отзыв текущего токена доступа и переданного токена обновления
+@app.route('/api/logout', methods=['POST'])
+@token_required
+def logout(current_user):
+    data = request.json or {}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        claims = g.token_claims
+        if claims.get('jti'):
+            revoke_access_token(cursor, revocations, claims)
+        if data.get('refresh_token'):
+            cursor.execute(
+                'UPDATE refresh_tokens SET revoked_at = %s '
+                'WHERE token_hash = %s AND user_id = %s AND revoked_at IS NULL',
+                (utcnow(), hash_refresh_token(data['refresh_token']), current_user['user_id'])
+            )
+        conn.commit()
+        return jsonify({'message': 'Выход выполнен'}), 200
+    finally:
+        cursor.close()
+
 # Получение информации о пользователе (обновлено)
 @app.route('/api/user/<int:user_id>', methods=['GET'])
 @token_required
@@ -198,6 +597,9 @@ def get_user(current_user, user_id):
     conn = get_db_connection()
     try:
         cursor = conn.cursor(dictionary=True)
+        etag, not_modified = check_resource_etag(cursor, user_id, 'profile')
+        if not_modified:
+            return not_modified
         cursor.execute('''
             SELECT u.*, r.role_name 
             FROM users u 
@@ -208,7 +610,7 @@ def get_user(current_user, user_id):
 
         if user:
             user.pop('password_hash', None)
-            return jsonify(user), 200
+            return with_etag(make_response(jsonify(user), 200), etag)
         return jsonify({'message': 'User not found!'}), 404
     finally:
         if conn and conn.is_connected():
@@ -256,7 +658,15 @@ def update_user(current_user, user_id):
         values.append(user_id)
         query = f'UPDATE users SET {", ".join(update_fields)} WHERE user_id = %s'
         cursor.execute(query, tuple(values))
+        if 'user_type = %s' in update_fields:
+            # user_type записан в токенах доступа: клиент получит 401 и
+            # обновит токен уже с новым значением
+            revoke_user(cursor, revocations, user_id, ACCESS_TOKEN_TTL, refresh=False)
+        changes = ChangeLog()
+        changes.touch(user_id, 'users')
+        changes.apply(cursor)
         conn.commit()
+        invalidate_principal(user_id)
 
         return jsonify({'message': 'User updated successfully'}), 200
     finally:
@@ -273,20 +683,115 @@ def get_user_accounts(current_user, user_id):
     conn = get_db_connection()
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('''
-            SELECT a.*, at.type_name, at.interest_rate
-            FROM accounts a
-            JOIN account_types at ON a.type_id = at.type_id
-            WHERE a.user_id = %s AND a.is_active = 1
-        ''', (user_id,))
+        # Названия типов и ставки берутся из справочников - их отпечаток тоже в ETag
+        etag, not_modified = check_resource_etag(cursor, user_id, 'accounts',
+                                                 reference_data.current().fingerprint)
+        if not_modified:
+            return not_modified
+        cursor.execute(
+            'SELECT * FROM accounts WHERE user_id = %s AND is_active = 1',
+            (user_id,)
+        )
         accounts = cursor.fetchall()
         for acc in accounts:
-            acc['opening_date'] = serialize_datetime(acc.get('opening_date'))
-        return jsonify(accounts), 200
+            prepare_account_row(acc)
+        return with_etag(make_response(jsonify(accounts), 200), etag)
     finally:
         conn.close()
 
 
+# Сводка для главного экрана: профиль, счета, последние транзакции, бонусы
+# и настройки одним запросом на одном соединении из пула
+# (?fields=profile,accounts,transactions.amount&transactions_limit=20)
+@app.route('/api/user/<int:user_id>/dashboard', methods=['GET'])
+@token_required
+def get_dashboard(current_user, user_id):
+    if current_user['user_id'] != user_id and current_user['role_id'] != 3:
+        return jsonify({'message': 'Unauthorized access!'}), 403
+
+    try:
+        plan = DashboardPlan(parse_fields(request.args.get('fields')),
+                             private=current_user['user_id'] == user_id)
+        limit = int(request.args.get('transactions_limit', DASHBOARD_TRANSACTIONS_DEFAULT))
+        limit = max(1, min(limit, TRANSACTIONS_PAGE_MAX))
+    except ValueError:
+        return jsonify({'message': 'Invalid query parameters'}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        profile = accounts = transactions = next_cursor = settings = None
+        # Токен читается до данных: изменения между запросами придут в /sync
+        sync_token = None
+        if current_user['user_id'] == user_id:
+            sync_token = format_sync_token(current_version(cursor, user_id))
+        if plan.needs_profile:
+            cursor.execute(PROFILE_SQL, (user_id,))
+            profile = cursor.fetchone()
+            if profile is None:
+                return jsonify({'message': 'User not found!'}), 404
+        if plan.needs_accounts:
+            cursor.execute(ACCOUNTS_SQL, (user_id,))
+            accounts = cursor.fetchall()
+            for acc in accounts:
+                prepare_account_row(acc)
+        if plan.needs_transactions and accounts:
+            # На одну строку больше, чтобы вернуть курсор продолжения для /transactions
+            query, params = transactions_query([acc['account_id'] for acc in accounts], {}, limit + 1)
+            cursor.execute(query, params)
+            transactions = cursor.fetchall()
+            if len(transactions) > limit:
+                transactions = transactions[:limit]
+                last = transactions[-1]
+                next_cursor = format_keyset_cursor(last['transaction_date'], last['transaction_id'])
+            for tr in transactions:
+                prepare_transaction_row(tr)
+        if plan.needs_settings:
+            cursor.execute(SETTINGS_SQL, (user_id,))
+            settings = cursor.fetchone()
+        return jsonify(plan.build(profile, accounts, transactions, next_cursor, settings, sync_token)), 200
+    finally:
+        cursor.close()
+
+
+# Изменения после последней синхронизации клиента (?since=<sync_token>&limit=).
+# Начальный токен отдаёт /dashboard; при has_more запрос повторяется с новым
+# токеном, при 410 клиент перечитывает данные целиком
+@app.route('/api/user/<int:user_id>/sync', methods=['GET'])
+@token_required
+def sync_user(current_user, user_id):
+    if current_user['user_id'] != user_id:
+        return jsonify({'message': 'Unauthorized access!'}), 403
+
+    try:
+        since = parse_sync_token(request.args.get('since'))
+        limit = max(1, min(int(request.args.get('limit', SYNC_PAGE_DEFAULT)), SYNC_PAGE_MAX))
+    except ValueError:
+        return jsonify({'message': 'Invalid query parameters'}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        try:
+            result = collect_changes(cursor, user_id, since, limit)
+        except SyncTokenExpired:
+            return jsonify({'message': 'Sync token expired, full reload required'}), 410
+        changes = result['changes']
+        for acc in changes.get('accounts', ()):
+            prepare_account_row(acc)
+        for tr in changes.get('transactions', ()):
+            prepare_transaction_row(tr)
+        return jsonify({
+            'token': format_sync_token(result['version']),
+            'has_more': result['has_more'],
+            'changes': changes,
+            'deleted': result['deleted'],
+            'bonus_balance': bonus_balance(cursor, user_id),
+        }), 200
+    finally:
+        cursor.close()
+
+
 # Создание нового счета (обновлено)
 @app.route('/api/user/<int:user_id>/accounts', methods=['POST'])
 @token_required
@@ -297,29 +802,26 @@ def create_account(current_user, user_id):
     data = request.json
     if 'type_id' not in data:
         return jsonify({'message': 'Account type is required'}), 400
+    if data['type_id'] not in reference_data.current().account_types:
+        return jsonify({'message': 'Unknown account type'}), 400
 
     conn = get_db_connection()
     try:
-        cursor = conn.cursor()
-        cursor.execute('SELECT MAX(account_id) AS max_id FROM accounts')
-        max_id = cursor.fetchone()[0] or 0
-        account_number = f'40817810{max_id + 1:010d}'
-
+        cursor = conn.cursor(dictionary=True)
         cursor.execute(
             'INSERT INTO accounts (account_number, user_id, type_id, balance) '
             'VALUES (%s, %s, %s, 0)',
-            (account_number, user_id, data['type_id'])
+            (account_numbers.allocate(CURRENT_ACCOUNT_PREFIX), user_id, data['type_id'])
         )
 
         account_id = cursor.lastrowid
-        cursor.execute('''
-            SELECT a.*, at.type_name
-            FROM accounts a
-            JOIN account_types at ON a.type_id = at.type_id
-            WHERE a.account_id = %s
-        ''', (account_id,))
+        cursor.execute('SELECT * FROM accounts WHERE account_id = %s', (account_id,))
         new_account = cursor.fetchone()
+        prepare_account_row(new_account)
 
+        changes = ChangeLog()
+        changes.add(user_id, 'accounts', account_id)
+        changes.apply(cursor)
         conn.commit()
         return jsonify(new_account), 201
     except Exception as e:
@@ -329,64 +831,66 @@ def create_account(current_user, user_id):
         if conn and conn.is_connected():
             conn.close()
 
-# Перевод между счетами (обновлено)
+# Перевод между счетами (обновлено). Счет получателя - to_account_id или
+# его номер to_account_number
 @app.route('/api/transfer', methods=['POST'])
 @token_required
 def transfer(current_user):
     data = request.json
     from_account_id = data['from_account_id']
-    to_account_id = data['to_account_id']
+    target_account_id = data.get('to_account_id')
+    to_account_number = data.get('to_account_number')
     amount = data['amount']
+    if amount <= 0:
+        return jsonify({'message': 'Invalid amount!'}), 400
+    if (target_account_id is None) == (to_account_number is None):
+        return jsonify({'message': 'Укажите to_account_id или to_account_number'}), 400
+    if to_account_number is not None:
+        to_account_number = normalize_account_number(to_account_number)
+        if not account_numbers.is_valid(to_account_number):
+            return jsonify({'message': 'Неверный номер счета'}), 400
+
+    def work(cursor):
+        to_account_id = target_account_id
+        if to_account_id is None:
+            cursor.execute(
+                'SELECT account_id FROM accounts WHERE account_number = %s AND is_active = 1',
+                (to_account_number,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                raise TransferError('Invalid account!')
+            to_account_id = row['account_id']
 
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor(dictionary=True)
+        # Блокируем оба счета в порядке account_id
+        accounts = lock_accounts(cursor, [from_account_id, to_account_id])
 
         # Проверяем принадлежность счета
-        cursor.execute('SELECT user_id FROM accounts WHERE account_id = %s', (from_account_id,))
-        account_owner = cursor.fetchone()
-        if not account_owner or account_owner['user_id'] != current_user['user_id']:
-            return jsonify({'message': 'Invalid account!'}), 400
+        from_account = accounts.get(from_account_id)
+        if not from_account or from_account['user_id'] != current_user['user_id']:
+            raise TransferError('Invalid account!')
+        if to_account_id not in accounts or from_account_id == to_account_id:
+            raise TransferError('Invalid account!')
 
         # Проверяем достаточность средств
-        cursor.execute('SELECT balance FROM accounts WHERE account_id = %s', (from_account_id,))
-        balance = cursor.fetchone()['balance']
-        if balance < amount:
-            return jsonify({'message': 'Insufficient funds!'}), 400
+        if from_account['balance'] < amount:
+            raise TransferError('Insufficient funds!')
 
         # Выполняем перевод
         transaction_uuid = str(uuid.uuid4())
-
-        # Списание со счета отправителя
-        cursor.execute(
-            'UPDATE accounts SET balance = balance - %s WHERE account_id = %s',
-            (amount, from_account_id)
-        )
-
-        # Зачисление на счет получателя
-        cursor.execute(
-            'UPDATE accounts SET balance = balance + %s WHERE account_id = %s',
-            (amount, to_account_id)
-        )
+        move_funds(cursor, from_account_id, to_account_id, amount)
 
         # Определяем тип получателя для категории
         cursor.execute('''
             SELECT u.user_type, u.business_category 
             FROM users u
-            JOIN accounts a ON a.user_id = u.user_id
-            WHERE a.account_id = %s
-        ''', (to_account_id,))
+            WHERE u.user_id = %s
+        ''', (accounts[to_account_id]['user_id'],))
         recipient_info = cursor.fetchone()
-        
+
         category_id = 7  # По умолчанию "Переводы"
         if recipient_info and recipient_info['user_type'] == 'business':
-            cursor.execute('''
-                SELECT category_id FROM transaction_categories
-                WHERE category_name = %s
-            ''', (recipient_info['business_category'],))
-            category = cursor.fetchone()
-            if category:
-                category_id = category['category_id']
+            category_id = reference_data.category_id(recipient_info['business_category'], category_id)
 
         # Записываем транзакцию (добавлены type_id и category_id)
         cursor.execute(
@@ -396,25 +900,29 @@ def transfer(current_user):
             VALUES (%s, %s, %s, %s, 1, %s)''',
             (transaction_uuid, from_account_id, to_account_id, amount, category_id)
         )
+        changes = ChangeLog()
+        changes.add_transfer(cursor.lastrowid, current_user['user_id'], from_account_id,
+                             accounts[to_account_id]['user_id'], to_account_id)
 
-        # Начисление бонусов за перевод (0.5% от суммы)
-        bonus_amount = amount * 0.005
+        # Начисление бонусов за перевод (0.5% от суммы) - через очередь
+        bonus_amount = transfer_bonus(amount)
         if bonus_amount > 0:
-            cursor.execute(
-                'UPDATE users SET bonus_balance = bonus_balance + %s WHERE user_id = %s',
-                (bonus_amount, current_user['user_id'])
-            )
-            cursor.execute(
-                '''INSERT INTO bonus_operations 
-                (user_id, amount, operation_type, description) 
-                VALUES (%s, %s, 'accrual', 'Бонус за перевод')''',
-                (current_user['user_id'], bonus_amount)
-            )
+            enqueue_accruals(cursor, [(current_user['user_id'], bonus_amount, 'Бонус за перевод')])
+            changes.touch(current_user['user_id'], 'bonus_operations')
 
-        conn.commit()
+        activity = ActivityDelta()
+        activity.add(current_user['user_id'], transfers=1, balance=-amount, active=True)
+        activity.add(accounts[to_account_id]['user_id'], balance=amount)
+        activity.apply(cursor)
+        changes.apply(cursor)
+
+    conn = get_db_connection()
+    try:
+        transfer_engine.run(conn, work)
         return jsonify({'message': 'Transfer successful'}), 200
+    except TransferError as err:
+        return jsonify({'message': err.message, **err.payload}), err.status
     except mysql.connector.Error as err:
-        conn.rollback()
         return jsonify({'error': str(err)}), 400
     finally:
         if conn and conn.is_connected():
@@ -431,26 +939,18 @@ def transfer_by_phone(current_user):
 
     if not from_account_id or not recipient_phone or not amount:
         return jsonify({'message': 'Не все обязательные поля заполнены'}), 400
+    if amount <= 0:
+        return jsonify({'message': 'Неверная сумма'}), 400
 
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor(dictionary=True)
-
-        # Проверяем принадлежность счета отправителя
-        cursor.execute('SELECT user_id, balance FROM accounts WHERE account_id = %s', (from_account_id,))
-        from_account = cursor.fetchone()
-        if not from_account or from_account['user_id'] != current_user['user_id']:
-            return jsonify({'message': 'Неверный счет отправителя'}), 400
-
-        # Проверяем достаточность средств
-        if from_account['balance'] < amount:
-            return jsonify({'message': 'Недостаточно средств'}), 400
-
+    def work(cursor):
         # Находим получателя
-        cursor.execute('SELECT user_id, user_type FROM users WHERE phone_number = %s', (recipient_phone,))
+        cursor.execute(
+            'SELECT user_id, user_type, business_category FROM users WHERE phone_number = %s',
+            (recipient_phone,)
+        )
         recipient = cursor.fetchone()
         if not recipient:
-            return jsonify({'message': 'Получатель не найден'}), 404
+            raise TransferError('Получатель не найден', 404)
 
         # Находим основной активный счет получателя
         cursor.execute('''
@@ -461,9 +961,21 @@ def transfer_by_phone(current_user):
         ''', (recipient['user_id'],))
         to_account = cursor.fetchone()
         if not to_account:
-            return jsonify({'message': 'У получателя нет активных счетов'}), 400
+            raise TransferError('У получателя нет активных счетов')
 
         to_account_id = to_account['account_id']
+        if to_account_id == from_account_id:
+            raise TransferError('Неверный счет отправителя')
+
+        # Блокируем оба счета в порядке account_id и проверяем отправителя
+        accounts = lock_accounts(cursor, [from_account_id, to_account_id])
+        from_account = accounts.get(from_account_id)
+        if not from_account or from_account['user_id'] != current_user['user_id']:
+            raise TransferError('Неверный счет отправителя')
+
+        # Проверяем достаточность средств
+        if from_account['balance'] < amount:
+            raise TransferError('Недостаточно средств')
 
         # Определяем тип операции и категорию
         transaction_type = 1  # P2P перевод
@@ -471,20 +983,12 @@ def transfer_by_phone(current_user):
 
         if recipient['user_type'] == 'business':
             transaction_type = 2  # P2B платеж
-            cursor.execute('''
-                SELECT category_id FROM transaction_categories
-                WHERE category_name = (
-                    SELECT business_category FROM users WHERE user_id = %s
-                )
-            ''', (recipient['user_id'],))
-            category = cursor.fetchone()
-            category_id = category['category_id'] if category else 10  # Другое
+            category_id = reference_data.category_id(recipient['business_category'], 10)  # Другое
 
         transaction_uuid = str(uuid.uuid4())
 
         # Выполняем перевод
-        cursor.execute('UPDATE accounts SET balance = balance - %s WHERE account_id = %s', (amount, from_account_id))
-        cursor.execute('UPDATE accounts SET balance = balance + %s WHERE account_id = %s', (amount, to_account_id))
+        move_funds(cursor, from_account_id, to_account_id, amount)
 
         # Записываем транзакцию
         cursor.execute(
@@ -492,59 +996,377 @@ def transfer_by_phone(current_user):
             'VALUES (%s, %s, %s, %s, %s, %s, %s)',
             (transaction_uuid, from_account_id, to_account_id, amount, transaction_type, recipient_phone, category_id)
         )
+        changes = ChangeLog()
+        changes.add_transfer(cursor.lastrowid, current_user['user_id'], from_account_id,
+                             recipient['user_id'], to_account_id)
 
         # Начисление бонусов (50% от комиссии 1%)
-        commission = amount * 0.01
-        bonus_amount = commission * 0.5
+        bonus_amount = transfer_bonus(amount)
         if bonus_amount > 0:
-            cursor.execute(
-                'UPDATE users SET bonus_balance = bonus_balance + %s WHERE user_id = %s',
-                (bonus_amount, current_user['user_id'])
-            )
-            cursor.execute(
-                'INSERT INTO bonus_operations (user_id, amount, operation_type, description) VALUES (%s, %s, "accrual", %s)',
+            enqueue_accruals(cursor, [
                 (current_user['user_id'], bonus_amount, f'Бонус за перевод {recipient_phone}')
-            )
+            ])
+            changes.touch(current_user['user_id'], 'bonus_operations')
 
-        conn.commit()
-        return jsonify({'message': 'Перевод успешно выполнен'}), 200
+        activity = ActivityDelta()
+        activity.add(current_user['user_id'], transfers=1, balance=-amount, active=True)
+        activity.add(recipient['user_id'], balance=amount)
+        activity.apply(cursor)
+        changes.apply(cursor)
 
+    conn = get_db_connection()
+    try:
+        transfer_engine.run(conn, work)
+        return jsonify({'message': 'Перевод успешно выполнен'}), 200
+    except TransferError as err:
+        return jsonify({'message': err.message, **err.payload}), err.status
     except mysql.connector.Error as err:
-        conn.rollback()
         return jsonify({'error': str(err)}), 400
     finally:
         if conn.is_connected():
             conn.close()
 
 
-# Получение истории транзакций (обновлено)
+# Пакетный перевод для бизнес-клиентов (зарплаты, оплата поставщикам).
+# Все переводы списываются с одного счета и проводятся одной транзакцией:
+# либо проходят все, либо ни один.
+@app.route('/api/transfers/batch', methods=['POST'])
+@token_required
+def batch_transfer(current_user):
+    if current_user['user_type'] != 'business':
+        return jsonify({'message': 'Пакетные переводы доступны только бизнес-клиентам'}), 403
+
+    data = request.json or {}
+    from_account_id = data.get('from_account_id')
+    items = data.get('transfers')
+    if not from_account_id or not isinstance(items, list) or not items:
+        return jsonify({'message': 'Не все обязательные поля заполнены'}), 400
+    if len(items) > BATCH_TRANSFER_MAX_ITEMS:
+        return jsonify({'message': f'Не более {BATCH_TRANSFER_MAX_ITEMS} переводов в пакете'}), 400
+
+    # Проверка формата каждого перевода
+    checked = [{'index': i, 'status': 'ok'} for i in range(len(items))]
+    amounts = []
+    numbers = []
+    for i, item in enumerate(items):
+        amount = None
+        number = None
+        if isinstance(item, dict):
+            try:
+                amount = Decimal(str(item.get('amount')))
+            except (ArithmeticError, ValueError):
+                pass
+            number = normalize_account_number(item.get('to_account_number'))
+        amounts.append(amount)
+        numbers.append(number)
+        if amount is None or not amount.is_finite() or amount <= 0:
+            checked[i] = {'index': i, 'status': 'error', 'message': 'Неверная сумма'}
+        elif sum(key in item for key in ('to_account_id', 'recipient_phone', 'to_account_number')) != 1:
+            checked[i] = {'index': i, 'status': 'error',
+                          'message': 'Укажите to_account_id, recipient_phone или to_account_number'}
+        elif 'to_account_number' in item and not account_numbers.is_valid(number):
+            checked[i] = {'index': i, 'status': 'error', 'message': 'Неверный номер счета'}
+        elif item.get('to_account_id') == from_account_id:
+            checked[i] = {'index': i, 'status': 'error', 'message': 'Нельзя перевести на счет списания'}
+
+    def work(cursor):
+        results = [dict(r) for r in checked]
+
+        # Получатели по номерам телефонов - одним запросом (основной активный счет)
+        phones = {item['recipient_phone'] for item in items
+                  if isinstance(item, dict) and item.get('recipient_phone')}
+        by_phone = {}
+        if phones:
+            placeholders = ', '.join(['%s'] * len(phones))
+            cursor.execute(f'''
+                SELECT u.phone_number, u.user_type, u.business_category, a.account_id
+                FROM users u
+                JOIN accounts a ON a.user_id = u.user_id AND a.type_id = 1 AND a.is_active = 1
+                WHERE u.phone_number IN ({placeholders})
+                ORDER BY a.opening_date ASC
+            ''', tuple(phones))
+            for row in cursor.fetchall():
+                by_phone.setdefault(row['phone_number'], row)
+
+        # Получатели по номерам счетов - одним запросом
+        account_ids = {item['to_account_id'] for item in items
+                       if isinstance(item, dict) and item.get('to_account_id')}
+        by_account = {}
+        if account_ids:
+            placeholders = ', '.join(['%s'] * len(account_ids))
+            cursor.execute(f'''
+                SELECT a.account_id, u.user_type, u.business_category
+                FROM accounts a
+                JOIN users u ON a.user_id = u.user_id
+                WHERE a.account_id IN ({placeholders}) AND a.is_active = 1
+            ''', tuple(account_ids))
+            by_account = {row['account_id']: row for row in cursor.fetchall()}
+
+        # Получатели по to_account_number - одним запросом
+        valid_numbers = {number for number, result in zip(numbers, results)
+                         if number and result['status'] == 'ok'}
+        by_number = {}
+        if valid_numbers:
+            placeholders = ', '.join(['%s'] * len(valid_numbers))
+            cursor.execute(f'''
+                SELECT a.account_number, a.account_id, u.user_type, u.business_category
+                FROM accounts a
+                JOIN users u ON a.user_id = u.user_id
+                WHERE a.account_number IN ({placeholders}) AND a.is_active = 1
+            ''', tuple(valid_numbers))
+            by_number = {row['account_number']: row for row in cursor.fetchall()}
+
+        recipients = []
+        for i, item in enumerate(items):
+            recipient = None
+            if results[i]['status'] == 'ok':
+                if 'recipient_phone' in item:
+                    recipient = by_phone.get(item['recipient_phone'])
+                elif 'to_account_number' in item:
+                    recipient = by_number.get(numbers[i])
+                else:
+                    recipient = by_account.get(item['to_account_id'])
+                if recipient is None:
+                    results[i] = {'index': i, 'status': 'error', 'message': 'Получатель не найден'}
+                elif recipient['account_id'] == from_account_id:
+                    results[i] = {'index': i, 'status': 'error', 'message': 'Нельзя перевести на счет списания'}
+            recipients.append(recipient)
+
+        if any(r['status'] == 'error' for r in results):
+            raise TransferError('Пакет отклонён', 400, {'results': results})
+
+        # Блокируем счет списания и счета получателей в порядке account_id
+        credits = {}
+        for amount, recipient in zip(amounts, recipients):
+            to_account_id = recipient['account_id']
+            credits[to_account_id] = credits.get(to_account_id, Decimal('0')) + amount
+        accounts = lock_accounts(cursor, [from_account_id, *credits])
+
+        from_account = accounts.get(from_account_id)
+        if (not from_account or from_account['user_id'] != current_user['user_id']
+                or not from_account['is_active']):
+            raise TransferError('Неверный счет отправителя')
+
+        total = sum(amounts)
+        if from_account['balance'] < total:
+            raise TransferError('Недостаточно средств', 400, {'total_amount': str(total)})
+
+        categories = reference_data.current().category_ids
+        transaction_rows = []
+        bonus_rows = []
+        for i, (item, amount, recipient) in enumerate(zip(items, amounts, recipients)):
+            transaction_type = 1  # P2P перевод
+            category_id = 7       # Переводы
+            if recipient['user_type'] == 'business':
+                transaction_type = 2  # P2B платеж
+                category_id = categories.get(recipient['business_category'], 10)  # Другое
+
+            transaction_uuid = str(uuid.uuid4())
+            transaction_rows.append((transaction_uuid, from_account_id, recipient['account_id'], amount,
+                                     transaction_type, item.get('recipient_phone'), category_id))
+            results[i]['transaction_uuid'] = transaction_uuid
+
+            # Бонус 0.5% от суммы, как и при одиночном переводе
+            bonus_amount = transfer_bonus(amount)
+            if bonus_amount > 0:
+                bonus_rows.append((current_user['user_id'], bonus_amount, 'Бонус за пакетный перевод'))
+
+        # Списание одной суммой
+        move_funds(cursor, from_account_id, None, total)
+
+        # Зачисления всем получателям одним UPDATE
+        credit_ids = sorted(credits)
+        cases = ' '.join(['WHEN %s THEN %s'] * len(credit_ids))
+        params = []
+        for account_id in credit_ids:
+            params.extend([account_id, credits[account_id]])
+        params.extend(credit_ids)
+        cursor.execute(
+            f'UPDATE accounts SET balance = balance + CASE account_id {cases} END '
+            f'WHERE account_id IN ({", ".join(["%s"] * len(credit_ids))})',
+            tuple(params)
+        )
+
+        cursor.executemany(
+            'INSERT INTO transactions (transaction_uuid, from_account_id, to_account_id, amount, '
+            'type_id, recipient_phone, category_id) VALUES (%s, %s, %s, %s, %s, %s, %s)',
+            transaction_rows
+        )
+
+        # id вставленных транзакций для журнала синхронизации
+        uuids = [row[0] for row in transaction_rows]
+        cursor.execute(
+            f'SELECT transaction_id, to_account_id FROM transactions '
+            f'WHERE from_account_id = %s AND transaction_uuid IN ({", ".join(["%s"] * len(uuids))})',
+            (from_account_id, *uuids)
+        )
+        changes = ChangeLog()
+        for row in cursor.fetchall():
+            changes.add_transfer(row['transaction_id'], current_user['user_id'], from_account_id,
+                                 accounts[row['to_account_id']]['user_id'], row['to_account_id'])
+
+        enqueue_accruals(cursor, bonus_rows)
+        if bonus_rows:
+            changes.touch(current_user['user_id'], 'bonus_operations')
+
+        activity = ActivityDelta()
+        activity.add(current_user['user_id'], transfers=len(items), balance=-total, active=True)
+        for account_id, credit in credits.items():
+            activity.add(accounts[account_id]['user_id'], balance=credit)
+        activity.apply(cursor)
+        changes.apply(cursor)
+        return total, results
+
+    conn = get_db_connection()
+    try:
+        total, results = transfer_engine.run(conn, work)
+        return jsonify({
+            'message': 'Пакет переводов выполнен',
+            'count': len(items),
+            'total_amount': str(total),
+            'results': results
+        }), 200
+    except TransferError as err:
+        return jsonify({'message': err.message, **err.payload}), err.status
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 400
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+# Курсор постраничной выдачи: "<transaction_date>,<transaction_id>"
+def parse_keyset_cursor(value):
+    date_part, id_part = value.rsplit(',', 1)
+    return datetime.fromisoformat(date_part), int(id_part)
+
+def format_keyset_cursor(dt, row_id):
+    return f'{serialize_datetime(dt)},{row_id}'
+
+# Разбор фильтров истории транзакций из query string
+def parse_transaction_filters(args):
+    filters = {}
+    if args.get('date_from'):
+        filters['date_from'] = datetime.fromisoformat(args['date_from'])
+    if args.get('date_to'):
+        filters['date_to'] = datetime.fromisoformat(args['date_to'])
+    if args.get('category_id'):
+        filters['category_id'] = int(args['category_id'])
+    if args.get('type_id'):
+        filters['type_id'] = int(args['type_id'])
+    if args.get('after'):
+        filters['after'] = parse_keyset_cursor(args['after'])
+    return filters
+
+# Запрос истории транзакций пользователя.
+# Для каждого счета и каждого направления перевода отдельная выборка идёт
+# по индексу (account_id, transaction_date, transaction_id) и останавливается
+# через limit строк, поэтому стоимость не зависит от длины истории.
+def build_transactions_query(cursor, user_id, filters, limit=None):
+    cursor.execute('SELECT account_id FROM accounts WHERE user_id = %s', (user_id,))
+    account_ids = [row['account_id'] for row in cursor.fetchall()]
+    if not account_ids:
+        return None, None
+    return transactions_query(account_ids, filters, limit)
+
+def transactions_query(account_ids, filters, limit=None):
+    conditions = []
+    condition_params = []
+    if 'date_from' in filters:
+        conditions.append('t.transaction_date >= %s')
+        condition_params.append(filters['date_from'])
+    if 'date_to' in filters:
+        conditions.append('t.transaction_date < %s')
+        condition_params.append(filters['date_to'])
+    if 'category_id' in filters:
+        conditions.append('t.category_id = %s')
+        condition_params.append(filters['category_id'])
+    if 'type_id' in filters:
+        conditions.append('t.type_id = %s')
+        condition_params.append(filters['type_id'])
+    if 'after' in filters:
+        after_date, after_id = filters['after']
+        conditions.append(
+            '(t.transaction_date < %s OR (t.transaction_date = %s AND t.transaction_id < %s))'
+        )
+        condition_params.extend([after_date, after_date, after_id])
+    extra_sql = ''.join(f' AND {c}' for c in conditions)
+    limit_sql = ' LIMIT %s' if limit is not None else ''
+
+    branches = []
+    params = []
+    for column in ('from_account_id', 'to_account_id'):
+        for account_id in account_ids:
+            branches.append(
+                f'(SELECT t.* FROM transactions t WHERE t.{column} = %s{extra_sql} '
+                f'ORDER BY t.transaction_date DESC, t.transaction_id DESC{limit_sql})'
+            )
+            params.append(account_id)
+            params.extend(condition_params)
+            if limit is not None:
+                params.append(limit)
+
+    query = f'''
+        SELECT t.*,
+               a_from.account_number AS from_account_number,
+               a_to.account_number AS to_account_number
+        FROM ({' UNION '.join(branches)}) t
+        LEFT JOIN accounts a_from ON t.from_account_id = a_from.account_id
+        LEFT JOIN accounts a_to ON t.to_account_id = a_to.account_id
+        ORDER BY t.transaction_date DESC, t.transaction_id DESC{limit_sql}
+    '''
+    if limit is not None:
+        params.append(limit)
+    return query, params
+
+# Получение истории транзакций (постранично: ?limit=&after=<дата>,<id>)
 @app.route('/api/user/<int:user_id>/transactions', methods=['GET'])
 @token_required
 def get_transactions(current_user, user_id):
     if current_user['user_id'] != user_id and current_user['role_id'] != 3:
         return jsonify({'message': 'Unauthorized access!'}), 403
 
+    stream = wants_stream()
+    try:
+        filters = parse_transaction_filters(request.args)
+        limit = request.args.get('limit')
+        if limit is not None:
+            limit = max(1, min(int(limit), TRANSACTIONS_PAGE_MAX))
+        elif not stream:
+            limit = TRANSACTIONS_PAGE_DEFAULT
+    except ValueError:
+        return jsonify({'message': 'Invalid query parameters'}), 400
+
     conn = get_db_connection()
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('''
-            SELECT t.*, tt.type_name, c.category_name,
-                   a_from.account_number AS from_account_number,
-                   a_to.account_number AS to_account_number
-            FROM transactions t
-            JOIN transaction_types tt ON t.type_id = tt.type_id
-            LEFT JOIN transaction_categories c ON t.category_id = c.category_id
-            LEFT JOIN accounts a_from ON t.from_account_id = a_from.account_id
-            LEFT JOIN accounts a_to ON t.to_account_id = a_to.account_id
-            WHERE t.from_account_id IN (SELECT account_id FROM accounts WHERE user_id = %s)
-               OR t.to_account_id IN (SELECT account_id FROM accounts WHERE user_id = %s)
-            ORDER BY t.transaction_date DESC
-        ''', (user_id, user_id))
-
+        if stream:
+            # В потоковом режиме без limit отдаётся вся история
+            query, params = build_transactions_query(cursor, user_id, filters, limit)
+            if query is None:
+                return Response('', mimetype='application/x-ndjson')
+            cursor.execute(query, params)
+            return stream_rows(cursor, prepare_transaction_row)
+
+        # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+        query, params = build_transactions_query(cursor, user_id, filters, limit + 1)
+        if query is None:
+            return jsonify([]), 200
+        cursor.execute(query, params)
         transactions = cursor.fetchall()
+
+        next_cursor = None
+        if len(transactions) > limit:
+            transactions = transactions[:limit]
+            last = transactions[-1]
+            next_cursor = format_keyset_cursor(last['transaction_date'], last['transaction_id'])
         for tr in transactions:
-            tr['transaction_date'] = serialize_datetime(tr.get('transaction_date'))
-        return jsonify(transactions), 200
+            prepare_transaction_row(tr)
+
+        response = make_response(jsonify(transactions), 200)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
     finally:
         conn.close()
 
@@ -565,6 +1387,9 @@ def close_account(current_user, account_id):
             return jsonify({'message': 'Счет уже закрыт'}), 400
 
         cursor.execute('UPDATE accounts SET is_active = 0 WHERE account_id = %s', (account_id,))
+        changes = ChangeLog()
+        changes.add(current_user['user_id'], 'accounts', account_id)
+        changes.apply(cursor)
         conn.commit()
         return jsonify({'message': 'Счет успешно закрыт'}), 200
     except Exception as e:
@@ -599,8 +1424,15 @@ def change_password(current_user, user_id):
 
         new_hashed = hash_password(new_password)
         cursor.execute('UPDATE users SET password_hash = %s WHERE user_id = %s', (new_hashed, user_id))
+        # Все сессии, включая текущую, отзываются; этому устройству сразу
+        # выдаётся новая пара токенов
+        revoke_user(cursor, revocations, user_id, ACCESS_TOKEN_TTL)
+        tokens = token_issuer.issue(cursor, current_user)
         conn.commit()
-        return jsonify({'message': 'Пароль успешно изменён'}), 200
+        invalidate_principal(user_id)
+        return jsonify({'message': 'Пароль успешно изменён', **tokens}), 200
+    except HashingPoolSaturated:
+        raise
     except Exception as e:
         conn.rollback()
         return jsonify({'message': str(e)}), 500
@@ -617,17 +1449,19 @@ def get_user_activity(current_user):
     conn = get_db_connection()
     try:
         cursor = conn.cursor(dictionary=True)
+        # Данные берутся из сводки user_activity_rollup (см. activity_rollup.py)
         cursor.execute('''
             SELECT u.user_id, u.first_name, u.last_name,
-                   COUNT(t.transaction_id) AS total_transfers,
-                   COALESCE(SUM(a.balance), 0) AS total_balance,
-                   u.bonus_balance
+                   COALESCE(r.total_transfers, 0) AS total_transfers,
+                   COALESCE(r.total_balance, 0) AS total_balance,
+                   COALESCE(r.bonus_balance, 0) AS bonus_balance,
+                   r.last_activity_at
             FROM users u
-            LEFT JOIN accounts a ON u.user_id = a.user_id
-            LEFT JOIN transactions t ON a.account_id = t.from_account_id
-            GROUP BY u.user_id
+            LEFT JOIN user_activity_rollup r ON r.user_id = u.user_id
             ORDER BY u.user_id
         ''')
+        if wants_stream():
+            return stream_rows(cursor)
         result = cursor.fetchall()
         return jsonify(result), 200
     finally:
@@ -641,23 +1475,36 @@ def get_bonuses(current_user, user_id):
     if current_user['user_id'] != user_id:
         return jsonify({'message': 'Unauthorized access!'}), 403
 
+    stream = wants_stream()
     conn = get_db_connection()
     try:
         cursor = conn.cursor(dictionary=True)
+        etag = None
+        if not stream:
+            etag, not_modified = check_resource_etag(cursor, user_id, 'bonuses')
+            if not_modified:
+                return not_modified
         cursor.execute('SELECT bonus_balance FROM users WHERE user_id = %s', (user_id,))
         balance = cursor.fetchone()['bonus_balance']
 
+        # Начисления, ещё не перенесённые из очереди, тоже входят в баланс
+        pending = pending_operations(cursor, user_id)
+        balance += sum(op['amount'] for op in pending)
+
         cursor.execute('''
             SELECT * FROM bonus_operations
             WHERE user_id = %s
             ORDER BY operation_date DESC
         ''', (user_id,))
-        operations = cursor.fetchall()
+        if stream:
+            # Баланс передаётся заголовком, в теле - только операции
+            return stream_rows(cursor, headers={'X-Bonus-Balance': str(balance)}, prefix=pending)
+        operations = pending + cursor.fetchall()
 
-        return jsonify({
+        return with_etag(make_response(jsonify({
             'balance': balance,
             'operations': operations
-        }), 200
+        }), 200), etag)
     finally:
         if conn and conn.is_connected():
             conn.close()
@@ -670,54 +1517,58 @@ def book_flight(current_user):
     ticket_id = data['ticket_id']
     account_id = data['account_id']
     use_bonuses = data.get('use_bonuses', False)
+    user_id = current_user['user_id']
 
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute('SELECT * FROM air_tickets WHERE ticket_id = %s', (ticket_id,))
+    # Оплата: проходит только у владельца брони
+    def work(cursor):
+        if not consume_hold(cursor, ticket_id, user_id):
+            raise TransferError('Seat hold expired!', 409)
+        cursor.execute('SELECT price FROM air_tickets WHERE ticket_id = %s', (ticket_id,))
         ticket = cursor.fetchone()
-        if not ticket or not ticket['is_available']:
-            return jsonify({'message': 'Ticket not available!'}), 400
-        
-        cursor.execute('SELECT balance FROM accounts WHERE account_id = %s', (account_id,))
-        account = cursor.fetchone()
-        if not account:
-            return jsonify({'message': 'Account not found!'}), 404
-            
-        cursor.execute('SELECT bonus_balance FROM users WHERE user_id = %s', (current_user['user_id'],))
+
+        account = lock_accounts(cursor, [account_id]).get(account_id)
+        if not account or account['user_id'] != user_id:
+            raise TransferError('Account not found!', 404)
+
+        # Сначала переносим ожидающие начисления, чтобы они были доступны к списанию
+        changes = ChangeLog()
+        if use_bonuses:
+            settle_user(cursor, user_id, changes)
+        cursor.execute(
+            'SELECT bonus_balance FROM users WHERE user_id = %s FOR UPDATE',
+            (user_id,)
+        )
         bonus_balance = cursor.fetchone()['bonus_balance']
-        
+
         cash_amount = ticket['price']
         bonus_amount = 0
-        
+
         if use_bonuses:
             max_bonus = min(ticket['price'] * Decimal('0.5'), bonus_balance)
             bonus_amount = min(max_bonus, bonus_balance)
             cash_amount -= bonus_amount
-        
+
         if account['balance'] < cash_amount:
-            return jsonify({'message': 'Insufficient funds!'}), 400
-        
+            raise TransferError('Insufficient funds!')
+
         transaction_uuid = str(uuid.uuid4())
-        
-        cursor.execute(
-            'UPDATE accounts SET balance = balance - %s WHERE account_id = %s',
-            (cash_amount, account_id)
-        )
-        
+
+        move_funds(cursor, account_id, None, cash_amount)
+
         if bonus_amount > 0:
             cursor.execute(
                 'UPDATE users SET bonus_balance = bonus_balance - %s WHERE user_id = %s',
-                (bonus_amount, current_user['user_id'])
+                (bonus_amount, user_id)
             )
             cursor.execute(
                 '''INSERT INTO bonus_operations 
                 (user_id, amount, operation_type, description) 
                 VALUES (%s, %s, 'withdrawal', 'Оплата авиабилета')''',
-                (current_user['user_id'], bonus_amount)
+                (user_id, bonus_amount)
             )
-        
+            changes.touch(user_id, 'users')
+            changes.add(user_id, 'bonus_operations', cursor.lastrowid)
+
         # Исправленный INSERT: количество полей = количеству значений
         cursor.execute(
             '''INSERT INTO transactions 
@@ -725,41 +1576,102 @@ def book_flight(current_user):
             VALUES (%s, %s, %s, %s, %s)''',
             (transaction_uuid, account_id, cash_amount, 2, 9)
         )
-        
-        cursor.execute(
-            'UPDATE air_tickets SET is_available = 0 WHERE ticket_id = %s',
-            (ticket_id,)
-        )
-        
-        conn.commit()
+        changes.add_transfer(cursor.lastrowid, user_id, account_id, None, None)
+
+        activity = ActivityDelta()
+        activity.add(user_id, transfers=1, balance=-cash_amount, bonus=-bonus_amount, active=True)
+        activity.apply(cursor)
+        changes.apply(cursor)
+
+    conn = get_db_connection()
+    try:
+        # Сначала захват места отдельной короткой транзакцией: проигравшие
+        # получают отказ, не дойдя до блокировок счёта и бонусов
+        hold = transfer_engine.run(conn, lambda cursor: claim_seat(cursor, ticket_id, user_id, SEAT_HOLD_TTL))
+        if hold['created']:
+            flight_catalog.invalidate()
+        try:
+            transfer_engine.run(conn, work)
+        except TransferError:
+            # Бронь, взятая этим же запросом, не должна держать место после отказа;
+            # бронь через /hold остаётся до истечения, чтобы можно было повторить оплату
+            if hold['created']:
+                transfer_engine.run(conn, lambda cursor: release_hold(cursor, ticket_id, user_id))
+                flight_catalog.invalidate()
+            raise
         return jsonify({'message': 'Ticket purchased successfully'}), 200
-        
+    except TransferError as err:
+        return jsonify({'message': err.message, **err.payload}), err.status
     except mysql.connector.Error as err:
-        conn.rollback()
         return jsonify({'error': str(err)}), 400
     finally:
         if conn and conn.is_connected():
             conn.close()
 
+# Временная бронь места на SEAT_HOLD_TTL секунд (повторный вызов продлевает её)
+@app.route('/api/flights/<int:ticket_id>/hold', methods=['POST'])
+@token_required
+def hold_flight(current_user, ticket_id):
+    conn = get_db_connection()
+    try:
+        hold = transfer_engine.run(
+            conn, lambda cursor: claim_seat(cursor, ticket_id, current_user['user_id'], SEAT_HOLD_TTL)
+        )
+        if hold['created']:
+            flight_catalog.invalidate()
+        return jsonify({
+            'ticket_id': ticket_id,
+            'expires_at': hold['expires_at']
+        }), 200
+    except TransferError as err:
+        return jsonify({'message': err.message, **err.payload}), err.status
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 400
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
 
-# Получение доступных авиабилетов
-@app.route('/api/flights', methods=['GET'])
-def get_flights():
+# Отмена брони
+@app.route('/api/flights/<int:ticket_id>/hold', methods=['DELETE'])
+@token_required
+def release_flight_hold(current_user, ticket_id):
     conn = get_db_connection()
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute('''
-            SELECT * FROM air_tickets
-            WHERE is_available = 1 AND departure_time > NOW()
-            ORDER BY departure_time ASC
-        ''')
-        flights = cursor.fetchall()
-        for f in flights:
-            f['departure_time'] = serialize_datetime(f.get('departure_time'))
-            f['arrival_time'] = serialize_datetime(f.get('arrival_time'))
-        return jsonify(flights), 200
+        released = transfer_engine.run(
+            conn, lambda cursor: release_hold(cursor, ticket_id, current_user['user_id'])
+        )
+        if not released:
+            return jsonify({'message': 'Hold not found!'}), 404
+        flight_catalog.invalidate()
+        return jsonify({'message': 'Hold released'}), 200
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 400
     finally:
-        conn.close()
+        if conn and conn.is_connected():
+            conn.close()
+
+
+# Получение доступных авиабилетов (из кэша каталога).
+# Фильтры: departure_city, arrival_city, date=YYYY-MM-DD; страницы: offset, limit.
+@app.route('/api/flights', methods=['GET'])
+def get_flights():
+    try:
+        query = FlightQuery(request.args, request.query_string)
+    except ValueError:
+        return jsonify({'message': 'Invalid query parameters'}), 400
+
+    snapshot = flight_catalog.current()
+    etag = query.etag(snapshot)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body, total = query.render(snapshot)
+        response = Response(body, mimetype='application/json')
+        if total is not None:
+            response.headers['X-Total-Count'] = str(total)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/support/tickets/<int:ticket_id>', methods=['PUT'])
 @token_required
@@ -774,7 +1686,11 @@ def update_ticket(current_user, ticket_id):
 
     conn = get_db_connection()
     try:
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
+        ticket = lock_ticket(cursor, ticket_id)
+        if not ticket:
+            return jsonify({'message': 'Ticket not found!'}), 404
+
         query = 'UPDATE support_tickets SET '
         params = []
         updates = []
@@ -793,6 +1709,13 @@ def update_ticket(current_user, ticket_id):
         params.append(ticket_id)
 
         cursor.execute(query, tuple(params))
+        if is_answered is not None:
+            counters = TicketCounterDelta()
+            counters.transition(ticket, dict(ticket, is_answered=1 if is_answered else 0))
+            counters.apply(cursor)
+        changes = ChangeLog()
+        changes.add(ticket['user_id'], 'support_tickets', ticket_id)
+        changes.apply(cursor)
         conn.commit()
         return jsonify({'message': 'Ticket updated'}), 200
     except Exception as e:
@@ -815,10 +1738,16 @@ def create_ticket(current_user):
     try:
         cursor = conn.cursor()
         cursor.execute(
-            'INSERT INTO support_tickets (user_id, subject, message_text) '
-            'VALUES (%s, %s, %s)',
+            'INSERT INTO support_tickets (user_id, subject, message_text, employee_id) '
+            'VALUES (%s, %s, %s, NULL)',
             (current_user['user_id'], subject, message)
         )
+        changes = ChangeLog()
+        changes.add(current_user['user_id'], 'support_tickets', cursor.lastrowid)
+        counters = TicketCounterDelta()
+        counters.transition(None, {'is_answered': 0, 'employee_id': None})
+        counters.apply(cursor)
+        changes.apply(cursor)
         conn.commit()
         return jsonify({'message': 'Ticket created successfully'}), 201
     finally:
@@ -832,15 +1761,15 @@ def get_user_tickets(current_user):
     conn = get_db_connection()
     try:
         cursor = conn.cursor(dictionary=True)
+        etag, not_modified = check_resource_etag(cursor, current_user['user_id'], 'tickets')
+        if not_modified:
+            return not_modified
         cursor.execute(
             'SELECT * FROM support_tickets WHERE user_id = %s ORDER BY created_at DESC',
             (current_user['user_id'],)
         )
         tickets = cursor.fetchall()
-        for t in tickets:
-            t['created_at'] = serialize_datetime(t.get('created_at'))
-            t['updated_at'] = serialize_datetime(t.get('updated_at'))
-        return jsonify(tickets), 200
+        return with_etag(make_response(jsonify(tickets), 200), etag)
     finally:
         conn.close()
 
@@ -861,37 +1790,249 @@ def get_all_tickets(current_user):
             JOIN users u ON t.user_id = u.user_id
             ORDER BY t.created_at DESC
         ''')
+        if wants_stream():
+            return stream_rows(cursor)
         tickets = cursor.fetchall()
-        for t in tickets:
-            t['created_at'] = serialize_datetime(t.get('created_at'))
-            t['updated_at'] = serialize_datetime(t.get('updated_at'))
         return jsonify(tickets), 200
     finally:
         conn.close()
 
 
+# Очередь тикетов для сотрудников поддержки, от старых к новым.
+# Фильтры: is_answered=0|1, employee_id=<id>|me|none,
+# min_age / max_age - возраст тикета в минутах; страницы: limit, cursor
+# (следующий курсор - в заголовке X-Next-Cursor)
+@app.route('/api/support/queue', methods=['GET'])
+@token_required
+def get_support_queue(current_user):
+    if current_user['role_id'] not in [2, 3]:
+        return jsonify({'message': 'Unauthorized access!'}), 403
+
+    args = request.args
+    try:
+        filters = {}
+        if args.get('is_answered') is not None:
+            filters['is_answered'] = 1 if int(args['is_answered']) else 0
+        employee_id = args.get('employee_id')
+        if employee_id == 'me':
+            filters['employee_id'] = current_user['user_id']
+        elif employee_id == 'none':
+            filters['employee_id'] = 'none'
+        elif employee_id is not None:
+            filters['employee_id'] = int(employee_id)
+        now = datetime.now()
+        if args.get('min_age') is not None:
+            filters['created_before'] = now - timedelta(minutes=int(args['min_age']))
+        if args.get('max_age') is not None:
+            filters['created_after'] = now - timedelta(minutes=int(args['max_age']))
+        after = parse_keyset_cursor(args['cursor']) if args.get('cursor') else None
+        limit = max(1, min(int(args.get('limit', SUPPORT_QUEUE_PAGE_DEFAULT)), SUPPORT_QUEUE_PAGE_MAX))
+    except ValueError:
+        return jsonify({'message': 'Invalid query parameters'}), 400
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+        query, params = build_queue_query(filters, after, limit + 1)
+        cursor.execute(query, params)
+        tickets = cursor.fetchall()
+
+        next_cursor = None
+        if len(tickets) > limit:
+            tickets = tickets[:limit]
+            last = tickets[-1]
+            next_cursor = format_keyset_cursor(last['created_at'], last['ticket_id'])
+
+        response = make_response(jsonify(tickets), 200)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    finally:
+        conn.close()
+
+# Число тикетов по статусам (из поддерживаемых счётчиков)
+@app.route('/api/support/queue/counts', methods=['GET'])
+@token_required
+def get_support_queue_counts(current_user):
+    if current_user['role_id'] not in [2, 3]:
+        return jsonify({'message': 'Unauthorized access!'}), 403
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        return jsonify(read_counters(cursor)), 200
+    finally:
+        conn.close()
+
+# Взять в работу самый старый свободный тикет без ответа
+@app.route('/api/support/queue/claim', methods=['POST'])
+@token_required
+def claim_support_ticket(current_user):
+    if current_user['role_id'] not in [2, 3]:
+        return jsonify({'message': 'Unauthorized access!'}), 403
+
+    conn = get_db_connection()
+    try:
+        ticket = transfer_engine.run(conn, lambda cursor: claim_next(cursor, current_user['user_id']))
+        if ticket is None:
+            return jsonify({'message': 'Queue is empty'}), 404
+        return jsonify(ticket), 200
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 400
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+# Вернуть тикет в очередь (только свой и ещё без ответа)
+@app.route('/api/support/queue/<int:ticket_id>/release', methods=['POST'])
+@token_required
+def release_support_ticket(current_user, ticket_id):
+    if current_user['role_id'] not in [2, 3]:
+        return jsonify({'message': 'Unauthorized access!'}), 403
+
+    def work(cursor):
+        ticket = lock_ticket(cursor, ticket_id)
+        if not ticket:
+            raise TransferError('Ticket not found!', 404)
+        if ticket['is_answered'] or ticket['employee_id'] != current_user['user_id']:
+            raise TransferError('Ticket is not assigned to you!', 409)
+        cursor.execute(
+            'UPDATE support_tickets SET employee_id = NULL, updated_at = NOW() WHERE ticket_id = %s',
+            (ticket_id,)
+        )
+        counters = TicketCounterDelta()
+        counters.transition(ticket, dict(ticket, employee_id=None))
+        counters.apply(cursor)
+        changes = ChangeLog()
+        changes.add(ticket['user_id'], 'support_tickets', ticket_id)
+        changes.apply(cursor)
+
+    conn = get_db_connection()
+    try:
+        transfer_engine.run(conn, work)
+        return jsonify({'message': 'Ticket released'}), 200
+    except TransferError as err:
+        return jsonify({'message': err.message, **err.payload}), err.status
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 400
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+# Переписка с поддержкой. С since=<курсор> - только новые сообщения;
+# курсор для следующего запроса - в заголовке X-Chat-Cursor
 @app.route('/api/support/chat', methods=['GET'])
 @token_required
 def get_support_chat(current_user):
+    try:
+        position = parse_chat_cursor(request.args.get('since'))
+    except ValueError:
+        return jsonify({'message': 'Invalid cursor'}), 400
+
     conn = get_db_connection()
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('''
-            SELECT message_id, user_id, employee_id, message_text, send_time, is_read, is_answered, 'user' AS sender_type
-            FROM support_messages
-            WHERE user_id = %s
-            UNION ALL
-            SELECT r.reply_id AS message_id, m.user_id, r.employee_id, r.reply_text AS message_text, r.reply_time AS send_time, m.is_read, m.is_answered, 'support' AS sender_type
-            FROM support_replies r
-            JOIN support_messages m ON r.message_id = m.message_id
-            WHERE m.user_id = %s
-            ORDER BY send_time ASC
-        ''', (current_user['user_id'], current_user['user_id']))
-        messages = cursor.fetchall()
-        return jsonify(messages), 200
+        messages, position = fetch_messages(cursor, current_user['user_id'], position)
+        response = jsonify(messages)
+        response.headers['X-Chat-Cursor'] = format_chat_cursor(position)
+        return response, 200
+    finally:
+        conn.close()
+
+# Новые сообщения после позиции и версия чата - на отдельном соединении из
+# пула: ожидающие запросы не держат соединение между проверками
+def fetch_chat_messages(user_id, position):
+    conn = db_pool.acquire()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        result = fetch_messages(cursor, user_id, position)
+        cursor.close()
+        return result
     finally:
         conn.close()
 
+def fetch_chat_version(user_id):
+    conn = db_pool.acquire()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        version = read_chat_version(cursor, user_id)
+        cursor.close()
+        return version
+    finally:
+        conn.close()
+
+def chat_fetcher(user_id, version=None):
+    return VersionedFetch(lambda position: fetch_chat_messages(user_id, position),
+                          lambda: fetch_chat_version(user_id), version)
+
+# Long-poll: отвечает сразу, если есть новые сообщения, иначе ждёт до
+# timeout секунд публикации для пользователя. Пока запрос ждёт, он не держит
+# соединение с БД и раз в CHAT_RECHECK_INTERVAL читает только версию чата
+# (на случай сообщения, записанного другим процессом)
+@app.route('/api/support/chat/poll', methods=['GET'])
+@token_required
+def poll_support_chat(current_user):
+    try:
+        position = parse_chat_cursor(request.args.get('since'))
+        timeout = min(float(request.args.get('timeout', CHAT_POLL_TIMEOUT)), CHAT_POLL_TIMEOUT)
+    except ValueError:
+        return jsonify({'message': 'Invalid query parameters'}), 400
+
+    user_id = current_user['user_id']
+    # Подписка до первого запроса, чтобы не пропустить сообщение между ними
+    with chat_notifier.subscribe(user_id) as subscription:
+        cursor = get_db_connection().cursor(dictionary=True)
+        version = read_chat_version(cursor, user_id)
+        messages, position = fetch_messages(cursor, user_id, position)
+        cursor.close()
+        if not messages:
+            release_request_connection()
+            messages, position = wait_for_messages(
+                chat_fetcher(user_id, version), subscription, position, timeout, CHAT_RECHECK_INTERVAL
+            )
+
+    response = jsonify(messages)
+    response.headers['X-Chat-Cursor'] = format_chat_cursor(position)
+    return response, 200
+
+# Server-Sent Events: событие message на каждое новое сообщение, id события -
+# курсор, так что при переподключении клиент продолжает с Last-Event-ID.
+# Поток закрывается через CHAT_STREAM_MAX_DURATION секунд
+@app.route('/api/support/chat/stream', methods=['GET'])
+@token_required
+def stream_support_chat(current_user):
+    try:
+        position = parse_chat_cursor(request.args.get('since') or request.headers.get('Last-Event-ID'))
+    except ValueError:
+        return jsonify({'message': 'Invalid cursor'}), 400
+
+    user_id = current_user['user_id']
+    subscription = chat_notifier.subscribe(user_id)
+    release_request_connection()
+
+    def generate(position):
+        try:
+            batches = stream_messages(
+                chat_fetcher(user_id), subscription, position,
+                CHAT_STREAM_MAX_DURATION, CHAT_STREAM_KEEPALIVE, CHAT_RECHECK_INTERVAL
+            )
+            for messages, position in batches:
+                if not messages:
+                    yield ': keepalive\n\n'
+                event_id = format_chat_cursor(position)
+                for message in messages:
+                    yield f'id: {event_id}\nevent: message\ndata: {app.json.dumps(message)}\n\n'
+        finally:
+            subscription.close()
+
+    return Response(
+        stream_with_context(generate(position)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/support/chat', methods=['POST'])
 @token_required
 def post_support_message(current_user):
@@ -907,11 +2048,51 @@ def post_support_message(current_user):
             'INSERT INTO support_messages (user_id, employee_id, message_text, is_read, is_answered) VALUES (%s, 0, %s, 0, 0)',
             (current_user['user_id'], message_text)
         )
+        changes = ChangeLog()
+        changes.touch(current_user['user_id'], CHAT_RESOURCE)
+        changes.apply(cursor)
         conn.commit()
+        chat_notifier.publish(current_user['user_id'])
         return jsonify({'message': 'Message sent'}), 201
     finally:
         conn.close()
 
+# Ответ сотрудника поддержки на сообщение чата
+@app.route('/api/support/chat/<int:message_id>/reply', methods=['POST'])
+@token_required
+def reply_to_support_message(current_user, message_id):
+    if current_user['role_id'] not in [2, 3]:  # Только поддержка и админ
+        return jsonify({'message': 'Unauthorized access!'}), 403
+
+    data = request.json
+    reply_text = data.get('reply_text')
+    if not reply_text:
+        return jsonify({'message': 'Reply text is required'}), 400
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute('SELECT user_id FROM support_messages WHERE message_id = %s', (message_id,))
+        message = cursor.fetchone()
+        if not message:
+            return jsonify({'message': 'Message not found!'}), 404
+        cursor.execute(
+            'INSERT INTO support_replies (message_id, user_id, employee_id, reply_text) VALUES (%s, %s, %s, %s)',
+            (message_id, message['user_id'], current_user['user_id'], reply_text)
+        )
+        cursor.execute(
+            'UPDATE support_messages SET is_answered = 1 WHERE message_id = %s',
+            (message_id,)
+        )
+        changes = ChangeLog()
+        changes.touch(message['user_id'], CHAT_RESOURCE)
+        changes.apply(cursor)
+        conn.commit()
+        chat_notifier.publish(message['user_id'])
+        return jsonify({'message': 'Reply sent successfully'}), 201
+    finally:
+        conn.close()
+
 
 # Ответ на тикет
 @app.route('/api/support/tickets/<int:ticket_id>/reply', methods=['POST'])
@@ -925,13 +2106,22 @@ def reply_to_ticket(current_user, ticket_id):
 
     conn = get_db_connection()
     try:
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
+        ticket = lock_ticket(cursor, ticket_id)
+        if not ticket:
+            return jsonify({'message': 'Ticket not found!'}), 404
         cursor.execute(
             'UPDATE support_tickets SET reply_text = %s, employee_id = %s, '
             'is_answered = 1, updated_at = NOW() '
             'WHERE ticket_id = %s',
             (reply, current_user['user_id'], ticket_id)
         )
+        counters = TicketCounterDelta()
+        counters.transition(ticket, {'is_answered': 1, 'employee_id': current_user['user_id']})
+        counters.apply(cursor)
+        changes = ChangeLog()
+        changes.add(ticket['user_id'], 'support_tickets', ticket_id)
+        changes.apply(cursor)
         conn.commit()
         return jsonify({'message': 'Reply sent successfully'}), 200
     finally:
@@ -948,13 +2138,16 @@ def get_settings(current_user, user_id):
     conn = get_db_connection()
     try:
         cursor = conn.cursor(dictionary=True)
+        etag, not_modified = check_resource_etag(cursor, user_id, 'settings')
+        if not_modified:
+            return not_modified
         cursor.execute('SELECT * FROM app_settings WHERE user_id = %s', (user_id,))
         settings = cursor.fetchone()
 
         if not settings:
             return jsonify({'message': 'Settings not found'}), 404
 
-        return jsonify(settings), 200
+        return with_etag(make_response(jsonify(settings), 200), etag)
     finally:
         if conn and conn.is_connected():
             conn.close()
@@ -1007,6 +2200,9 @@ def update_settings(current_user, user_id):
         values.append(user_id)
         query = f'UPDATE app_settings SET {", ".join(update_fields)} WHERE user_id = %s'
         cursor.execute(query, tuple(values))
+        changes = ChangeLog()
+        changes.add(user_id, 'app_settings', user_id)
+        changes.apply(cursor)
 
         conn.commit()
         return jsonify({'message': 'Settings updated successfully'}), 200
@@ -1020,22 +2216,17 @@ def update_settings(current_user, user_id):
 def deposit(current_user, account_id):
     data = request.json
     amount = data['amount']
+    if amount <= 0:
+        return jsonify({'message': 'Invalid amount!'}), 400
 
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor(dictionary=True)
-
+    def work(cursor):
         # Проверяем принадлежность счета
-        cursor.execute('SELECT user_id FROM accounts WHERE account_id = %s', (account_id,))
-        account = cursor.fetchone()
+        account = lock_accounts(cursor, [account_id]).get(account_id)
         if not account or account['user_id'] != current_user['user_id']:
-            return jsonify({'message': 'Invalid account!'}), 400
+            raise TransferError('Invalid account!')
 
         # Пополняем счет
-        cursor.execute(
-            'UPDATE accounts SET balance = balance + %s WHERE account_id = %s',
-            (amount, account_id)
-        )
+        move_funds(cursor, None, account_id, amount)
 
         # Записываем транзакцию
         transaction_uuid = str(uuid.uuid4())
@@ -1044,12 +2235,118 @@ def deposit(current_user, account_id):
             'VALUES (%s, %s, %s, 3)',
             (transaction_uuid, account_id, amount)
         )
+        changes = ChangeLog()
+        changes.add_transfer(cursor.lastrowid, None, None, current_user['user_id'], account_id)
 
-        conn.commit()
+        activity = ActivityDelta()
+        activity.add(current_user['user_id'], balance=amount, active=True)
+        activity.apply(cursor)
+        changes.apply(cursor)
+
+    conn = get_db_connection()
+    try:
+        transfer_engine.run(conn, work)
         return jsonify({'message': 'Deposit successful'}), 200
+    except TransferError as err:
+        return jsonify({'message': err.message, **err.payload}), err.status
     finally:
         if conn and conn.is_connected():
             conn.close()
 
+# Статистика пула соединений и кэшей (для подбора их размеров)
+@app.route('/api/admin/stats', methods=['GET'])
+@token_required
+def get_admin_stats(current_user):
+    if current_user['role_id'] != 3:
+        return jsonify({'message': 'Unauthorized access!'}), 403
+    return jsonify({
+        'db_pool': db_pool.stats(),
+        'principal_cache': principal_cache.stats(),
+        'transfer_engine': transfer_engine.stats(),
+        'reference_data': reference_data.stats(),
+        'password_hasher': password_hasher.stats(),
+        'bonus_worker': bonus_worker.stats(),
+        'sync_outbox': sync_outbox_worker.stats(),
+        'flight_catalog': flight_catalog.stats(),
+        'seat_holds': hold_sweeper.stats(),
+        'support_chat': chat_notifier.stats(),
+        'token_revocations': revocation_sync.stats(),
+        'account_numbers': account_numbers.stats(),
+        'slow_queries': metrics.slow_queries()
+    }), 200
+
+# Метрики в текстовом формате Prometheus
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'message': 'Unauthorized access!'}), 403
+    pool = db_pool.stats()
+    engine = transfer_engine.stats()
+    gauges = {
+        'db_pool_in_use': pool['in_use'],
+        'db_pool_idle': pool['idle'],
+        'db_pool_opened': pool['opened'],
+        'db_pool_timeouts': pool['timeouts'],
+        'principal_cache_size': principal_cache.stats()['size'],
+        'transfer_retries': engine['retries'],
+        'password_hash_in_flight': password_hasher.stats()['in_flight'],
+    }
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+# Перечитать справочники после их изменения в БД
+@app.route('/api/admin/reference-data/refresh', methods=['POST'])
+@token_required
+def refresh_reference_data(current_user):
+    if current_user['role_id'] != 3:
+        return jsonify({'message': 'Unauthorized access!'}), 403
+    snapshot = reference_data.load()
+    return jsonify({'message': 'Reference data reloaded', 'version': snapshot.version}), 200
+
+# Полный пересчёт сводки активности: flask --app app rebuild-activity-rollup
+@app.cli.command('rebuild-activity-rollup')
+def rebuild_activity_rollup_command():
+    conn = db_pool.acquire()
+    try:
+        rebuild_activity_rollup(conn)
+    finally:
+        conn.close()
+    print('Сводка активности пересчитана')
+
+# Полный пересчёт счётчиков тикетов: flask --app app rebuild-ticket-counters
+@app.cli.command('rebuild-ticket-counters')
+def rebuild_ticket_counters_command():
+    conn = db_pool.acquire()
+    try:
+        rebuild_counters(conn)
+    finally:
+        conn.close()
+    print('Счётчики тикетов поддержки пересчитаны')
+
+# Очистка журнала дельта-синхронизации: flask --app app prune-sync-changes
+@app.cli.command('prune-sync-changes')
+def prune_sync_changes_command():
+    conn = db_pool.acquire()
+    try:
+        removed = prune_sync_changes(conn, datetime.now() - timedelta(days=SYNC_CHANGES_RETENTION_DAYS))
+    finally:
+        conn.close()
+    print(f'Удалено записей журнала синхронизации: {removed}')
+
+# Отдельный процесс переноса начислений бонусов: flask --app app bonus-worker
+@app.cli.command('bonus-worker')
+def bonus_worker_command():
+    bonus_worker.start()
+    bonus_worker.join()
+
+# Отдельный процесс записи отложенных изменений журнала: flask --app app sync-outbox-worker
+@app.cli.command('sync-outbox-worker')
+def sync_outbox_worker_command():
+    sync_outbox_worker.start()
+    sync_outbox_worker.join()
+
 if __name__ == '__main__':
+    reference_data.load()
+    # С debug=True этот код выполняется и в родителе перезагрузчика
+    if is_running_from_reloader():
+        ensure_background_workers()
     app.run(debug=True, host='0.0.0.0', port=5000)
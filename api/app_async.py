@@ -0,0 +1,619 @@
+# Асинхронный режим сервера (ASGI).
+#
+# Самые нагруженные маршруты переписаны на asyncio с драйвером aiomysql: пока
+# запрос ждёт MySQL, поток не занят, поэтому один процесс держит тысячи
+# одновременных запросов. Хеширование паролей уходит в пул процессов
+# PasswordHasher, перечитывание кэшей - в пул потоков. Остальные маршруты
+# обслуживает то же синхронное Flask-приложение из app.py, каждый запрос в
+# своём потоке из пула на WSGI_THREADS потоков (см. ThreadedWsgiToAsgi), так
+# что набор маршрутов, авторизация и формат ответов не меняются.
+#
+# Зависимости: quart, quart-cors, aiomysql, hypercorn.
+# Запуск:
+#   cd api && hypercorn app_async:asgi_app --bind 0.0.0.0:5000
+import asyncio
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import wraps
+from tempfile import SpooledTemporaryFile
+
+import jwt
+import pymysql
+from quart import Quart, Response, g, jsonify, request
+from quart_cors import cors
+from werkzeug.exceptions import HTTPException
+
+import app as sync_app
+from async_db import (
+    apply_activity, apply_changes, create_pool, enqueue_accruals, issue_tokens, lock_accounts, move_funds,
+    open_cursor, run_transaction
+)
+from activity_rollup import ActivityDelta
+from bonus_outbox import transfer_bonus
+from dashboard import ACCOUNTS_SQL, PROFILE_SQL, SETTINGS_SQL, DashboardPlan, parse_fields
+from db_pool import PoolTimeoutError
+from delta_sync import VERSION_SQL, ChangeLog, format_sync_token
+from flight_catalog import FlightQuery
+from json_provider import FastJSONProvider
+from metrics import RequestMetrics
+from passwords import HashingPoolSaturated
+from resource_versions import VERSION_SQL as RESOURCE_VERSION_SQL, format_etag, version_params
+from support_chat import (
+    CHAT_QUERY, CHAT_RESOURCE, advance_position, chat_query_params, format_chat_cursor, parse_chat_cursor
+)
+from transfer_engine import TransferError
+
+metrics = sync_app.metrics
+password_hasher = sync_app.password_hasher
+principal_cache = sync_app.principal_cache
+token_issuer = sync_app.token_issuer
+revocations = sync_app.revocations
+reference_data = sync_app.reference_data
+
+# Потоки для синхронных маршрутов Flask: столько запросов к ним выполняется
+# одновременно. Long-poll и SSE чата занимают поток на всё время ожидания
+WSGI_THREADS = int(os.environ.get('WSGI_THREADS', 64))
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+
+app = Quart(__name__)
+app.json = FastJSONProvider(app, decimal_mode=sync_app.JSON_DECIMAL_MODE)
+app = cors(app, allow_origin='*', expose_headers=['X-Next-Cursor', 'X-Bonus-Balance', 'X-Total-Count',
+                                                   'ETag', 'X-Chat-Cursor'])
+
+
+@app.before_serving
+async def startup():
+    app.db_pool = await create_pool(
+        sync_app.DB_CONFIG, size=sync_app.DB_POOL_SIZE, max_overflow=sync_app.DB_POOL_MAX_OVERFLOW
+    )
+    await asyncio.get_running_loop().run_in_executor(None, reference_data.load)
+    sync_app.ensure_background_workers()
+
+
+@app.after_serving
+async def shutdown():
+    app.db_pool.close()
+    await app.db_pool.wait_closed()
+    password_hasher.shutdown()
+    wsgi_executor.shutdown(wait=False)
+
+
+@app.before_request
+async def start_request_metrics():
+    g.request_metrics = RequestMetrics()
+
+
+@app.after_request
+async def finish_request_metrics(response):
+    request_metrics = g.pop('request_metrics', None)
+    if request_metrics is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(endpoint, request.method, response.status_code, request_metrics)
+    return response
+
+
+@app.errorhandler(PoolTimeoutError)
+async def handle_pool_timeout(err):
+    return jsonify({'message': 'Сервер перегружен, попробуйте позже'}), 503
+
+
+@app.errorhandler(HashingPoolSaturated)
+async def handle_hashing_saturated(err):
+    response = jsonify({'message': 'Сервер перегружен, попробуйте позже'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+# Запросы к БД учитываются в метриках текущего HTTP-запроса
+def query_observer():
+    request_metrics = g.get('request_metrics')
+    return lambda sql, seconds: metrics.observe_query(sql, seconds, request_metrics)
+
+
+@asynccontextmanager
+async def db_connection():
+    started = time.perf_counter()
+    try:
+        conn = await asyncio.wait_for(app.db_pool.acquire(), sync_app.DB_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PoolTimeoutError(msg=f'Нет свободных соединений с БД за {sync_app.DB_POOL_TIMEOUT} с')
+    metrics.observe_acquire(time.perf_counter() - started)
+    try:
+        yield conn
+    finally:
+        app.db_pool.release(conn)
+
+
+async def fetch_all(sql, params=None):
+    async with db_connection() as conn:
+        cursor = await open_cursor(conn, query_observer())
+        try:
+            await cursor.execute(sql, params)
+            return await cursor.fetchall()
+        finally:
+            await cursor.close()
+
+
+async def run_in_hasher(future):
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), password_hasher.timeout)
+    except asyncio.TimeoutError:
+        raise HashingPoolSaturated()
+
+
+def token_required(f):
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        token = None
+        if 'Authorization' in request.headers:
+            try:
+                token = request.headers['Authorization'].split(" ")[1]
+            except IndexError:
+                return jsonify({'message': 'Неверный формат токена'}), 401
+        if not token:
+            return jsonify({'message': 'Токен отсутствует'}), 401
+        try:
+            claims = token_issuer.decode(token)
+            current_user_id = claims['user_id']
+        except jwt.ExpiredSignatureError:
+            return jsonify({'message': 'Срок действия токена истёк'}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({'message': 'Недействительный токен'}), 401
+        if revocations.is_revoked(claims):
+            return jsonify({'message': 'Токен отозван'}), 401
+
+        if 'role_id' in claims and 'user_type' in claims:
+            current_user = {
+                'user_id': current_user_id,
+                'role_id': claims['role_id'],
+                'user_type': claims['user_type'],
+            }
+        else:
+            current_user = principal_cache.get(current_user_id)
+        if current_user is None:
+            rows = await fetch_all(
+                'SELECT user_id, role_id, user_type FROM users WHERE user_id = %s', (current_user_id,)
+            )
+            if not rows:
+                return jsonify({'message': 'Пользователь не найден'}), 404
+            current_user = rows[0]
+            principal_cache.set(current_user_id, current_user)
+        return await f(dict(current_user), *args, **kwargs)
+    return decorated
+
+
+@app.route('/api/login', methods=['POST'])
+async def login():
+    auth = await request.get_json()
+    if not auth or 'phone' not in auth or 'password' not in auth:
+        return jsonify({'message': 'Необходимо указать телефон и пароль'}), 400
+    rows = await fetch_all('SELECT * FROM users WHERE phone_number = %s', (auth['phone'],))
+    if not rows:
+        return jsonify({'message': 'Пользователь не найден'}), 404
+    user = rows[0]
+    if not await run_in_hasher(password_hasher.submit_verify(user['password_hash'], auth['password'])):
+        return jsonify({'message': 'Неверный пароль'}), 401
+
+    if password_hasher.needs_rehash(user['password_hash']):
+        try:
+            new_hash = await run_in_hasher(password_hasher.submit_hash(auth['password']))
+            await fetch_all(
+                'UPDATE users SET password_hash = %s WHERE user_id = %s AND password_hash = %s',
+                (new_hash, user['user_id'], user['password_hash'])
+            )
+        except (HashingPoolSaturated, pymysql.err.MySQLError):
+            pass
+
+    async with db_connection() as conn:
+        cursor = await open_cursor(conn, query_observer())
+        try:
+            tokens = await issue_tokens(cursor, token_issuer, user)
+        finally:
+            await cursor.close()
+    return jsonify({
+        **tokens,
+        'user_id': user['user_id'],
+        'first_name': user['first_name'],
+        'last_name': user['last_name']
+    }), 200
+
+
+@app.route('/api/user/<int:user_id>/accounts', methods=['GET'])
+@token_required
+async def get_user_accounts(current_user, user_id):
+    if current_user['user_id'] != user_id and current_user['role_id'] != 3:
+        return jsonify({'message': 'Unauthorized access!'}), 403
+    rows = await fetch_all(RESOURCE_VERSION_SQL, version_params(user_id, 'accounts'))
+    etag = format_etag('accounts', user_id, rows[0]['version'] if rows else 0,
+                       reference_data.current().fingerprint)
+    if request.if_none_match.contains(etag):
+        response = Response('', status=304)
+    else:
+        accounts = await fetch_all('SELECT * FROM accounts WHERE user_id = %s AND is_active = 1', (user_id,))
+        for acc in accounts:
+            sync_app.prepare_account_row(acc)
+        response = jsonify(accounts)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/user/<int:user_id>/dashboard', methods=['GET'])
+@token_required
+async def get_dashboard(current_user, user_id):
+    if current_user['user_id'] != user_id and current_user['role_id'] != 3:
+        return jsonify({'message': 'Unauthorized access!'}), 403
+
+    try:
+        plan = DashboardPlan(parse_fields(request.args.get('fields')),
+                             private=current_user['user_id'] == user_id)
+        limit = int(request.args.get('transactions_limit', sync_app.DASHBOARD_TRANSACTIONS_DEFAULT))
+        limit = max(1, min(limit, sync_app.TRANSACTIONS_PAGE_MAX))
+    except ValueError:
+        return jsonify({'message': 'Invalid query parameters'}), 400
+
+    async def fetch_one(sql):
+        rows = await fetch_all(sql, (user_id,))
+        return rows[0] if rows else None
+
+    async def fetch_accounts():
+        accounts = await fetch_all(ACCOUNTS_SQL, (user_id,))
+        for acc in accounts:
+            sync_app.prepare_account_row(acc)
+        if not plan.needs_transactions or not accounts:
+            return accounts, None, None
+        query, params = sync_app.transactions_query([acc['account_id'] for acc in accounts], {}, limit + 1)
+        transactions = await fetch_all(query, params)
+        next_cursor = None
+        if len(transactions) > limit:
+            transactions = transactions[:limit]
+            last = transactions[-1]
+            next_cursor = sync_app.format_keyset_cursor(last['transaction_date'], last['transaction_id'])
+        for tr in transactions:
+            sync_app.prepare_transaction_row(tr)
+        return accounts, transactions, next_cursor
+
+    async def nothing(value=None):
+        return value
+
+    # Токен читается до данных: изменения между запросами придут в /sync
+    sync_token = None
+    if current_user['user_id'] == user_id:
+        rows = await fetch_all(VERSION_SQL, (user_id,))
+        sync_token = format_sync_token(rows[0]['version'] if rows else 0)
+
+    # Независимые части читаются параллельно на разных соединениях пула
+    profile, (accounts, transactions, next_cursor), settings = await asyncio.gather(
+        fetch_one(PROFILE_SQL) if plan.needs_profile else nothing(),
+        fetch_accounts() if plan.needs_accounts else nothing((None, None, None)),
+        fetch_one(SETTINGS_SQL) if plan.needs_settings else nothing(),
+    )
+    if plan.needs_profile and profile is None:
+        return jsonify({'message': 'User not found!'}), 404
+    return jsonify(plan.build(profile, accounts, transactions, next_cursor, settings, sync_token)), 200
+
+
+@app.route('/api/user/<int:user_id>/transactions', methods=['GET'])
+@token_required
+async def get_transactions(current_user, user_id):
+    if current_user['user_id'] != user_id and current_user['role_id'] != 3:
+        return jsonify({'message': 'Unauthorized access!'}), 403
+
+    stream = request.args.get('stream') == '1' or 'application/x-ndjson' in request.headers.get('Accept', '')
+    try:
+        filters = sync_app.parse_transaction_filters(request.args)
+        limit = request.args.get('limit')
+        if limit is not None:
+            limit = max(1, min(int(limit), sync_app.TRANSACTIONS_PAGE_MAX))
+        elif not stream:
+            limit = sync_app.TRANSACTIONS_PAGE_DEFAULT
+    except ValueError:
+        return jsonify({'message': 'Invalid query parameters'}), 400
+
+    accounts = await fetch_all('SELECT account_id FROM accounts WHERE user_id = %s', (user_id,))
+    account_ids = [row['account_id'] for row in accounts]
+
+    if stream:
+        if not account_ids:
+            return Response('', mimetype='application/x-ndjson')
+        query, params = sync_app.transactions_query(account_ids, filters, limit)
+        observe = query_observer()
+
+        async def generate():
+            async with db_connection() as conn:
+                cursor = await open_cursor(conn, observe)
+                try:
+                    await cursor.execute(query, params)
+                    while True:
+                        row = await cursor.fetchone()
+                        if row is None:
+                            break
+                        sync_app.prepare_transaction_row(row)
+                        yield app.json.dumps(row) + '\n'
+                finally:
+                    await cursor.close()
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    if not account_ids:
+        return jsonify([]), 200
+    # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+    query, params = sync_app.transactions_query(account_ids, filters, limit + 1)
+    transactions = await fetch_all(query, params)
+
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        next_cursor = sync_app.format_keyset_cursor(last['transaction_date'], last['transaction_id'])
+    for tr in transactions:
+        sync_app.prepare_transaction_row(tr)
+
+    response = jsonify(transactions)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+
+@app.route('/api/transfer-by-phone', methods=['POST'])
+@token_required
+async def transfer_by_phone(current_user):
+    data = await request.get_json()
+    from_account_id = data.get('from_account_id')
+    recipient_phone = data.get('recipient_phone')
+    amount = data.get('amount')
+
+    if not from_account_id or not recipient_phone or not amount:
+        return jsonify({'message': 'Не все обязательные поля заполнены'}), 400
+    if amount <= 0:
+        return jsonify({'message': 'Неверная сумма'}), 400
+
+    async def work(cursor):
+        await cursor.execute(
+            'SELECT user_id, user_type, business_category FROM users WHERE phone_number = %s',
+            (recipient_phone,)
+        )
+        recipient = await cursor.fetchone()
+        if not recipient:
+            raise TransferError('Получатель не найден', 404)
+
+        await cursor.execute('''
+            SELECT account_id FROM accounts
+            WHERE user_id = %s AND type_id = 1 AND is_active = 1
+            ORDER BY opening_date ASC
+            LIMIT 1
+        ''', (recipient['user_id'],))
+        to_account = await cursor.fetchone()
+        if not to_account:
+            raise TransferError('У получателя нет активных счетов')
+
+        to_account_id = to_account['account_id']
+        if to_account_id == from_account_id:
+            raise TransferError('Неверный счет отправителя')
+
+        accounts = await lock_accounts(cursor, [from_account_id, to_account_id])
+        from_account = accounts.get(from_account_id)
+        if not from_account or from_account['user_id'] != current_user['user_id']:
+            raise TransferError('Неверный счет отправителя')
+        if from_account['balance'] < amount:
+            raise TransferError('Недостаточно средств')
+
+        transaction_type = 1  # P2P перевод
+        category_id = 7        # Переводы
+        if recipient['user_type'] == 'business':
+            transaction_type = 2  # P2B платеж
+            category_id = reference_data.category_id(recipient['business_category'], 10)  # Другое
+
+        await move_funds(cursor, from_account_id, to_account_id, amount)
+        await cursor.execute(
+            'INSERT INTO transactions (transaction_uuid, from_account_id, to_account_id, amount, type_id, recipient_phone, category_id) '
+            'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+            (str(uuid.uuid4()), from_account_id, to_account_id, amount, transaction_type, recipient_phone, category_id)
+        )
+        changes = ChangeLog()
+        changes.add_transfer(cursor.lastrowid, current_user['user_id'], from_account_id,
+                             recipient['user_id'], to_account_id)
+
+        # Начисление бонусов (50% от комиссии 1%)
+        bonus_amount = transfer_bonus(amount)
+        if bonus_amount > 0:
+            await enqueue_accruals(cursor, [
+                (current_user['user_id'], bonus_amount, f'Бонус за перевод {recipient_phone}')
+            ])
+            changes.touch(current_user['user_id'], 'bonus_operations')
+
+        activity = ActivityDelta()
+        activity.add(current_user['user_id'], transfers=1, balance=-amount, active=True)
+        activity.add(recipient['user_id'], balance=amount)
+        await apply_activity(cursor, activity)
+        await apply_changes(cursor, changes)
+
+    try:
+        async with db_connection() as conn:
+            await run_transaction(sync_app.transfer_engine, conn, work, query_observer())
+        return jsonify({'message': 'Перевод успешно выполнен'}), 200
+    except TransferError as err:
+        return jsonify({'message': err.message, **err.payload}), err.status
+    except pymysql.err.MySQLError as err:
+        return jsonify({'error': str(err)}), 400
+
+
+@app.route('/api/flights', methods=['GET'])
+async def get_flights():
+    try:
+        query = FlightQuery(request.args, request.query_string)
+    except ValueError:
+        return jsonify({'message': 'Invalid query parameters'}), 400
+
+    catalog = sync_app.flight_catalog
+    snapshot = catalog.cached()
+    if snapshot is None:
+        snapshot = await asyncio.get_running_loop().run_in_executor(None, catalog.current)
+    etag = query.etag(snapshot)
+    if request.if_none_match.contains(etag):
+        response = Response('', status=304)
+    else:
+        body, total = query.render(snapshot)
+        response = Response(body, mimetype='application/json')
+        if total is not None:
+            response.headers['X-Total-Count'] = str(total)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/support/chat', methods=['GET'])
+@token_required
+async def get_support_chat(current_user):
+    try:
+        position = parse_chat_cursor(request.args.get('since'))
+    except ValueError:
+        return jsonify({'message': 'Invalid cursor'}), 400
+    messages = await fetch_all(CHAT_QUERY, chat_query_params(current_user['user_id'], position))
+    response = jsonify(messages)
+    response.headers['X-Chat-Cursor'] = format_chat_cursor(advance_position(messages, position))
+    return response, 200
+
+
+@app.route('/api/support/chat', methods=['POST'])
+@token_required
+async def post_support_message(current_user):
+    data = await request.get_json()
+    message_text = data.get('message_text')
+    if not message_text:
+        return jsonify({'message': 'Message text is required'}), 400
+
+    async def work(cursor):
+        await cursor.execute(
+            'INSERT INTO support_messages (user_id, employee_id, message_text, is_read, is_answered) VALUES (%s, 0, %s, 0, 0)',
+            (current_user['user_id'], message_text)
+        )
+        changes = ChangeLog()
+        changes.touch(current_user['user_id'], CHAT_RESOURCE)
+        await apply_changes(cursor, changes)
+
+    async with db_connection() as conn:
+        await run_transaction(sync_app.transfer_engine, conn, work, query_observer())
+    sync_app.chat_notifier.publish(current_user['user_id'])
+    return jsonify({'message': 'Message sent'}), 201
+
+
+def wsgi_environ(scope, body):
+    """WSGI environ по ASGI scope и телу запроса"""
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin1')
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+
+class ThreadedWsgiToAsgi:
+    """ASGI-обёртка над WSGI-приложением, выполняющая каждый запрос в потоке
+    из executor. WsgiToAsgi из asgiref вызывает приложение через
+    sync_to_async(thread_sensitive=True), то есть в одном общем потоке: все
+    запросы Flask шли бы по очереди, и ожидающий long-poll задерживал бы
+    остальные"""
+
+    def __init__(self, wsgi_application, executor):
+        self.wsgi_application = wsgi_application
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message['type'] != 'http.request':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            await loop.run_in_executor(self.executor, self._run, scope, body, loop, send)
+
+    def _run(self, scope, body, loop, send):
+        # Поток из executor: ответ отдаётся по частям через цикл событий, так что
+        # потоковые ответы (SSE) уходят клиенту сразу, а ошибка отправки после
+        # отключения клиента прерывает обход ответа
+        def sync_send(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('started'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['start'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+            }
+
+        result = self.wsgi_application(wsgi_environ(scope, body), start_response)
+        try:
+            for chunk in result:
+                if not response.get('started'):
+                    response['started'] = True
+                    sync_send(response['start'])
+                if chunk:
+                    sync_send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not response.get('started'):
+                sync_send(response['start'])
+            sync_send({'type': 'http.response.body'})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+class ApiDispatcher:
+    """ASGI-приложение: маршруты, переписанные на asyncio, обслуживает Quart,
+    остальные - синхронное Flask-приложение в пуле потоков wsgi_executor"""
+
+    def __init__(self, async_app, wsgi_app, executor):
+        self.async_app = async_app
+        self.wsgi_app = ThreadedWsgiToAsgi(wsgi_app, executor)
+        self._urls = async_app.url_map.bind('localhost')
+
+    def _is_async(self, scope):
+        try:
+            self._urls.match(scope['path'], scope['method'])
+        except HTTPException:
+            return False
+        return True
+
+    async def __call__(self, scope, receive, send):
+        # lifespan (before_serving / after_serving) тоже обрабатывает Quart
+        if scope['type'] != 'http' or self._is_async(scope):
+            return await self.async_app(scope, receive, send)
+        return await self.wsgi_app(scope, receive, send)
+
+
+asgi_app = ApiDispatcher(app, sync_app.app, wsgi_executor)
@@ -0,0 +1,152 @@
+# Доступ к MySQL для асинхронного сервера (app_async.py) через aiomysql.
+# SQL и правила блокировок общие с синхронным приложением: здесь только
+# асинхронные обёртки над теми же запросами.
+import asyncio
+import time
+
+import aiomysql
+import pymysql
+
+from activity_rollup import UPSERT_SQL
+from auth_tokens import INSERT_REFRESH_SQL
+from bonus_outbox import ENQUEUE_SQL
+from delta_sync import BUMP_RESOURCE_VERSION_SQL, BUMP_SYNC_VERSION_SQL, ENQUEUE_CHANGE_SQL, INSERT_CHANGE_SQL
+from transfer_engine import CREDIT_SQL, DEBIT_SQL, TransferError, lock_accounts_query
+
+
+async def create_pool(db_config, size=10, max_overflow=10):
+    # autocommit: чтение вне транзакции не держит снимок данных между
+    # запросами, транзакции открываются явно в run_transaction
+    return await aiomysql.create_pool(
+        minsize=size,
+        maxsize=size + max_overflow,
+        host=db_config['host'],
+        user=db_config['user'],
+        password=db_config['password'],
+        db=db_config['database'],
+        autocommit=True,
+        charset='utf8mb4',
+    )
+
+
+class AsyncCursor:
+    """DictCursor aiomysql с замером запросов, как metrics.InstrumentedCursor.
+    observe(sql, seconds) вызывается после каждого запроса"""
+
+    def __init__(self, cursor, observe=None):
+        self._cursor = cursor
+        self._observe = observe
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    async def execute(self, operation, params=None):
+        start = time.perf_counter()
+        try:
+            return await self._cursor.execute(operation, params)
+        finally:
+            if self._observe:
+                self._observe(operation, time.perf_counter() - start)
+
+    async def executemany(self, operation, seq_params):
+        start = time.perf_counter()
+        try:
+            return await self._cursor.executemany(operation, seq_params)
+        finally:
+            if self._observe:
+                self._observe(operation, time.perf_counter() - start)
+
+    async def fetchone(self):
+        return await self._cursor.fetchone()
+
+    async def fetchall(self):
+        return list(await self._cursor.fetchall())
+
+    async def close(self):
+        await self._cursor.close()
+
+
+async def open_cursor(conn, observe=None):
+    return AsyncCursor(await conn.cursor(aiomysql.DictCursor), observe)
+
+
+async def run_transaction(engine, conn, work, observe=None):
+    """Асинхронный аналог TransferEngine.run: work(cursor) - корутина.
+    Статистика повторов ведётся в том же engine"""
+    attempt = 0
+    while True:
+        cursor = await open_cursor(conn, observe)
+        try:
+            await conn.begin()
+            result = await work(cursor)
+            await conn.commit()
+            engine.record(attempt)
+            return result
+        except TransferError:
+            await conn.rollback()
+            engine.record(attempt)
+            raise
+        except pymysql.err.MySQLError as err:
+            await conn.rollback()
+            errno = err.args[0] if err.args else None
+            if not engine.should_retry(errno, attempt):
+                engine.record(attempt)
+                raise
+            attempt += 1
+            await asyncio.sleep(engine.backoff(attempt))
+        finally:
+            await cursor.close()
+
+
+async def lock_accounts(cursor, account_ids):
+    query, params = lock_accounts_query(account_ids)
+    if query is None:
+        return {}
+    await cursor.execute(query, params)
+    return {row['account_id']: row for row in await cursor.fetchall()}
+
+
+async def move_funds(cursor, from_account_id, to_account_id, amount):
+    if from_account_id is not None:
+        await cursor.execute(DEBIT_SQL, (amount, from_account_id))
+    if to_account_id is not None:
+        await cursor.execute(CREDIT_SQL, (amount, to_account_id))
+
+
+async def enqueue_accruals(cursor, rows):
+    if rows:
+        await cursor.executemany(ENQUEUE_SQL, rows)
+
+
+async def apply_activity(cursor, activity):
+    rows = activity.rows()
+    if rows:
+        await cursor.executemany(UPSERT_SQL, rows)
+
+
+async def issue_tokens(cursor, issuer, user):
+    """TokenIssuer.issue"""
+    params, tokens = issuer.new_pair(user)
+    await cursor.execute(INSERT_REFRESH_SQL, params)
+    return tokens
+
+
+async def apply_changes(cursor, changes):
+    """ChangeLog.apply: последним шагом транзакции"""
+    rows = []
+    for user_id, count in changes.version_rows():
+        await cursor.execute(BUMP_SYNC_VERSION_SQL, (user_id, count, count))
+        rows.extend(changes.change_rows(user_id, cursor.lastrowid))
+    if rows:
+        await cursor.executemany(INSERT_CHANGE_SQL, rows)
+    resources = changes.resource_rows()
+    if resources:
+        await cursor.executemany(BUMP_RESOURCE_VERSION_SQL, resources)
+    outbox = changes.outbox_rows()
+    if outbox:
+        await cursor.executemany(ENQUEUE_CHANGE_SQL, outbox)
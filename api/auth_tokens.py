@@ -0,0 +1,303 @@
+# Токены доступа и обновления.
+#
+# Токен доступа - короткоживущий JWT с нужными обработчикам полями
+# (user_id, role_id, user_type), поэтому проверка запроса не обращается к БД.
+# Токен обновления - случайная строка; в refresh_tokens хранится только её
+# SHA-256. При каждом обновлении токен заменяется новым, повторное
+# использование заменённого токена отзывает все сессии пользователя.
+#
+# Отзыв (смена пароля, смена роли, выход) записывается в token_revocations.
+# Каждый процесс держит отозванное в памяти - фильтр Блума и точные
+# словари - и подтягивает новые строки таблицы фоновым потоком
+# RevocationSync, так что проверка отзыва - O(1) без запросов к БД.
+# Строка отзыва нужна только до истечения последнего затронутого ею
+# токена доступа, после этого она удаляется.
+import hashlib
+import math
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import mysql.connector
+
+INSERT_REFRESH_SQL = (
+    'INSERT INTO refresh_tokens (token_hash, user_id, expires_at) VALUES (%s, %s, %s)'
+)
+
+LOCK_REFRESH_SQL = '''
+    SELECT rt.token_hash, rt.user_id, rt.expires_at, rt.revoked_at, u.role_id, u.user_type
+    FROM refresh_tokens rt
+    JOIN users u ON u.user_id = rt.user_id
+    WHERE rt.token_hash = %s
+    FOR UPDATE
+'''
+
+REVOKE_USER_REFRESH_SQL = (
+    'UPDATE refresh_tokens SET revoked_at = %s WHERE user_id = %s AND revoked_at IS NULL'
+)
+
+INSERT_REVOCATION_SQL = (
+    'INSERT INTO token_revocations (user_id, jti, not_before, expires_at) VALUES (%s, %s, %s, %s)'
+)
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def to_timestamp(dt):
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def hash_refresh_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class TokenIssuer:
+    """Выпуск и проверка токенов.
+
+    access_ttl  -- время жизни токена доступа, секунд; столько же после
+                   отзыва живёт строка в token_revocations
+    refresh_ttl -- время жизни токена обновления, секунд
+    """
+
+    def __init__(self, secret, algorithm='HS256', access_ttl=900, refresh_ttl=30 * 24 * 3600):
+        self.secret = secret
+        self.algorithm = algorithm
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+
+    def access_token(self, user):
+        now = time.time()
+        # iat с долями секунды: вход сразу после смены пароля не должен
+        # попасть под отзыв, выданный в ту же секунду
+        return jwt.encode({
+            'typ': 'access',
+            'jti': uuid.uuid4().hex,
+            'user_id': user['user_id'],
+            'role_id': user['role_id'],
+            'user_type': user['user_type'],
+            'iat': now,
+            'exp': int(now + self.access_ttl),
+        }, self.secret, algorithm=self.algorithm)
+
+    def decode(self, token):
+        """Поля токена; jwt.InvalidTokenError, если подпись, срок или тип неверны.
+        Токены старого формата (только user_id и exp) принимаются до истечения"""
+        claims = jwt.decode(token, self.secret, algorithms=[self.algorithm])
+        if claims.get('typ', 'access') != 'access' or 'user_id' not in claims:
+            raise jwt.InvalidTokenError('Not an access token')
+        return claims
+
+    def refresh_token(self):
+        """(токен для клиента, хеш для БД, момент истечения в UTC)"""
+        token = secrets.token_urlsafe(32)
+        return token, hash_refresh_token(token), utcnow() + timedelta(seconds=self.refresh_ttl)
+
+    def new_pair(self, user):
+        """(параметры INSERT_REFRESH_SQL, ответ клиенту) - общее для
+        синхронного issue и async_db.issue_tokens"""
+        refresh, refresh_hash, expires_at = self.refresh_token()
+        return (refresh_hash, user['user_id'], expires_at), {
+            'token': self.access_token(user),
+            'refresh_token': refresh,
+            'expires_in': self.access_ttl,
+        }
+
+    def issue(self, cursor, user):
+        """Пара токенов; строка токена обновления добавляется в текущей транзакции"""
+        params, tokens = self.new_pair(user)
+        cursor.execute(INSERT_REFRESH_SQL, params)
+        return tokens
+
+
+class BloomFilter:
+    def __init__(self, capacity=10000, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationSet:
+    """Отозванные токены в памяти процесса. Фильтр Блума отсекает почти все
+    проверки, точные словари исключают ложные срабатывания"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}     # user_id -> (не раньше какого iat токен действителен, до какого момента помнить)
+        self._jtis = {}      # jti -> до какого момента помнить
+        self._bloom = BloomFilter()
+        self.checks = 0
+        self.revoked_hits = 0
+
+    def add_user(self, user_id, not_before, expires):
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is None or current[0] < not_before:
+                self._users[user_id] = (not_before, max(expires, current[1] if current else 0))
+            self._bloom.add(f'u{user_id}')
+
+    def add_jti(self, jti, expires):
+        with self._lock:
+            self._jtis[jti] = expires
+            self._bloom.add(f'j{jti}')
+
+    def is_revoked(self, claims):
+        self.checks += 1
+        bloom = self._bloom
+        user_key = f"u{claims['user_id']}"
+        if user_key in bloom:
+            entry = self._users.get(claims['user_id'])
+            if entry is not None and claims.get('iat', 0) < entry[0]:
+                self.revoked_hits += 1
+                return True
+        jti = claims.get('jti')
+        if jti and f'j{jti}' in bloom and jti in self._jtis:
+            self.revoked_hits += 1
+            return True
+        return False
+
+    def prune(self, now=None):
+        """Забыть истёкшие записи и пересобрать фильтр (удалять из него нельзя)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._users = {u: e for u, e in self._users.items() if e[1] > now}
+            self._jtis = {j: e for j, e in self._jtis.items() if e > now}
+            bloom = BloomFilter(capacity=max(10000, 2 * (len(self._users) + len(self._jtis))))
+            for user_id in self._users:
+                bloom.add(f'u{user_id}')
+            for jti in self._jtis:
+                bloom.add(f'j{jti}')
+            self._bloom = bloom
+
+    def stats(self):
+        return {
+            'users': len(self._users),
+            'jtis': len(self._jtis),
+            'checks': self.checks,
+            'revoked_hits': self.revoked_hits,
+        }
+
+
+def revoke_user(cursor, revocations, user_id, access_ttl, refresh=True):
+    """Отзыв выданных пользователю токенов доступа в текущей транзакции.
+    refresh=True (смена пароля) отзывает и токены обновления; при смене
+    роли их оставляют, чтобы клиент получил токен с новыми полями.
+    В этом процессе отзыв действует сразу, в остальных - после следующей
+    синхронизации RevocationSync"""
+    now = utcnow()
+    expires = now + timedelta(seconds=access_ttl)
+    cursor.execute(INSERT_REVOCATION_SQL, (user_id, None, now, expires))
+    if refresh:
+        cursor.execute(REVOKE_USER_REFRESH_SQL, (now, user_id))
+    revocations.add_user(user_id, to_timestamp(now), to_timestamp(expires))
+
+
+def revoke_access_token(cursor, revocations, claims):
+    """Отзыв одного токена доступа (выход) до его истечения"""
+    expires = datetime.fromtimestamp(claims['exp'], timezone.utc).replace(tzinfo=None)
+    cursor.execute(INSERT_REVOCATION_SQL, (claims['user_id'], claims['jti'], utcnow(), expires))
+    revocations.add_jti(claims['jti'], claims['exp'])
+
+
+class RevocationSync(threading.Thread):
+    """Фоновый поток, подтягивающий новые строки token_revocations в
+    RevocationSet и удаляющий истёкшие.
+
+    Новые строки ищутся по not_before с перекрытием overlap секунд, а не по
+    revocation_id: автоинкремент выдаётся до коммита, и строка с меньшим id
+    может стать видна позже строки с большим. Повторное добавление строки
+    в RevocationSet ничего не меняет"""
+
+    def __init__(self, connect, revocations, interval=1.0, prune_interval=300.0, overlap=60.0):
+        super().__init__(name='token-revocation-sync', daemon=True)
+        self._connect = connect
+        self.revocations = revocations
+        self.interval = interval
+        self.prune_interval = prune_interval
+        self.overlap = overlap
+        self._stop_event = threading.Event()
+        self._watermark = None   # самый поздний прочитанный not_before
+        self._next_prune = 0.0
+        self.loaded = 0
+        self.errors = 0
+        self.last_sync = None
+
+    def sync_once(self, conn):
+        cursor = conn.cursor(dictionary=True)
+        try:
+            now = utcnow()
+            if self._watermark is None:
+                cursor.execute(
+                    'SELECT user_id, jti, not_before, expires_at FROM token_revocations '
+                    'WHERE expires_at > %s',
+                    (now,)
+                )
+            else:
+                cursor.execute(
+                    'SELECT user_id, jti, not_before, expires_at FROM token_revocations '
+                    'WHERE not_before > %s AND expires_at > %s',
+                    (self._watermark - timedelta(seconds=self.overlap), now)
+                )
+            rows = cursor.fetchall()
+            for row in rows:
+                expires = to_timestamp(row['expires_at'])
+                if row['jti']:
+                    self.revocations.add_jti(row['jti'], expires)
+                else:
+                    self.revocations.add_user(row['user_id'], to_timestamp(row['not_before']), expires)
+                if self._watermark is None or row['not_before'] > self._watermark:
+                    self._watermark = row['not_before']
+            if self._watermark is None:
+                self._watermark = now
+            self.loaded += len(rows)
+            if time.monotonic() >= self._next_prune:
+                self.revocations.prune()
+                cursor.execute('DELETE FROM token_revocations WHERE expires_at < %s LIMIT 1000', (utcnow(),))
+                cursor.execute('DELETE FROM refresh_tokens WHERE expires_at < %s LIMIT 1000', (utcnow(),))
+                self._next_prune = time.monotonic() + self.prune_interval
+            conn.commit()
+            self.last_sync = time.time()
+        finally:
+            cursor.close()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                conn = self._connect()
+                try:
+                    self.sync_once(conn)
+                finally:
+                    conn.close()
+            except mysql.connector.Error:
+                self.errors += 1
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        return {
+            'running': self.is_alive(),
+            'loaded': self.loaded,
+            'errors': self.errors,
+            'last_sync': self.last_sync,
+            **self.revocations.stats(),
+        }
@@ -0,0 +1,149 @@
+# Конкурентное создание счетов и выдача номеров.
+#
+# --mode api: потоки одновременно открывают счета через
+#   POST /api/user/<id>/accounts; считает счета в секунду, задержки,
+#   повторы номеров и номера с неверной контрольной цифрой. Счета реально
+#   создаются, поэтому только на тестовой базе:
+#     python api/bench/bench_account_numbers.py --mode api --threads 32 --per-thread 20 \
+#         --user 79990000001:password --user 79990000002:password
+#
+# --mode allocator: несколько процессов (как несколько воркеров сервера)
+#   берут номера из последовательностей базы BENCH_DB_* напрямую; проверяет,
+#   что номера не повторяются между процессами, и показывает, сколько
+#   запросов к БД ушло на резервирование блоков:
+#     python api/bench/bench_account_numbers.py --mode allocator --processes 4 \
+#         --threads 8 --per-thread 1000 --block-size 100
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+
+from common import ApiClient, Timer, percentile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from account_numbers import AccountNumberAllocator, is_valid_account_number  # noqa: E402
+
+
+def parse_user(value):
+    phone, password = value.rsplit(':', 1)
+    return phone, password
+
+
+def report_numbers(numbers):
+    duplicates = len(numbers) - len(set(numbers))
+    invalid = sum(1 for n in numbers if not is_valid_account_number(n))
+    print(f'номеров: {len(numbers)}, повторов: {duplicates}, с неверной контрольной цифрой: {invalid}')
+
+
+def run_api(args):
+    users = []
+    for phone, password in args.user:
+        client = ApiClient(args.base_url)
+        data = client.login(phone, password)
+        users.append((client.token, data['user_id']))
+
+    lock = threading.Lock()
+    numbers = []
+    latencies = []
+    statuses = {}
+
+    def worker(index):
+        token, user_id = users[index % len(users)]
+        client = ApiClient(args.base_url, token)
+        for _ in range(args.per_thread):
+            with Timer() as t:
+                status, account = client.json('POST', f'/api/user/{user_id}/accounts', {'type_id': args.type_id})
+            with lock:
+                latencies.append(t.elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 201:
+                    numbers.append(account['account_number'])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    with Timer() as total:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    print(f'потоков: {args.threads}, попыток: {len(latencies)}')
+    print(f'создано счетов: {len(numbers)} за {total.elapsed:.3f} с, '
+          f'{len(numbers) / total.elapsed:.1f} счетов/с')
+    print(f'задержка p50={percentile(latencies, 50) * 1000:.1f}ms '
+          f'p95={percentile(latencies, 95) * 1000:.1f}ms '
+          f'p99={percentile(latencies, 99) * 1000:.1f}ms')
+    report_numbers(numbers)
+    for status, count in sorted(statuses.items()):
+        print(f'  {status}: {count}')
+
+
+def allocator_process(args, queue):
+    import mysql.connector
+    from seed import BENCH_DB_CONFIG
+
+    allocator = AccountNumberAllocator(lambda: mysql.connector.connect(**BENCH_DB_CONFIG),
+                                       block_size=args.block_size)
+    numbers = []
+    lock = threading.Lock()
+
+    def worker():
+        local = [allocator.allocate(args.prefix) for _ in range(args.per_thread)]
+        with lock:
+            numbers.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    with Timer() as t:
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+    queue.put((numbers, t.elapsed, allocator.stats()['reserved_blocks']))
+
+
+def run_allocator(args):
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=allocator_process, args=(args, queue))
+                 for _ in range(args.processes)]
+    with Timer() as total:
+        for p in processes:
+            p.start()
+        results = [queue.get() for _ in processes]
+        for p in processes:
+            p.join()
+
+    numbers = [n for result in results for n in result[0]]
+    blocks = sum(result[2] for result in results)
+    print(f'процессов: {args.processes}, потоков в каждом: {args.threads}, блок: {args.block_size}')
+    print(f'выдано номеров: {len(numbers)} за {total.elapsed:.3f} с, '
+          f'{len(numbers) / total.elapsed:.0f} номеров/с')
+    print(f'запросов к БД на резервирование: {blocks} '
+          f'({blocks / max(len(numbers), 1):.4f} на номер, без аллокатора - 1 на номер)')
+    report_numbers(numbers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Конкурентная выдача номеров счетов')
+    parser.add_argument('--mode', choices=('api', 'allocator'), default='api')
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--user', action='append', type=parse_user, default=[],
+                        help='телефон:пароль владельца счетов (можно несколько), для --mode api')
+    parser.add_argument('--type-id', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--per-thread', type=int, default=20)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--block-size', type=int, default=100)
+    parser.add_argument('--prefix', default='40817810')
+    args = parser.parse_args()
+
+    if args.mode == 'api':
+        if not args.user:
+            parser.error('для --mode api нужен хотя бы один --user')
+        run_api(args)
+    else:
+        run_allocator(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# Синхронный сервер против асинхронного на одной и той же смешанной нагрузке.
+#
+# Запустите оба сервера на базе из seed.py:
+#   cd api && python app.py                                          # :5000
+#   cd api && hypercorn app_async:asgi_app --bind 0.0.0.0:5001       # :5001
+# и выполните
+#   python api/bench/bench_async_vs_sync.py --users 10000 --clients 500 --duration 60
+#
+# Для асинхронного сервера в скобках - разница с синхронным.
+import argparse
+
+from loadtest import parse_mix, print_result, run
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Синхронный сервер против асинхронного')
+    parser.add_argument('--sync-url', default='http://localhost:5000')
+    parser.add_argument('--async-url', default='http://localhost:5001')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--phone-prefix', default='7990')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--mix', type=parse_mix,
+                        default='accounts=25,history=25,transfer_by_phone=15,flights=20,chat=15')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    results = {}
+    for name, url in (('sync', args.sync_url), ('async', args.async_url)):
+        args.base_url = url
+        print(f'== {name}: {url}')
+        results[name] = run(args)
+        print_result(results[name], results.get('sync') if name == 'async' else None)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Сравнение пакетного перевода с серией одиночных переводов.
+#
+# Запуск (сервер API должен быть запущен, со счета реально списываются деньги,
+# поэтому только на тестовой базе):
+#   python api/bench/bench_batch_transfer.py --phone 79990000001 --password password \
+#       --from-account 10 --recipient-phone 79990000002 --count 200
+import argparse
+
+from common import ApiClient, Timer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пакетный перевод против одиночных')
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--phone', required=True, help='телефон бизнес-клиента')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--from-account', type=int, required=True)
+    parser.add_argument('--recipient-phone', required=True)
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--amount', type=float, default=1.0)
+    args = parser.parse_args()
+
+    client = ApiClient(args.base_url)
+    client.login(args.phone, args.password)
+
+    with Timer() as single:
+        failed = 0
+        for _ in range(args.count):
+            status, _ = client.json('POST', '/api/transfer-by-phone', {
+                'from_account_id': args.from_account,
+                'recipient_phone': args.recipient_phone,
+                'amount': args.amount,
+            })
+            failed += status != 200
+    print(f'одиночные: {args.count} переводов за {single.elapsed:.3f} с, '
+          f'{args.count / single.elapsed:.1f} перев./с, ошибок: {failed}')
+
+    transfers = [{'recipient_phone': args.recipient_phone, 'amount': args.amount}
+                 for _ in range(args.count)]
+    with Timer() as batch:
+        status, data = client.json('POST', '/api/transfers/batch', {
+            'from_account_id': args.from_account,
+            'transfers': transfers,
+        })
+    if status != 200:
+        print(f'пакет отклонён: {status} {data}')
+        return
+    print(f'пакет:      {args.count} переводов за {batch.elapsed:.3f} с, '
+          f'{args.count / batch.elapsed:.1f} перев./с')
+    print(f'ускорение:  x{single.elapsed / batch.elapsed:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Конкурентная покупка авиабилетов: много покупателей одновременно
+# пытаются купить одни и те же места.
+#
+# Считает успешные покупки в секунду и "потерянные обновления":
+#   - повторные продажи одного места (больше одной успешной покупки на билет);
+#   - расхождение списаний со счетов с суммой цен купленных билетов.
+#
+# Запуск (места реально продаются, со счетов списываются деньги, поэтому
+# только на тестовой базе):
+#   python api/bench/bench_book_flight.py --tickets 20 --threads 32 \
+#       --buyer 79990000001:password:10 --buyer 79990000002:password:11
+import argparse
+import threading
+from decimal import Decimal
+
+from common import ApiClient, Timer, percentile
+
+
+def parse_buyer(value):
+    phone, password, account_id = value.rsplit(':', 2)
+    return phone, password, int(account_id)
+
+
+def account_balance(client, user_id, account_id):
+    status, accounts = client.json('GET', f'/api/user/{user_id}/accounts')
+    if status != 200:
+        raise RuntimeError(f'Не удалось получить счета: {status} {accounts}')
+    for account in accounts:
+        if account['account_id'] == account_id:
+            return Decimal(str(account['balance']))
+    raise RuntimeError(f'Счёт {account_id} не найден')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Конкурентная покупка авиабилетов')
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--buyer', action='append', type=parse_buyer, required=True,
+                        help='телефон:пароль:счёт покупателя (можно несколько)')
+    parser.add_argument('--tickets', type=int, default=20, help='сколько мест разыгрывать')
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+
+    buyers = []
+    for phone, password, account_id in args.buyer:
+        client = ApiClient(args.base_url)
+        user_id = client.login(phone, password)['user_id']
+        buyers.append({
+            'token': client.token,
+            'user_id': user_id,
+            'account_id': account_id,
+            'balance': account_balance(client, user_id, account_id),
+            'charged': Decimal('0'),
+        })
+
+    status, flights = ApiClient(args.base_url).json('GET', f'/api/flights?limit={args.tickets}')
+    if status != 200 or not flights:
+        print(f'нет доступных мест: {status}')
+        return
+    prices = {f['ticket_id']: Decimal(str(f['price'])) for f in flights}
+
+    lock = threading.Lock()
+    sold = {ticket_id: 0 for ticket_id in prices}
+    statuses = {}
+    latencies = []
+
+    # Каждый поток пытается купить все места по очереди от имени своего покупателя
+    def worker(index):
+        buyer = buyers[index % len(buyers)]
+        client = ApiClient(args.base_url, buyer['token'])
+        ticket_ids = list(prices)
+        offset = index % len(ticket_ids)
+        for ticket_id in ticket_ids[offset:] + ticket_ids[:offset]:
+            with Timer() as t:
+                status, _ = client.json('POST', '/api/flights/book', {
+                    'ticket_id': ticket_id,
+                    'account_id': buyer['account_id'],
+                })
+            with lock:
+                latencies.append(t.elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    sold[ticket_id] += 1
+                    buyer['charged'] += prices[ticket_id]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    with Timer() as total:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    successes = sum(sold.values())
+    double_sold = sum(count - 1 for count in sold.values() if count > 1)
+    balance_mismatches = 0
+    for buyer in buyers:
+        client = ApiClient(args.base_url, buyer['token'])
+        after = account_balance(client, buyer['user_id'], buyer['account_id'])
+        # Несколько покупателей могут делить один счёт - сравниваем по счёту
+        same_account = [b for b in buyers if b['account_id'] == buyer['account_id']]
+        if same_account[0] is buyer:
+            charged = sum((b['charged'] for b in same_account), Decimal('0'))
+            if buyer['balance'] - after != charged:
+                balance_mismatches += 1
+                print(f'счёт {buyer["account_id"]}: списано {buyer["balance"] - after}, '
+                      f'ожидалось {charged}')
+
+    print(f'мест: {len(prices)}, попыток: {len(latencies)}, потоков: {args.threads}')
+    print(f'успешных покупок: {successes} за {total.elapsed:.3f} с, '
+          f'{successes / total.elapsed:.1f} покупок/с')
+    print(f'задержка p50={percentile(latencies, 50) * 1000:.1f}ms '
+          f'p95={percentile(latencies, 95) * 1000:.1f}ms '
+          f'p99={percentile(latencies, 99) * 1000:.1f}ms')
+    print(f'потерянные обновления: повторных продаж {double_sold}, '
+          f'счетов с расхождением {balance_mismatches}')
+    for status, count in sorted(statuses.items()):
+        print(f'  {status}: {count}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Скорость сериализации списка строк истории транзакций: прежний путь
+# (serialize_datetime по каждой строке + стандартный провайдер Flask) против
+# FastJSONProvider. Сервер и база не нужны.
+#   python api/bench/bench_json.py --rows 100000
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from json_provider import FastJSONProvider, orjson  # noqa: E402
+from common import Timer  # noqa: E402
+
+
+def make_rows(count):
+    start = datetime(2024, 1, 1)
+    return [{
+        'transaction_id': i,
+        'transaction_uuid': f'00000000-0000-0000-0000-{i:012d}',
+        'from_account_id': i % 1000,
+        'to_account_id': (i + 1) % 1000,
+        'amount': Decimal(f'{i % 10000}.{i % 100:02d}'),
+        'transaction_date': start + timedelta(seconds=i),
+        'type_id': 1,
+        'category_id': 7,
+        'recipient_phone': None,
+        'type_name': 'Перевод',
+        'category_name': 'Переводы',
+    } for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сериализация больших JSON-ответов')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+
+    def legacy(rows):
+        prepared = []
+        for row in rows:
+            row = dict(row)
+            row['transaction_date'] = row['transaction_date'].isoformat()
+            prepared.append(row)
+        return default.dumps(prepared).encode('utf-8')
+
+    results = {}
+    for name, encode in (('до', legacy), ('FastJSONProvider', fast.dumps_bytes)):
+        best = None
+        for _ in range(args.repeat):
+            rows = make_rows(args.rows)
+            with Timer() as t:
+                encode(rows)
+            best = t.elapsed if best is None else min(best, t.elapsed)
+        results[name] = best
+        print(f'{name:18} {args.rows} строк за {best * 1000:.1f} мс')
+    print(f'orjson: {"да" if orjson else "нет"}, ускорение x{results["до"] / results["FastJSONProvider"]:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Задержка лёгких запросов на фоне пика входов в систему.
+#
+# Часть потоков непрерывно вызывает /api/login (bcrypt), остальные - лёгкое
+# чтение. Для сравнения "до/после" запустите сервер дважды:
+#   PASSWORD_HASH_WORKERS=0 python api/app.py   # bcrypt в потоке запроса
+#   python api/app.py                           # bcrypt в пуле процессов
+# и выполните
+#   python api/bench/bench_mixed_login.py --phone 79990000001 --password password
+import argparse
+import threading
+import time
+
+from common import ApiClient, percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Смешанная нагрузка: вход + чтение')
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--phone', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--read-threads', type=int, default=4)
+    parser.add_argument('--read-path', default='/api/flights')
+    parser.add_argument('--duration', type=float, default=20.0)
+    args = parser.parse_args()
+
+    deadline = time.monotonic() + args.duration
+    lock = threading.Lock()
+    latencies = {'login': [], 'read': []}
+    statuses = {}
+
+    def record(kind, elapsed, status):
+        with lock:
+            latencies[kind].append(elapsed)
+            statuses[(kind, status)] = statuses.get((kind, status), 0) + 1
+
+    def login_loop():
+        client = ApiClient(args.base_url)
+        body = {'phone': args.phone, 'password': args.password}
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            status, _, _ = client.request('POST', '/api/login', body)
+            record('login', time.perf_counter() - start, status)
+
+    def read_loop():
+        client = ApiClient(args.base_url)
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            status, _, _ = client.request('GET', args.read_path)
+            record('read', time.perf_counter() - start, status)
+
+    threads = [threading.Thread(target=login_loop) for _ in range(args.login_threads)]
+    threads += [threading.Thread(target=read_loop) for _ in range(args.read_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for kind, values in latencies.items():
+        print(f'{kind:6} n={len(values):6} rps={len(values) / args.duration:8.1f} '
+              f'p50={percentile(values, 50) * 1000:8.1f}ms '
+              f'p95={percentile(values, 95) * 1000:8.1f}ms '
+              f'p99={percentile(values, 99) * 1000:8.1f}ms')
+    for (kind, status), count in sorted(statuses.items()):
+        print(f'  {kind} {status}: {count}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# Общие функции для нагрузочных скриптов
+import json
+import time
+import urllib.error
+import urllib.request
+
+
+class ApiClient:
+    """Простой HTTP-клиент к API на стандартной библиотеке"""
+
+    def __init__(self, base_url, token=None):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+
+    def request(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        req.add_header('Content-Type', 'application/json')
+        if self.token:
+            req.add_header('Authorization', f'Bearer {self.token}')
+        for name, value in (headers or {}).items():
+            req.add_header(name, value)
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return resp.status, resp.read(), dict(resp.headers)
+        except urllib.error.HTTPError as err:
+            return err.code, err.read(), dict(err.headers)
+
+    def json(self, method, path, body=None, headers=None):
+        status, raw, _ = self.request(method, path, body, headers)
+        return status, (json.loads(raw) if raw else None)
+
+    def login(self, phone, password):
+        status, data = self.json('POST', '/api/login', {'phone': phone, 'password': password})
+        if status != 200:
+            raise RuntimeError(f'Не удалось войти как {phone}: {status} {data}')
+        self.token = data['token']
+        return data
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,231 @@
+# Нагрузочный тест API смешанной нагрузкой на базе из seed.py.
+#
+# Каждый виртуальный пользователь входит под своим телефоном из seed.py и в
+# цикле выполняет операции, выбирая их с весами --mix. В конце печатает
+# пропускную способность и p50/p95/p99 по каждой операции, а также среднее
+# число SQL-запросов на HTTP-запрос (по счётчику Questions сервера MySQL,
+# поэтому на базе не должно быть другой нагрузки).
+#
+# Запуск:
+#   python api/bench/loadtest.py --users 10000 --clients 32 --duration 60 \
+#       --save-baseline api/bench/baseline.json
+#   # после изменений - сравнение с сохранённым результатом
+#   python api/bench/loadtest.py --users 10000 --clients 32 --duration 60 \
+#       --baseline api/bench/baseline.json
+import argparse
+import json
+import random
+import threading
+import time
+
+import mysql.connector
+
+from common import ApiClient, percentile
+from seed import BENCH_DB_CONFIG, phone_for
+
+DEFAULT_MIX = 'login=2,accounts=20,history=20,transfer_by_phone=8,flights=25,chat=15,bonuses=10'
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'неизвестная операция {name}')
+        mix[name] = float(weight)
+    return mix
+
+
+class VirtualUser:
+    def __init__(self, base_url, phone, password, rng, phone_for_index):
+        self.client = ApiClient(base_url)
+        self.phone = phone
+        self.password = password
+        self.rng = rng
+        self.phone_for_index = phone_for_index
+        self.user_id = None
+        self.account_id = None
+        self.history_cursor = None
+
+    def login(self):
+        status, data = self.client.json('POST', '/api/login', {'phone': self.phone, 'password': self.password})
+        if status == 200:
+            self.client.token = data['token']
+            self.user_id = data['user_id']
+        return status
+
+    def accounts(self):
+        status, data = self.client.json('GET', f'/api/user/{self.user_id}/accounts')
+        if status == 200 and data:
+            self.account_id = data[0]['account_id']
+        return status
+
+    def history(self):
+        path = f'/api/user/{self.user_id}/transactions?limit=50'
+        # Половина запросов листает дальше, как при прокрутке истории
+        if self.history_cursor and self.rng.random() < 0.5:
+            path += '&after=' + self.history_cursor
+        status, _, headers = self.client.request('GET', path)
+        self.history_cursor = headers.get('X-Next-Cursor')
+        return status
+
+    def transfer_by_phone(self):
+        if self.account_id is None:
+            return self.accounts()
+        status, _ = self.client.json('POST', '/api/transfer-by-phone', {
+            'from_account_id': self.account_id,
+            'recipient_phone': self.phone_for_index(),
+            'amount': 1,
+        })
+        return status
+
+    def flights(self):
+        status, _, _ = self.client.request('GET', '/api/flights')
+        return status
+
+    def chat(self):
+        status, _, _ = self.client.request('GET', '/api/support/chat')
+        return status
+
+    def bonuses(self):
+        status, _, _ = self.client.request('GET', f'/api/user/{self.user_id}/bonuses')
+        return status
+
+
+OPERATIONS = {
+    'login': VirtualUser.login,
+    'accounts': VirtualUser.accounts,
+    'history': VirtualUser.history,
+    'transfer_by_phone': VirtualUser.transfer_by_phone,
+    'flights': VirtualUser.flights,
+    'chat': VirtualUser.chat,
+    'bonuses': VirtualUser.bonuses,
+}
+
+
+def questions_counter():
+    conn = mysql.connector.connect(**BENCH_DB_CONFIG)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        return int(cursor.fetchone()[1])
+    finally:
+        conn.close()
+
+
+def run(args):
+    mix = args.mix
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    lock = threading.Lock()
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    start_barrier = threading.Barrier(args.clients + 1)
+    stop = threading.Event()
+
+    def client_loop(index):
+        rng = random.Random(args.seed * 100003 + index)
+        user = VirtualUser(
+            args.base_url, phone_for(args.phone_prefix, rng.randrange(args.users)), args.password, rng,
+            lambda: phone_for(args.phone_prefix, rng.randrange(args.users))
+        )
+        # Вход и первый запрос счетов - прогрев, в замеры не входят
+        user.login()
+        user.accounts()
+        start_barrier.wait()
+        while not stop.is_set():
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            status = OPERATIONS[name](user)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies[name].append(elapsed)
+                if status >= 400:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=client_loop, args=(i,), daemon=True) for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    start_barrier.wait()
+    questions_before = questions_counter()
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    # Два запроса SHOW STATUS самого замера
+    questions = questions_counter() - questions_before - 2
+
+    total = sum(len(v) for v in latencies.values())
+    result = {
+        'duration': elapsed,
+        'clients': args.clients,
+        'requests': total,
+        'throughput': total / elapsed,
+        'queries_per_request': questions / total if total else 0.0,
+        'endpoints': {},
+    }
+    for name in names:
+        values = latencies[name]
+        result['endpoints'][name] = {
+            'requests': len(values),
+            'errors': errors[name],
+            'throughput': len(values) / elapsed,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+        }
+    return result
+
+
+def print_result(result, baseline=None):
+    def diff(current, previous):
+        if not previous:
+            return ''
+        return f' ({(current - previous) / previous * 100:+.0f}%)'
+
+    base_endpoints = baseline['endpoints'] if baseline else {}
+    print(f'запросов: {result["requests"]} за {result["duration"]:.1f} с, клиентов: {result["clients"]}')
+    print(f'пропускная способность: {result["throughput"]:.1f} rps'
+          + diff(result['throughput'], baseline and baseline['throughput']))
+    print(f'SQL-запросов на HTTP-запрос: {result["queries_per_request"]:.2f}'
+          + diff(result['queries_per_request'], baseline and baseline['queries_per_request']))
+    print(f'{"операция":18} {"n":>7} {"ошибок":>7} {"rps":>8} {"p50 мс":>16} {"p95 мс":>16} {"p99 мс":>16}')
+    for name, ep in result['endpoints'].items():
+        base = base_endpoints.get(name, {})
+        print(f'{name:18} {ep["requests"]:7} {ep["errors"]:7} {ep["throughput"]:8.1f} '
+              f'{ep["p50_ms"]:8.1f}{diff(ep["p50_ms"], base.get("p50_ms")):>8} '
+              f'{ep["p95_ms"]:8.1f}{diff(ep["p95_ms"], base.get("p95_ms")):>8} '
+              f'{ep["p99_ms"]:8.1f}{diff(ep["p99_ms"], base.get("p99_ms")):>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест API смешанной нагрузкой')
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--users', type=int, default=10000, help='сколько пользователей создал seed.py')
+    parser.add_argument('--phone-prefix', default='7990')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help=f'веса операций, по умолчанию {DEFAULT_MIX}')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save-baseline', help='сохранить результат в JSON')
+    parser.add_argument('--baseline', help='сравнить с сохранённым результатом')
+    args = parser.parse_args()
+
+    result = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_result(result, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f'результат сохранён в {args.save_baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+# Генератор синтетических данных для нагрузочного тестирования.
+#
+# Заполняет ОТДЕЛЬНУЮ локальную базу пользователями, счетами, историей
+# транзакций, авиабилетами, тикетами и сообщениями поддержки. Данные
+# детерминированы (--seed), поэтому прогоны на разных машинах сравнимы.
+#
+# Локальная база: MySQL 8 со схемой приложения и миграциями api/sql/*.sql,
+# например в контейнере
+#   docker run -d --name mbapp-bench -p 3306:3306 -e MYSQL_ROOT_PASSWORD=1234 \
+#       -e MYSQL_DATABASE=mbapp_bench -e MYSQL_USER=flutter_user -e MYSQL_PASSWORD=1234 mysql:8
+# Подключение задаётся переменными BENCH_DB_HOST, BENCH_DB_USER,
+# BENCH_DB_PASSWORD, BENCH_DB_NAME.
+#
+# Запуск:
+#   python api/bench/seed.py --users 10000 --transactions 2000000 --flights 2000
+#
+# Все пользователи получают пароль --password и телефоны
+# <--phone-prefix><номер по порядку>; эти же параметры принимает loadtest.py.
+# Чтобы вход не пересчитывал хеши, запускайте сервер с теми же схемой и
+# стоимостью: PASSWORD_SCHEME=bcrypt PASSWORD_HASH_COST=10.
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from account_numbers import AccountNumberAllocator, BUSINESS_ACCOUNT_PREFIX, CURRENT_ACCOUNT_PREFIX  # noqa: E402
+from activity_rollup import rebuild as rebuild_activity_rollup  # noqa: E402
+from passwords import SCHEMES  # noqa: E402
+from support_queue import rebuild_counters  # noqa: E402
+
+BENCH_DB_CONFIG = {
+    'host': os.environ.get('BENCH_DB_HOST', 'localhost'),
+    'user': os.environ.get('BENCH_DB_USER', 'flutter_user'),
+    'password': os.environ.get('BENCH_DB_PASSWORD', '1234'),
+    'database': os.environ.get('BENCH_DB_NAME', 'mbapp_bench'),
+}
+
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Сочи', 'Екатеринбург',
+          'Новосибирск', 'Калининград', 'Владивосток', 'Самара', 'Уфа']
+AIRLINES = ['Аэрофлот', 'S7', 'Победа', 'Уральские авиалинии', 'Россия']
+FIRST_NAMES = ['Иван', 'Анна', 'Пётр', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Елена']
+LAST_NAMES = ['Иванов', 'Петрова', 'Сидоров', 'Кузнецова', 'Смирнов', 'Попова']
+
+
+def phone_for(prefix, index):
+    return f'{prefix}{index:07d}'
+
+
+def insert_chunks(conn, sql, rows, chunk_size, label):
+    """Вставка пачками с фиксацией после каждой; возвращает число строк"""
+    cursor = conn.cursor()
+    total = 0
+    started = time.monotonic()
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            cursor.executemany(sql, batch)
+            conn.commit()
+            total += len(batch)
+            batch = []
+            print(f'\r{label}: {total} ({total / (time.monotonic() - started):.0f}/с)', end='', flush=True)
+    if batch:
+        cursor.executemany(sql, batch)
+        conn.commit()
+        total += len(batch)
+    print(f'\r{label}: {total} за {time.monotonic() - started:.1f} с' + ' ' * 10)
+    cursor.close()
+    return total
+
+
+def fetch_ids(conn, sql, params=()):
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return ids
+
+
+def seed(args):
+    rng = random.Random(args.seed)
+    conn = mysql.connector.connect(**BENCH_DB_CONFIG)
+    now = datetime.now()
+
+    # Один хеш на всех: хеширование миллионов паролей не входит в задачу генератора
+    password_hash = SCHEMES[args.hash_scheme].hash(args.password, args.hash_cost)
+
+    def users():
+        for i in range(args.users):
+            business = rng.random() < args.business_share
+            yield (phone_for(args.phone_prefix, i), password_hash,
+                   rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                   (now - timedelta(days=rng.randint(18 * 365, 70 * 365))).date(),
+                   'business' if business else 'individual', rng.randint(1, 5) if business else None)
+
+    insert_chunks(
+        conn,
+        'INSERT INTO users (phone_number, password_hash, first_name, last_name, birth_date, '
+        'user_type, history_type, role_id) VALUES (%s, %s, %s, %s, %s, %s, %s, 1)',
+        users(), args.chunk_size, 'пользователи'
+    )
+    user_ids = fetch_ids(
+        conn, 'SELECT user_id FROM users WHERE phone_number LIKE %s ORDER BY user_id',
+        (args.phone_prefix + '%',)
+    )
+
+    # Номера из тех же последовательностей, что и у сервера: один блок на всех
+    numbers = AccountNumberAllocator(lambda: mysql.connector.connect(**BENCH_DB_CONFIG),
+                                     block_size=max(len(user_ids), 1))
+
+    def accounts():
+        for user_id in user_ids:
+            yield (numbers.allocate(CURRENT_ACCOUNT_PREFIX), user_id, 1, rng.randint(10000, 1000000))
+            if rng.random() < args.second_account_share:
+                yield (numbers.allocate(BUSINESS_ACCOUNT_PREFIX), user_id, 5, rng.randint(0, 100000))
+
+    insert_chunks(
+        conn,
+        'INSERT INTO accounts (account_number, user_id, type_id, balance) VALUES (%s, %s, %s, %s)',
+        accounts(), args.chunk_size, 'счета'
+    )
+    account_ids = fetch_ids(
+        conn,
+        'SELECT a.account_id FROM accounts a JOIN users u ON u.user_id = a.user_id '
+        'WHERE u.phone_number LIKE %s ORDER BY a.account_id',
+        (args.phone_prefix + '%',)
+    )
+    category_ids = fetch_ids(conn, 'SELECT category_id FROM transaction_categories') or [None]
+
+    # Даты растут вместе с id, как в рабочей базе
+    span = timedelta(days=args.history_days)
+    step = span / max(args.transactions, 1)
+
+    def transactions():
+        for i in range(args.transactions):
+            kind = rng.random()
+            date = now - span + step * i
+            amount = round(rng.uniform(10, 5000), 2)
+            if kind < 0.7:
+                from_id, to_id = rng.sample(account_ids, 2)
+                yield (str(uuid.UUID(int=rng.getrandbits(128))), from_id, to_id, amount, 1,
+                       rng.choice(category_ids), None, date)
+            elif kind < 0.85:
+                yield (str(uuid.UUID(int=rng.getrandbits(128))), rng.choice(account_ids), None, amount, 2,
+                       rng.choice(category_ids), None, date)
+            else:
+                yield (str(uuid.UUID(int=rng.getrandbits(128))), None, rng.choice(account_ids), amount, 3,
+                       None, None, date)
+
+    if len(account_ids) >= 2:
+        insert_chunks(
+            conn,
+            'INSERT INTO transactions (transaction_uuid, from_account_id, to_account_id, amount, '
+            'type_id, category_id, recipient_phone, transaction_date) '
+            'VALUES (%s, %s, %s, %s, %s, %s, %s, %s)',
+            transactions(), args.chunk_size, 'транзакции'
+        )
+
+    def flights():
+        for _ in range(args.flights):
+            departure, arrival = rng.sample(CITIES, 2)
+            departure_time = now + timedelta(hours=rng.randint(1, 24 * 90))
+            yield (departure, arrival, departure_time,
+                   departure_time + timedelta(minutes=rng.randint(60, 600)),
+                   rng.randint(2000, 40000), rng.choice(AIRLINES), 1)
+
+    insert_chunks(
+        conn,
+        'INSERT INTO air_tickets (departure_city, arrival_city, departure_time, arrival_time, '
+        'price, airline, is_available) VALUES (%s, %s, %s, %s, %s, %s, %s)',
+        flights(), args.chunk_size, 'авиабилеты'
+    )
+
+    def tickets():
+        for i in range(args.tickets):
+            answered = rng.random() < 0.6
+            yield (rng.choice(user_ids), f'Обращение {i}', 'Текст обращения', int(answered),
+                   now - timedelta(minutes=rng.randint(1, args.history_days * 24 * 60)))
+
+    insert_chunks(
+        conn,
+        'INSERT INTO support_tickets (user_id, subject, message_text, is_answered, created_at) '
+        'VALUES (%s, %s, %s, %s, %s)',
+        tickets(), args.chunk_size, 'тикеты'
+    )
+
+    def messages():
+        for _ in range(args.chat_messages):
+            yield (rng.choice(user_ids), 'Сообщение в поддержку',
+                   now - timedelta(minutes=rng.randint(1, args.history_days * 24 * 60)))
+
+    insert_chunks(
+        conn,
+        'INSERT INTO support_messages (user_id, employee_id, message_text, send_time, is_read, is_answered) '
+        'VALUES (%s, 0, %s, %s, 0, 0)',
+        messages(), args.chunk_size, 'сообщения чата'
+    )
+
+    print('Пересчёт сводок...')
+    rebuild_activity_rollup(conn)
+    rebuild_counters(conn)
+    conn.close()
+    print('Готово')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Синтетические данные для нагрузочных тестов')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--business-share', type=float, default=0.1)
+    parser.add_argument('--second-account-share', type=float, default=0.3)
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--history-days', type=int, default=365)
+    parser.add_argument('--flights', type=int, default=2000)
+    parser.add_argument('--tickets', type=int, default=20000)
+    parser.add_argument('--chat-messages', type=int, default=50000)
+    parser.add_argument('--phone-prefix', default='7990')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--hash-scheme', default='bcrypt')
+    parser.add_argument('--hash-cost', type=int, default=10)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    seed(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
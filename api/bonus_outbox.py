@@ -0,0 +1,182 @@
+# Отложенное начисление бонусов.
+# Денежная транзакция только добавляет строку в bonus_accrual_outbox и не
+# трогает строку users. Фоновый обработчик забирает очередь пачками,
+# объединяет начисления одного пользователя в одно обновление баланса и
+# переносит их в bonus_operations.
+import threading
+from decimal import Decimal
+
+import mysql.connector
+
+from activity_rollup import ActivityDelta
+from delta_sync import ChangeLog
+
+
+ENQUEUE_SQL = 'INSERT INTO bonus_accrual_outbox (user_id, amount, description) VALUES (%s, %s, %s)'
+
+# Бонус за перевод - 0.5% от суммы (половина комиссии 1%)
+TRANSFER_BONUS_RATE = Decimal('0.005')
+
+
+def transfer_bonus(amount):
+    """Бонус за перевод в Decimal, округлённый до копеек; один расчёт
+    для одиночного, пакетного перевода и перевода по телефону"""
+    return (Decimal(str(amount)) * TRANSFER_BONUS_RATE).quantize(Decimal('0.01'))
+
+
+def enqueue_accruals(cursor, rows):
+    """rows: [(user_id, amount, description), ...]"""
+    if rows:
+        cursor.executemany(ENQUEUE_SQL, rows)
+
+
+def pending_total(cursor, user_id):
+    cursor.execute(
+        'SELECT COALESCE(SUM(amount), 0) AS pending FROM bonus_accrual_outbox WHERE user_id = %s',
+        (user_id,)
+    )
+    return cursor.fetchone()['pending']
+
+
+def pending_operations(cursor, user_id):
+    cursor.execute('''
+        SELECT outbox_id, user_id, amount, 'accrual' AS operation_type, description,
+               created_at AS operation_date, 1 AS pending
+        FROM bonus_accrual_outbox
+        WHERE user_id = %s
+        ORDER BY outbox_id DESC
+    ''', (user_id,))
+    return cursor.fetchall()
+
+
+def _settle(cursor, rows, changes):
+    if not rows:
+        return
+    totals = {}
+    for row in rows:
+        totals[row['user_id']] = totals.get(row['user_id'], 0) + row['amount']
+    user_ids = sorted(totals)
+
+    # Одно обновление на всю пачку: по строке users на пользователя
+    cases = ' '.join(['WHEN %s THEN %s'] * len(user_ids))
+    params = []
+    for user_id in user_ids:
+        params.extend([user_id, totals[user_id]])
+    params.extend(user_ids)
+    cursor.execute(
+        f'UPDATE users SET bonus_balance = bonus_balance + CASE user_id {cases} END '
+        f'WHERE user_id IN ({", ".join(["%s"] * len(user_ids))})',
+        tuple(params)
+    )
+
+    # Строки users заблокированы, новых операций этих пользователей до
+    # коммита не появится: всё, что выше last_id, вставлено этой пачкой
+    in_users = ', '.join(['%s'] * len(user_ids))
+    cursor.execute(
+        f'SELECT COALESCE(MAX(operation_id), 0) AS last_id FROM bonus_operations WHERE user_id IN ({in_users})',
+        tuple(user_ids)
+    )
+    last_id = cursor.fetchone()['last_id']
+    cursor.executemany(
+        'INSERT INTO bonus_operations (user_id, amount, operation_type, description, operation_date) '
+        'VALUES (%s, %s, \'accrual\', %s, %s)',
+        [(r['user_id'], r['amount'], r['description'], r['created_at']) for r in rows]
+    )
+    cursor.execute(
+        f'SELECT operation_id, user_id FROM bonus_operations '
+        f'WHERE user_id IN ({in_users}) AND operation_id > %s ORDER BY operation_id',
+        (*user_ids, last_id)
+    )
+    for op in cursor.fetchall():
+        changes.add(op['user_id'], 'bonus_operations', op['operation_id'])
+    for user_id in user_ids:
+        changes.touch(user_id, 'users')
+
+    activity = ActivityDelta()
+    for user_id in user_ids:
+        activity.add(user_id, bonus=totals[user_id])
+    activity.apply(cursor)
+
+    outbox_ids = [r['outbox_id'] for r in rows]
+    cursor.execute(
+        f'DELETE FROM bonus_accrual_outbox WHERE outbox_id IN ({", ".join(["%s"] * len(outbox_ids))})',
+        tuple(outbox_ids)
+    )
+
+
+def drain_batch(conn, batch_size=500):
+    """Переносит одну пачку начислений; возвращает число обработанных строк"""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # SKIP LOCKED позволяет нескольким обработчикам работать одновременно
+        cursor.execute(
+            'SELECT outbox_id, user_id, amount, description, created_at '
+            'FROM bonus_accrual_outbox ORDER BY outbox_id LIMIT %s FOR UPDATE SKIP LOCKED',
+            (batch_size,)
+        )
+        rows = cursor.fetchall()
+        changes = ChangeLog()
+        _settle(cursor, rows, changes)
+        changes.apply(cursor)
+        conn.commit()
+        return len(rows)
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def settle_user(cursor, user_id, changes):
+    """Переносит все начисления пользователя в текущей транзакции
+    (перед списанием бонусов, чтобы были доступны все начисленные);
+    изменения для журнала синхронизации добавляются в changes"""
+    cursor.execute(
+        'SELECT outbox_id, user_id, amount, description, created_at '
+        'FROM bonus_accrual_outbox WHERE user_id = %s ORDER BY outbox_id FOR UPDATE',
+        (user_id,)
+    )
+    _settle(cursor, cursor.fetchall(), changes)
+
+
+class BonusOutboxWorker(threading.Thread):
+    """Фоновый поток, периодически разбирающий очередь начислений"""
+
+    def __init__(self, connect, interval=1.0, batch_size=500):
+        super().__init__(name='bonus-outbox-worker', daemon=True)
+        self._connect = connect
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop_event = threading.Event()
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                conn = self._connect()
+                try:
+                    while not self._stop_event.is_set():
+                        count = drain_batch(conn, self.batch_size)
+                        if count:
+                            self.processed += count
+                            self.batches += 1
+                        if count < self.batch_size:
+                            break
+                finally:
+                    conn.close()
+            except mysql.connector.Error:
+                self.errors += 1
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        return {
+            'running': self.is_alive(),
+            'processed': self.processed,
+            'batches': self.batches,
+            'errors': self.errors,
+        }
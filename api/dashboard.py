@@ -0,0 +1,96 @@
+# Сводка для главного экрана мобильного приложения: профиль, активные счета,
+# последние транзакции, бонусный баланс и настройки одним ответом.
+# SQL и сборка ответа общие для синхронного (app.py) и асинхронного
+# (app_async.py) серверов; выполнение запросов остаётся за ними.
+#
+# ?fields= выбирает разделы и поля: "profile,accounts" - только эти разделы
+# целиком, "transactions.amount,transactions.transaction_date" - раздел
+# transactions только с этими полями. Без fields отдаются все разделы.
+
+DASHBOARD_SECTIONS = ('profile', 'accounts', 'transactions', 'bonuses', 'settings')
+
+# Профиль и бонусный баланс одним запросом: начисления, ещё не перенесённые
+# из очереди bonus_accrual_outbox, входят в баланс, как в /bonuses
+PROFILE_SQL = '''
+    SELECT u.*, r.role_name,
+           (SELECT COALESCE(SUM(o.amount), 0) FROM bonus_accrual_outbox o
+            WHERE o.user_id = u.user_id) AS pending_bonus
+    FROM users u
+    JOIN user_roles r ON u.role_id = r.role_id
+    WHERE u.user_id = %s
+'''
+
+# Все счета: закрытые не попадают в ответ, но их переводы есть в истории
+ACCOUNTS_SQL = 'SELECT * FROM accounts WHERE user_id = %s'
+
+SETTINGS_SQL = 'SELECT * FROM app_settings WHERE user_id = %s'
+
+
+def parse_fields(value):
+    """Разбор ?fields=: {раздел: множество полей или None (все поля)}.
+    ValueError на неизвестный раздел"""
+    if not value:
+        return {section: None for section in DASHBOARD_SECTIONS}
+    selected = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        section, _, field = item.partition('.')
+        if section not in DASHBOARD_SECTIONS:
+            raise ValueError(f'Unknown dashboard section: {section}')
+        if not field:
+            selected[section] = None
+        elif section not in selected:
+            selected[section] = {field}
+        elif selected[section] is not None:
+            selected[section].add(field)
+    return selected
+
+
+def project(row, fields):
+    if row is None or fields is None:
+        return row
+    return {key: value for key, value in row.items() if key in fields}
+
+
+class DashboardPlan:
+    """Какие запросы нужны для выбранных разделов.
+
+    fields  -- результат parse_fields
+    private -- отдавать ли bonuses и settings (только самому пользователю,
+               как /bonuses и /settings)
+    """
+
+    def __init__(self, fields, private=True):
+        if not private:
+            fields = {s: f for s, f in fields.items() if s not in ('bonuses', 'settings')}
+        self.fields = fields
+        self.needs_profile = 'profile' in fields or 'bonuses' in fields
+        self.needs_accounts = 'accounts' in fields or 'transactions' in fields
+        self.needs_transactions = 'transactions' in fields
+        self.needs_settings = 'settings' in fields
+
+    def build(self, profile=None, accounts=None, transactions=None, next_cursor=None, settings=None,
+              sync_token=None):
+        """Ответ из прочитанных строк; строки счетов и транзакций уже
+        дополнены справочниками (prepare_account_row / prepare_transaction_row).
+        sync_token - начальный токен для /sync, прочитанный до данных"""
+        fields = self.fields
+        result = {'sync_token': sync_token}
+        if 'profile' in fields:
+            public = None
+            if profile is not None:
+                public = {k: v for k, v in profile.items() if k not in ('password_hash', 'pending_bonus')}
+            result['profile'] = project(public, fields['profile'])
+        if 'accounts' in fields:
+            result['accounts'] = [project(acc, fields['accounts']) for acc in accounts or () if acc['is_active']]
+        if 'transactions' in fields:
+            result['transactions'] = [project(tr, fields['transactions']) for tr in transactions or ()]
+            result['transactions_cursor'] = next_cursor
+        if 'bonuses' in fields:
+            balance = profile['bonus_balance'] + profile['pending_bonus'] if profile else None
+            result['bonuses'] = project({'balance': balance}, fields['bonuses'])
+        if 'settings' in fields:
+            result['settings'] = project(settings, fields['settings'])
+        return result
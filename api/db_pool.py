@@ -0,0 +1,203 @@
+# Пул соединений с MySQL
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+
+
+class PoolTimeoutError(PoolError):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
+class PooledConnection:
+    """Обёртка над соединением: close() возвращает соединение в пул"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        if self._pool.cursor_wrapper is not None:
+            cursor = self._pool.cursor_wrapper(cursor)
+        return cursor
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool._checkin(self._raw)
+
+    def is_connected(self):
+        return not self._released and self._raw.is_connected()
+
+
+class ConnectionPool:
+    """Пул соединений с ограничением размера, overflow и проверкой при выдаче.
+
+    size         -- число постоянно удерживаемых соединений
+    max_overflow -- сколько временных соединений можно открыть сверх size
+    timeout      -- сколько секунд ждать свободное соединение
+    recycle      -- через сколько секунд простоя соединение пересоздаётся
+    pre_ping     -- проверять соединение перед выдачей
+    cursor_wrapper -- функция, оборачивающая каждый созданный курсор (метрики)
+    """
+
+    def __init__(self, db_config, size=10, max_overflow=10, timeout=5.0,
+                 recycle=1800, pre_ping=True, cursor_wrapper=None):
+        self._db_config = dict(db_config)
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.cursor_wrapper = cursor_wrapper
+
+        self._idle = deque()  # (соединение, время возврата в пул)
+        self._opened = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._ping_failures = 0
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self._db_config)
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except mysql.connector.Error:
+            pass
+        with self._cond:
+            self._opened -= 1
+            self._cond.notify()
+
+    def _is_usable(self, raw, idle_since):
+        if self.recycle is not None and time.monotonic() - idle_since > self.recycle:
+            with self._cond:
+                self._recycled += 1
+            return False
+        if self.pre_ping:
+            try:
+                raw.ping(reconnect=False)
+            except mysql.connector.Error:
+                with self._cond:
+                    self._ping_failures += 1
+                return False
+        return True
+
+    def acquire(self):
+        deadline = None
+        waited_from = None
+        while True:
+            with self._cond:
+                if self._idle:
+                    raw, idle_since = self._idle.pop()
+                    self._in_use += 1
+                elif self._opened < self.size + self.max_overflow:
+                    raw, idle_since = None, None
+                    self._opened += 1
+                    self._in_use += 1
+                else:
+                    if deadline is None:
+                        deadline = time.monotonic() + self.timeout
+                        waited_from = time.monotonic()
+                        self._waits += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        self._wait_time += time.monotonic() - waited_from
+                        raise PoolTimeoutError(
+                            msg=f'Нет свободных соединений с БД за {self.timeout} с')
+                    self._cond.wait(remaining)
+                    continue
+                self._checkouts += 1
+                if waited_from is not None:
+                    self._wait_time += time.monotonic() - waited_from
+
+            if raw is not None and self._is_usable(raw, idle_since):
+                return PooledConnection(self, raw)
+
+            if raw is not None:
+                # Соединение устарело или не отвечает - пересоздаём на том же слоте
+                try:
+                    raw.close()
+                except mysql.connector.Error:
+                    pass
+            try:
+                return PooledConnection(self, self._connect())
+            except mysql.connector.Error:
+                with self._cond:
+                    self._opened -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+
+    def _checkin(self, raw):
+        try:
+            # Откатываем незавершённую транзакцию и дочитываем результаты
+            raw.rollback()
+        except mysql.connector.Error:
+            with self._cond:
+                self._in_use -= 1
+            self._discard(raw)
+            return
+        with self._cond:
+            self._in_use -= 1
+            if len(self._idle) >= self.size:
+                overflow = True
+            else:
+                overflow = False
+                self._idle.append((raw, time.monotonic()))
+                self._cond.notify()
+        if overflow:
+            self._discard(raw)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'opened': self._opened,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time_total': round(self._wait_time, 6),
+                'wait_time_avg': round(self._wait_time / self._waits, 6) if self._waits else 0.0,
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'recycled': self._recycled,
+                'ping_failures': self._ping_failures,
+            }
+
+
+class ScopedConnection(PooledConnection):
+    """Соединение, общее для всего запроса: close() ничего не делает,
+    в пул соединение возвращает release() по завершении запроса"""
+
+    def __init__(self, pooled):
+        super().__init__(pooled._pool, pooled._raw)
+
+    def close(self):
+        pass
+
+    def is_connected(self):
+        return self._raw.is_connected()
+
+    def release(self):
+        PooledConnection.close(self)
@@ -0,0 +1,285 @@
+# Дельта-синхронизация для мобильного клиента (GET /api/user/<id>/sync?since=).
+#
+# Каждое изменение строк accounts, transactions, bonus_operations,
+# support_tickets и app_settings записывается в sync_changes под очередной
+# версией пользователя-владельца (ChangeLog ниже, в той же транзакции).
+# Версия берётся из строки sync_versions, заблокированной до конца
+# транзакции, поэтому для одного пользователя версии фиксируются строго по
+# возрастанию: клиент с токеном N не пропустит изменение с версией <= N, даже
+# если оно ещё не было закоммичено в момент прошлой синхронизации.
+#
+# Исключение - получатель перевода: его записи журнала и версии ресурсов
+# перевод только добавляет в очередь sync_change_outbox, а версию выдаёт
+# фоновый обработчик (sync_outbox.py). Иначе переводы популярному
+# получателю снова ждали бы друг друга на его строках sync_versions и
+# resource_versions, пока держат блокировки счетов. Получатель видит перевод
+# в /sync и новый ETag счетов через интервал обработчика.
+#
+# Клиент получает начальный токен из /dashboard (sync_token) и дальше
+# запрашивает только изменения после него. Старые записи журнала удаляются
+# (prune); если токен старше удалённой части, ответ 410 и клиент
+# перечитывает данные целиком.
+
+# entity в sync_changes -> запрос строк по id (владелец проверяется ещё раз)
+ENTITY_QUERIES = {
+    'accounts': 'SELECT * FROM accounts WHERE user_id = %s AND account_id IN ({ids})',
+    'transactions': '''
+        SELECT t.*,
+               a_from.account_number AS from_account_number,
+               a_to.account_number AS to_account_number
+        FROM transactions t
+        LEFT JOIN accounts a_from ON t.from_account_id = a_from.account_id
+        LEFT JOIN accounts a_to ON t.to_account_id = a_to.account_id
+        WHERE (a_from.user_id = %s OR a_to.user_id = %s) AND t.transaction_id IN ({ids})
+    ''',
+    'bonus_operations': 'SELECT * FROM bonus_operations WHERE user_id = %s AND operation_id IN ({ids})',
+    'support_tickets': 'SELECT * FROM support_tickets WHERE user_id = %s AND ticket_id IN ({ids})',
+}
+
+ENTITY_KEYS = {
+    'accounts': 'account_id',
+    'transactions': 'transaction_id',
+    'bonus_operations': 'operation_id',
+    'support_tickets': 'ticket_id',
+}
+
+VERSION_SQL = 'SELECT version, pruned_version FROM sync_versions WHERE user_id = %s'
+
+CHANGES_SQL = '''
+    SELECT version, entity, entity_id FROM sync_changes
+    WHERE user_id = %s AND version > %s
+    ORDER BY version
+    LIMIT %s
+'''
+
+BONUS_BALANCE_SQL = '''
+    SELECT u.bonus_balance
+           + (SELECT COALESCE(SUM(o.amount), 0) FROM bonus_accrual_outbox o
+              WHERE o.user_id = u.user_id) AS balance
+    FROM users u
+    WHERE u.user_id = %s
+'''
+
+
+# Версии выдаются блоком на все изменения пользователя в транзакции;
+# LAST_INSERT_ID(expr) возвращает верхнюю границу блока в lastrowid
+BUMP_SYNC_VERSION_SQL = '''
+    INSERT INTO sync_versions (user_id, version) VALUES (%s, LAST_INSERT_ID(%s))
+    ON DUPLICATE KEY UPDATE version = LAST_INSERT_ID(version + %s)
+'''
+
+INSERT_CHANGE_SQL = 'INSERT INTO sync_changes (user_id, version, entity, entity_id) VALUES (%s, %s, %s, %s)'
+
+# Отложенные изменения получателей переводов; entity_id NULL - только
+# версия ресурса (ChangeLog.touch)
+ENQUEUE_CHANGE_SQL = 'INSERT INTO sync_change_outbox (user_id, entity, entity_id) VALUES (%s, %s, %s)'
+
+# Версии ресурсов для ETag (см. resource_versions.py)
+BUMP_RESOURCE_VERSION_SQL = '''
+    INSERT INTO resource_versions (user_id, resource, version) VALUES (%s, %s, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1
+'''
+
+
+class ChangeLog:
+    """Накопитель изменений строк пользователей в рамках одной транзакции:
+    записи журнала sync_changes и версии ресурсов resource_versions.
+
+    apply вызывается последним шагом транзакции, после блокировки счетов и
+    всех остальных записей. Строки sync_versions, затем resource_versions
+    блокируются в порядке user_id, поэтому переводы между разными парами
+    пользователей не ждут друг друга по кругу (как при блокировке в порядке
+    изменения строк). Изменения отложенных пользователей (defer) apply
+    только добавляет в sync_change_outbox"""
+
+    def __init__(self):
+        self._entries = {}      # user_id -> [(entity, entity_id)]
+        self._resources = set()  # (user_id, resource)
+        self._deferred = set()
+        self._payers = set()    # плательщики переводов не откладываются
+
+    def add(self, user_id, entity, entity_id):
+        """Изменена строка entity; поднимает и версию ресурса entity"""
+        if user_id is None:
+            return
+        entries = self._entries.setdefault(user_id, [])
+        if (entity, entity_id) not in entries:
+            entries.append((entity, entity_id))
+        self._resources.add((user_id, entity))
+
+    def touch(self, user_id, resource):
+        """Только версия ресурса, без записи в журнал: профиль (users),
+        ожидающие начисления (bonus_operations), чат (support_messages)"""
+        if user_id is not None:
+            self._resources.add((user_id, resource))
+
+    def defer(self, user_id):
+        """Изменения пользователя пишутся через очередь sync_change_outbox,
+        без блокировки его строк sync_versions и resource_versions"""
+        if user_id is not None:
+            self._deferred.add(user_id)
+
+    def add_transfer(self, transaction_id, from_owner, from_account_id, to_owner, to_account_id):
+        """Перевод: оба счёта и транзакция в журналах обоих владельцев.
+        Изменения получателя другого пользователя откладываются (defer)"""
+        self.add(from_owner, 'accounts', from_account_id)
+        self.add(to_owner, 'accounts', to_account_id)
+        self.add(from_owner, 'transactions', transaction_id)
+        self.add(to_owner, 'transactions', transaction_id)
+        if from_owner is not None:
+            self._payers.add(from_owner)
+            if to_owner != from_owner:
+                self.defer(to_owner)
+
+    def deferred_users(self):
+        return self._deferred - self._payers
+
+    def version_rows(self):
+        """[(user_id, число изменений)] в порядке блокировки"""
+        deferred = self.deferred_users()
+        return [(user_id, len(entries)) for user_id, entries in sorted(self._entries.items())
+                if user_id not in deferred]
+
+    def change_rows(self, user_id, last_version):
+        """Строки sync_changes пользователя; last_version - верх выданного блока"""
+        entries = self._entries[user_id]
+        first = last_version - len(entries) + 1
+        return [(user_id, first + i, entity, entity_id) for i, (entity, entity_id) in enumerate(entries)]
+
+    def resource_rows(self):
+        deferred = self.deferred_users()
+        return sorted(r for r in self._resources if r[0] not in deferred)
+
+    def outbox_rows(self):
+        """Строки sync_change_outbox отложенных пользователей: записи журнала,
+        затем ресурсы без записей"""
+        rows = []
+        for user_id in sorted(self.deferred_users()):
+            entries = self._entries.get(user_id, [])
+            rows.extend((user_id, entity, entity_id) for entity, entity_id in entries)
+            logged = {entity for entity, _ in entries}
+            rows.extend((user_id, resource, None) for uid, resource in sorted(self._resources)
+                        if uid == user_id and resource not in logged)
+        return rows
+
+    def apply(self, cursor):
+        changes = []
+        for user_id, count in self.version_rows():
+            cursor.execute(BUMP_SYNC_VERSION_SQL, (user_id, count, count))
+            changes.extend(self.change_rows(user_id, cursor.lastrowid))
+        if changes:
+            cursor.executemany(INSERT_CHANGE_SQL, changes)
+        resources = self.resource_rows()
+        if resources:
+            cursor.executemany(BUMP_RESOURCE_VERSION_SQL, resources)
+        outbox = self.outbox_rows()
+        if outbox:
+            cursor.executemany(ENQUEUE_CHANGE_SQL, outbox)
+
+
+class SyncTokenExpired(Exception):
+    """Токен старше удалённой части журнала: нужна полная перезагрузка"""
+
+
+def parse_sync_token(value):
+    if value is None or not value.isdigit():
+        raise ValueError('Invalid sync token')
+    return int(value)
+
+
+def format_sync_token(version):
+    return str(version)
+
+
+def current_version(cursor, user_id):
+    """Токен для начала синхронизации. Читать до выборки данных: всё, что
+    изменится после, придёт в следующей синхронизации"""
+    cursor.execute(VERSION_SQL, (user_id,))
+    row = cursor.fetchone()
+    return row['version'] if row else 0
+
+
+def collect_changes(cursor, user_id, since, limit):
+    """Изменения пользователя после версии since, не больше limit записей журнала.
+
+    Возвращает словарь:
+      version  -- новый токен (версия последней отданной записи)
+      has_more -- журнал отдан не полностью, нужно повторить с version
+      changes  -- {entity: [строки]}; для настроек - 'settings': строка
+      deleted  -- {entity: [id]} строк, которых больше нет
+    """
+    cursor.execute(VERSION_SQL, (user_id,))
+    row = cursor.fetchone()
+    version, pruned = (row['version'], row['pruned_version']) if row else (0, 0)
+    if since < pruned or since > version:
+        raise SyncTokenExpired()
+
+    cursor.execute(CHANGES_SQL, (user_id, since, limit + 1))
+    log = cursor.fetchall()
+    has_more = len(log) > limit
+    log = log[:limit]
+    if log:
+        # Записи, закоммиченные между двумя запросами, тоже отданы
+        version = max(version, log[-1]['version'])
+
+    changed = {}
+    for entry in log:
+        changed.setdefault(entry['entity'], set()).add(entry['entity_id'])
+
+    changes = {}
+    deleted = {}
+    for entity, ids in changed.items():
+        if entity == 'app_settings':
+            cursor.execute('SELECT * FROM app_settings WHERE user_id = %s', (user_id,))
+            changes['settings'] = cursor.fetchone()
+            continue
+        if entity not in ENTITY_QUERIES:
+            continue
+        ids = sorted(ids)
+        query = ENTITY_QUERIES[entity].format(ids=', '.join(['%s'] * len(ids)))
+        owner_params = (user_id, user_id) if entity == 'transactions' else (user_id,)
+        cursor.execute(query, owner_params + tuple(ids))
+        rows = cursor.fetchall()
+        changes[entity] = rows
+        found = {r[ENTITY_KEYS[entity]] for r in rows}
+        missing = [i for i in ids if i not in found]
+        if missing:
+            deleted[entity] = missing
+
+    return {'version': version, 'has_more': has_more, 'changes': changes, 'deleted': deleted}
+
+
+def bonus_balance(cursor, user_id):
+    cursor.execute(BONUS_BALANCE_SQL, (user_id,))
+    row = cursor.fetchone()
+    return row['balance'] if row else None
+
+
+PRUNE_MARK_SQL = '''
+    UPDATE sync_versions v
+    JOIN (
+        SELECT user_id, MAX(version) AS version FROM sync_changes
+        WHERE changed_at < %s
+        GROUP BY user_id
+    ) c ON c.user_id = v.user_id
+    SET v.pruned_version = GREATEST(v.pruned_version, c.version)
+'''
+
+
+def prune(conn, before, batch_size=5000):
+    """Удаление записей журнала старше before. Сначала поднимается
+    pruned_version, чтобы клиенты со старыми токенами получали 410,
+    а не неполный ответ. Возвращает число удалённых записей"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(PRUNE_MARK_SQL, (before,))
+        conn.commit()
+        removed = 0
+        while True:
+            cursor.execute('DELETE FROM sync_changes WHERE changed_at < %s LIMIT %s', (before, batch_size))
+            conn.commit()
+            removed += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return removed
+    finally:
+        cursor.close()
@@ -0,0 +1,176 @@
+# Кэш каталога доступных авиабилетов для GET /api/flights.
+# Каждый рейс хранится уже сериализованным в JSON (dumps возвращает bytes),
+# поэтому ответ из кэша (в том числе отфильтрованный) собирается склейкой
+# байтов без запроса к БД и без повторного кодирования.
+#
+# Кэш есть в каждом процессе сервера. Захват, отмена и снятие просроченной
+# брони поднимают общую версию каталога (строка resource_versions с
+# user_id = 0) в той же транзакции, что меняет air_tickets. Снимок
+# перепроверяет её не чаще раза в version_check секунд одним чтением по
+# первичному ключу, так что изменение из другого процесса видно не позже чем
+# через version_check секунд; в своём процессе - сразу, через invalidate().
+import hashlib
+import threading
+import time
+from datetime import datetime
+
+from delta_sync import BUMP_RESOURCE_VERSION_SQL
+
+CATALOG_VERSION_KEY = (0, 'air_tickets')
+CATALOG_VERSION_SQL = "SELECT version FROM resource_versions WHERE user_id = 0 AND resource = 'air_tickets'"
+
+
+def bump_catalog_version(cursor):
+    """Поднимает общую версию каталога; вызывается последним в транзакции,
+    меняющей доступность билетов, чтобы блокировка строки держалась до
+    коммита как можно меньше"""
+    cursor.execute(BUMP_RESOURCE_VERSION_SQL, CATALOG_VERSION_KEY)
+
+
+def read_catalog_version(cursor):
+    cursor.execute(CATALOG_VERSION_SQL)
+    row = cursor.fetchone()
+    return row['version'] if row else 0
+
+
+class CatalogSnapshot:
+    def __init__(self, generation, version, flights, encoded):
+        self.generation = generation
+        self.version = version      # общая версия каталога на момент чтения
+        self.flights = flights      # строки air_tickets
+        self.encoded = encoded      # JSON каждого рейса, в том же порядке
+        self.body = b'[' + b','.join(encoded) + b']'
+        self.etag = 'flights-' + hashlib.sha1(self.body).hexdigest()[:20]
+        # Каталог устаревает, когда улетает ближайший рейс
+        self.valid_until = min((f['departure_time'] for f in flights), default=None)
+
+
+class FlightCatalog:
+    def __init__(self, connect, dumps, ttl=60.0, version_check=1.0):
+        self._connect = connect
+        self._dumps = dumps
+        self.ttl = ttl
+        self.version_check = version_check
+        self.generation = 0
+        self._snapshot = None
+        self._expires = 0.0
+        self._checked_until = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.version_checks = 0
+
+    # Вызывается после любого изменения доступности билетов
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._snapshot = None
+
+    def _is_fresh(self, snapshot):
+        if snapshot is None or snapshot.generation != self.generation:
+            return False
+        if time.monotonic() >= self._expires:
+            return False
+        return snapshot.valid_until is None or datetime.now() < snapshot.valid_until
+
+    # Снимок без обращения к БД или None, если его нужно перечитать
+    # или пора сверить общую версию
+    def cached(self):
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot) and time.monotonic() < self._checked_until:
+            self.hits += 1
+            return snapshot
+        return None
+
+    def current(self):
+        snapshot = self.cached()
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            snapshot = self.cached()
+            if snapshot is not None:
+                return snapshot
+            generation = self.generation
+            snapshot = self._snapshot if self._is_fresh(self._snapshot) else None
+            conn = self._connect()
+            try:
+                cursor = conn.cursor(dictionary=True)
+                # Версия читается до данных: изменение между двумя запросами
+                # приведёт только к лишнему перечитыванию
+                version = read_catalog_version(cursor)
+                self.version_checks += 1
+                if snapshot is None or snapshot.version != version:
+                    cursor.execute('''
+                        SELECT * FROM air_tickets
+                        WHERE is_available = 1 AND departure_time > NOW()
+                        ORDER BY departure_time ASC
+                    ''')
+                    flights = cursor.fetchall()
+                    encoded = [self._dumps(f) for f in flights]
+                    snapshot = CatalogSnapshot(generation, version, flights, encoded)
+                    self._expires = time.monotonic() + self.ttl
+                    self.loads += 1
+                else:
+                    self.hits += 1
+                cursor.close()
+            finally:
+                conn.close()
+            self._snapshot = snapshot
+            self._checked_until = time.monotonic() + self.version_check
+            return snapshot
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'generation': self.generation,
+            'version': snapshot.version if snapshot else None,
+            'flights': len(snapshot.flights) if snapshot else 0,
+            'hits': self.hits,
+            'loads': self.loads,
+            'version_checks': self.version_checks,
+        }
+
+
+class FlightQuery:
+    """Параметры GET /api/flights: departure_city, arrival_city,
+    date=YYYY-MM-DD, offset, limit. ValueError при неверных значениях"""
+
+    def __init__(self, args, query_string):
+        self.departure_city = args.get('departure_city')
+        self.arrival_city = args.get('arrival_city')
+        self.date = datetime.fromisoformat(args['date']).date() if args.get('date') else None
+        self.offset = max(0, int(args.get('offset', 0)))
+        self.limit = int(args['limit']) if args.get('limit') else None
+        self.query_string = query_string
+        self.filtered = bool(self.departure_city or self.arrival_city or self.date
+                             or self.offset or self.limit is not None)
+
+    def etag(self, snapshot):
+        if not self.filtered:
+            return snapshot.etag
+        return snapshot.etag + '-' + hashlib.sha1(self.query_string).hexdigest()[:12]
+
+    def render(self, snapshot):
+        """Тело ответа и общее число подходящих рейсов (None без фильтров)"""
+        if not self.filtered:
+            return snapshot.body, None
+        selected = filter_flights(snapshot, self.departure_city, self.arrival_city, self.date)
+        total = len(selected)
+        end = self.offset + self.limit if self.limit is not None else None
+        return b'[' + b','.join(selected[self.offset:end]) + b']', total
+
+
+# Отбор рейсов из снимка по маршруту и дате вылета
+def filter_flights(snapshot, departure_city=None, arrival_city=None, date=None):
+    departure_city = departure_city.lower() if departure_city else None
+    arrival_city = arrival_city.lower() if arrival_city else None
+    selected = []
+    for flight, encoded in zip(snapshot.flights, snapshot.encoded):
+        if departure_city and (flight.get('departure_city') or '').lower() != departure_city:
+            continue
+        if arrival_city and (flight.get('arrival_city') or '').lower() != arrival_city:
+            continue
+        if date and flight['departure_time'].date() != date:
+            continue
+        selected.append(encoded)
+    return selected
@@ -0,0 +1,85 @@
+# Быстрая JSON-сериализация ответов API.
+# Decimal, datetime/date/time и bytes кодируются за один проход по данным,
+# без предварительного обхода строк в обработчиках. Если установлен orjson,
+# кодирование идёт в нём (в разы быстрее на больших списках), иначе - через
+# стандартный json с той же функцией default.
+#
+# Форматы:
+#   datetime, date, time -- ISO 8601 (как datetime.isoformat())
+#   Decimal              -- строка (decimal_mode='string', как раньше отдавал
+#                           Flask) или число с фиксированной точкой ('number')
+#   bytes                -- base64
+import base64
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONProvider(JSONProvider):
+    """Провайдер JSON для Flask и Quart (app.json = FastJSONProvider(app))"""
+
+    decimal_mode = 'string'
+    sort_keys = True
+    mimetype = 'application/json'
+
+    def __init__(self, app, decimal_mode=None):
+        super().__init__(app)
+        if decimal_mode is not None:
+            self.decimal_mode = decimal_mode
+        if self.decimal_mode not in ('string', 'number'):
+            raise ValueError(f'decimal_mode: string или number, не {self.decimal_mode}')
+
+    def _default(self, o):
+        if isinstance(o, Decimal):
+            if self.decimal_mode == 'string':
+                return str(o)
+            # orjson не принимает Decimal как число - отдаём float, для денежных
+            # сумм DECIMAL(15, 2) точности double достаточно
+            return float(o)
+        if isinstance(o, (datetime, date, time)):
+            return o.isoformat()
+        if isinstance(o, (bytes, bytearray)):
+            return base64.b64encode(o).decode('ascii')
+        if isinstance(o, UUID):
+            return str(o)
+        if isinstance(o, set):
+            return list(o)
+        raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+    def dumps_bytes(self, obj):
+        """JSON в UTF-8 без промежуточной строки"""
+        if orjson is not None:
+            option = orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=self._default, option=option)
+        return json.dumps(obj, default=self._default, ensure_ascii=False,
+                          sort_keys=self.sort_keys, separators=(',', ':')).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return self.dumps_bytes(obj).decode('utf-8')
+        kwargs.setdefault('default', self._default)
+        kwargs.setdefault('ensure_ascii', False)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        kwargs.setdefault('separators', (',', ':'))
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if args and kwargs:
+            raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+        obj = kwargs or (args[0] if len(args) == 1 else list(args) if args else None)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,199 @@
+# Метрики запросов: гистограммы времени ответа по маршрутам, время и число
+# SQL-запросов на HTTP-запрос, время получения соединения из пула и журнал
+# медленных запросов. Отдаются в текстовом формате Prometheus.
+import logging
+import re
+import threading
+import time
+
+slow_query_log = logging.getLogger('mbapp.slow_query')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Текст запроса без литералов и с одним плейсхолдером вместо списков,
+    чтобы запросы одной формы попадали в одну строку журнала"""
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode('utf-8', 'replace')
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """Счётчики одного HTTP-запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.acquire_time = 0.0
+
+
+class InstrumentedCursor:
+    """Курсор, замеряющий время каждого execute/executemany"""
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            self._metrics.observe_query(operation, time.perf_counter() - start)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._metrics.observe_query(operation, time.perf_counter() - start)
+
+
+def _labels(**labels):
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class Metrics:
+    """Реестр метрик процесса.
+
+    current       -- функция, возвращающая RequestMetrics текущего запроса или None
+    slow_query_ms -- порог журнала медленных запросов
+    """
+
+    def __init__(self, current, slow_query_ms=200):
+        self._current = current
+        self.slow_query_seconds = slow_query_ms / 1000
+        self._lock = threading.Lock()
+        self._requests = {}        # (маршрут, метод, статус) -> число запросов
+        self._latency = {}         # (маршрут, метод) -> Histogram
+        self._db_time = {}         # маршрут -> Histogram
+        self._db_queries = {}      # маршрут -> Histogram
+        self._acquire = Histogram(LATENCY_BUCKETS)
+        self._background_queries = 0
+        self._background_db_time = 0.0
+        self._slow = {}            # нормализованный SQL -> [число, суммарное время, максимум]
+
+    def cursor_wrapper(self, cursor):
+        return InstrumentedCursor(cursor, self)
+
+    def observe_query(self, sql, seconds, request_metrics=None):
+        if request_metrics is None:
+            request_metrics = self._current()
+        if request_metrics is not None:
+            request_metrics.queries += 1
+            request_metrics.db_time += seconds
+        else:
+            with self._lock:
+                self._background_queries += 1
+                self._background_db_time += seconds
+        if seconds >= self.slow_query_seconds:
+            normalized = normalize_sql(sql)
+            with self._lock:
+                entry = self._slow.setdefault(normalized, [0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+            slow_query_log.warning('slow query %.1f ms: %s', seconds * 1000, normalized)
+
+    def observe_acquire(self, seconds):
+        request_metrics = self._current()
+        if request_metrics is not None:
+            request_metrics.acquire_time += seconds
+        with self._lock:
+            self._acquire.observe(seconds)
+
+    def observe_request(self, endpoint, method, status, request_metrics):
+        elapsed = time.perf_counter() - request_metrics.started
+        with self._lock:
+            key = (endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._latency.setdefault((endpoint, method), Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self._db_time.setdefault(endpoint, Histogram(LATENCY_BUCKETS)).observe(request_metrics.db_time)
+            self._db_queries.setdefault(endpoint, Histogram(QUERY_COUNT_BUCKETS)).observe(request_metrics.queries)
+
+    def slow_queries(self, limit=20):
+        with self._lock:
+            rows = [
+                {'query': sql, 'count': count, 'total_ms': round(total * 1000, 1), 'max_ms': round(worst * 1000, 1)}
+                for sql, (count, total, worst) in self._slow.items()
+            ]
+        rows.sort(key=lambda r: r['total_ms'], reverse=True)
+        return rows[:limit]
+
+    def render(self, gauges=None):
+        """Текстовый формат Prometheus; gauges - {имя: значение} из stats() компонентов"""
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, hist in series:
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {hist.count}')
+                lines.append(f'{name}_sum{_labels(**labels)} {hist.sum}')
+                lines.append(f'{name}_count{_labels(**labels)} {hist.count}')
+
+        with self._lock:
+            lines.append('# HELP http_requests_total HTTP requests by route, method and status')
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+            histogram('http_request_duration_seconds', 'HTTP request latency',
+                      [({'endpoint': e, 'method': m}, h) for (e, m), h in sorted(self._latency.items())])
+            histogram('http_request_db_seconds', 'Time spent in SQL per HTTP request',
+                      [({'endpoint': e}, h) for e, h in sorted(self._db_time.items())])
+            histogram('http_request_db_queries', 'SQL statements per HTTP request',
+                      [({'endpoint': e}, h) for e, h in sorted(self._db_queries.items())])
+            histogram('db_pool_acquire_seconds', 'Time to acquire a pooled connection',
+                      [({}, self._acquire)])
+            lines.append('# TYPE db_background_queries_total counter')
+            lines.append(f'db_background_queries_total {self._background_queries}')
+            lines.append('# TYPE db_background_seconds_total counter')
+            lines.append(f'db_background_seconds_total {self._background_db_time}')
+            lines.append('# TYPE db_slow_queries_total counter')
+            lines.append(f'db_slow_queries_total {sum(entry[0] for entry in self._slow.values())}')
+
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,271 @@
+# Хеширование и проверка паролей: реестр схем хеширования (bcrypt, PBKDF2)
+# и пул процессов, чтобы хеширование не занимало потоки, обслуживающие
+# остальные запросы
+import binascii
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from hashlib import pbkdf2_hmac
+
+import bcrypt
+
+
+class HashingPoolSaturated(Exception):
+    """Очередь на хеширование переполнена - запрос нужно отклонить сразу"""
+
+
+class BcryptScheme:
+    name = 'bcrypt'
+    min_cost = 10
+    max_cost = 14
+    default_cost = 12
+
+    def identify(self, stored_hash):
+        return stored_hash.startswith(('$2a$', '$2b$', '$2y$'))
+
+    def hash(self, password, cost):
+        salt = bcrypt.gensalt(rounds=cost)
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, stored_hash, password):
+        return bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8'))
+
+    def cost_of(self, stored_hash):
+        return int(stored_hash.split('$')[2])
+
+    def estimate(self, base_seconds, cost):
+        # Время хеша удваивается с каждым раундом
+        return base_seconds * 2 ** (cost - self.min_cost)
+
+
+class Pbkdf2Scheme:
+    """pbkdf2_sha256$<итерации>$<соль hex>$<ключ hex>"""
+
+    name = 'pbkdf2_sha256'
+    min_cost = 100000
+    max_cost = 2000000
+    default_cost = 600000
+
+    def identify(self, stored_hash):
+        return stored_hash.startswith('pbkdf2_sha256$')
+
+    def hash(self, password, cost):
+        salt = os.urandom(16)
+        key = pbkdf2_hmac('sha256', password.encode('utf-8'), salt, cost)
+        return f'pbkdf2_sha256${cost}${binascii.hexlify(salt).decode()}${binascii.hexlify(key).decode()}'
+
+    def verify(self, stored_hash, password):
+        _, iterations, salt, key = stored_hash.split('$')
+        actual = pbkdf2_hmac('sha256', password.encode('utf-8'), binascii.unhexlify(salt), int(iterations))
+        return hmac.compare_digest(actual, binascii.unhexlify(key))
+
+    def cost_of(self, stored_hash):
+        return int(stored_hash.split('$')[1])
+
+    def estimate(self, base_seconds, cost):
+        return base_seconds * cost / self.min_cost
+
+
+class LegacyPbkdf2Scheme:
+    """Формат lib/script.py: <соль hex>:<ключ hex>, 100000 итераций sha256.
+    Только проверка - новые хеши в этом формате не создаются."""
+
+    name = 'pbkdf2_legacy'
+    iterations = 100000
+
+    def identify(self, stored_hash):
+        salt, sep, key = stored_hash.partition(':')
+        return bool(sep) and len(salt) == 32 and len(key) == 64
+
+    def verify(self, stored_hash, password):
+        salt, _, key = stored_hash.partition(':')
+        actual = pbkdf2_hmac('sha256', password.encode('utf-8'), binascii.unhexlify(salt), self.iterations)
+        return hmac.compare_digest(actual, binascii.unhexlify(key))
+
+    def cost_of(self, stored_hash):
+        return self.iterations
+
+
+# Схемы, которыми можно создавать новые хеши (PASSWORD_SCHEME)
+SCHEMES = {}
+# Схемы только для проверки старых хешей: при входе они пересчитываются
+VERIFY_ONLY_SCHEMES = {}
+
+
+def register_scheme(scheme, verify_only=False):
+    (VERIFY_ONLY_SCHEMES if verify_only else SCHEMES)[scheme.name] = scheme
+    return scheme
+
+
+register_scheme(BcryptScheme())
+register_scheme(Pbkdf2Scheme())
+register_scheme(LegacyPbkdf2Scheme(), verify_only=True)
+
+
+def identify_scheme(stored_hash):
+    for scheme in (*SCHEMES.values(), *VERIFY_ONLY_SCHEMES.values()):
+        if stored_hash and scheme.identify(stored_hash):
+            return scheme
+    return None
+
+
+# Стоимость новых хешей: заданная явно или стандартная для схемы, но не ниже
+# min_cost. Одинакова во всех процессах с одной конфигурацией, поэтому хеши,
+# пересчитанные разными воркерами, не отличаются по стоимости.
+def target_cost(scheme, cost=None):
+    return max(scheme.min_cost, min(scheme.max_cost, cost or scheme.default_cost))
+
+
+# Подбирает максимальную стоимость схемы, укладывающуюся в бюджет по времени.
+# Только подсказка для выбора PASSWORD_HASH_COST: одно измерение зависит от
+# загрузки машины, поэтому при запуске сервера стоимость так не выбирается.
+# Стоимость не опускается ниже min_cost схемы, даже если бюджет меньше.
+def calibrate_cost(scheme, budget_seconds):
+    start = time.perf_counter()
+    scheme.hash('calibration', scheme.min_cost)
+    base_seconds = time.perf_counter() - start
+
+    cost = scheme.min_cost
+    if isinstance(scheme, BcryptScheme):
+        while cost < scheme.max_cost and scheme.estimate(base_seconds, cost + 1) <= budget_seconds:
+            cost += 1
+        return cost
+    cost = int(scheme.min_cost * budget_seconds / base_seconds) if base_seconds else scheme.min_cost
+    return max(scheme.min_cost, min(scheme.max_cost, cost))
+
+
+# Функции верхнего уровня, чтобы их можно было передать в пул процессов
+def _hash(scheme_name, password, cost):
+    return SCHEMES[scheme_name].hash(password, cost)
+
+
+def _verify(stored_hash, provided_password):
+    scheme = identify_scheme(stored_hash)
+    if scheme is None:
+        return False
+    try:
+        return scheme.verify(stored_hash, provided_password)
+    except (ValueError, TypeError, AttributeError, binascii.Error):
+        return False
+
+
+class PasswordHasher:
+    """Пул процессов для хеширования паролей с ограничением длины очереди.
+
+    workers     -- число процессов (по умолчанию число ядер); 0 - считать в текущем потоке
+    max_pending -- сколько операций может ждать или выполняться одновременно
+    timeout     -- сколько секунд ждать результат одной операции
+    scheme      -- схема для новых хешей
+    cost        -- стоимость для новых хешей; по умолчанию default_cost схемы
+    """
+
+    def __init__(self, workers=None, max_pending=None, timeout=10.0,
+                 scheme='bcrypt', cost=None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending or max(self.workers, 1) * 4
+        self.timeout = timeout
+        if scheme not in SCHEMES:
+            if scheme in VERIFY_ONLY_SCHEMES:
+                raise ValueError(f'Схема {scheme} только для проверки старых хешей, выберите одну из: '
+                                 f'{", ".join(SCHEMES)}')
+            raise ValueError(f'Неизвестная схема хеширования {scheme}, выберите одну из: {", ".join(SCHEMES)}')
+        self.scheme = SCHEMES[scheme]
+        self.cost = target_cost(self.scheme, cost)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def _get_executor(self):
+        # Пул создаётся при первом обращении, уже в процессе воркера
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    # Место в очереди освобождается по готовности future, а не по таймауту:
+    # уже запущенную в процессе задачу cancel() не останавливает, и пока она
+    # занимает процесс, новые сверх max_pending не принимаются
+    def _run(self, fn, *args):
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HashingPoolSaturated()
+
+    # Для асинхронного сервера: не ждёт результат, а возвращает
+    # concurrent.futures.Future; место в очереди освобождается по готовности
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._rejected += 1
+            raise HashingPoolSaturated()
+        with self._stats_lock:
+            self._in_flight += 1
+        if self.workers == 0:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as err:
+                future.set_exception(err)
+        else:
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except BaseException:
+                self._finished(None)
+                raise
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._stats_lock:
+            self._in_flight -= 1
+            self._completed += 1
+        self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, self.scheme.name, password, self.cost)
+
+    def submit_hash(self, password):
+        return self._submit(_hash, self.scheme.name, password, self.cost)
+
+    def submit_verify(self, stored_hash, provided_password):
+        return self._submit(_verify, stored_hash, provided_password)
+
+    def verify(self, stored_hash, provided_password):
+        return self._run(_verify, stored_hash, provided_password)
+
+    # Хеш сделан другой схемой или с меньшей стоимостью - пересчитать при входе.
+    # Более дорогие хеши той же схемы не трогаем: стоимость только растёт.
+    def needs_rehash(self, stored_hash):
+        scheme = identify_scheme(stored_hash)
+        if scheme is not self.scheme:
+            return True
+        try:
+            return scheme.cost_of(stored_hash) < self.cost
+        except (ValueError, IndexError):
+            return True
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'scheme': self.scheme.name,
+                'cost': self.cost,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'in_flight': self._in_flight,
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
@@ -0,0 +1,88 @@
+# Кэш справочников: категории и типы транзакций, типы счетов.
+# Таблицы маленькие и меняются редко, поэтому держим их в памяти целиком
+# и перечитываем по TTL или по команде администратора.
+import hashlib
+import threading
+import time
+
+import mysql.connector
+
+
+class ReferenceSnapshot:
+    """Неизменяемый снимок справочников одной версии"""
+
+    def __init__(self, version, categories, account_types, transaction_types):
+        self.version = version
+        self.loaded_at = time.time()
+        self.categories = categories                                   # id -> название
+        self.category_ids = {name: cid for cid, name in categories.items()}
+        self.account_types = account_types                             # id -> строка account_types
+        self.transaction_types = transaction_types                     # id -> название
+        # Отпечаток содержимого: одинаков во всех процессах с теми же данными,
+        # в отличие от локального номера версии (входит в ETag ответов)
+        self.fingerprint = hashlib.sha1(
+            repr((sorted(categories.items()), sorted(account_types.items()),
+                  sorted(transaction_types.items()))).encode('utf-8')
+        ).hexdigest()[:12]
+
+
+class ReferenceData:
+    def __init__(self, connect, ttl=300.0):
+        self._connect = connect
+        self.ttl = ttl
+        self._snapshot = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            return self._reload()
+
+    def _reload(self):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute('SELECT category_id, category_name FROM transaction_categories')
+            categories = {r['category_id']: r['category_name'] for r in cursor.fetchall()}
+            cursor.execute('SELECT * FROM account_types')
+            account_types = {r['type_id']: r for r in cursor.fetchall()}
+            cursor.execute('SELECT type_id, type_name FROM transaction_types')
+            transaction_types = {r['type_id']: r['type_name'] for r in cursor.fetchall()}
+            cursor.close()
+        finally:
+            conn.close()
+        version = self._snapshot.version + 1 if self._snapshot else 1
+        self._snapshot = ReferenceSnapshot(version, categories, account_types, transaction_types)
+        self._expires = time.monotonic() + self.ttl
+        return self._snapshot
+
+    def current(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.load()
+        if time.monotonic() >= self._expires and self._lock.acquire(blocking=False):
+            # Перечитывает один поток, остальные пока работают со старым снимком
+            try:
+                if time.monotonic() >= self._expires:
+                    snapshot = self._reload()
+            except mysql.connector.Error:
+                # БД недоступна - продолжаем со старым снимком и повторим позже
+                self._expires = time.monotonic() + min(self.ttl, 10)
+            finally:
+                self._lock.release()
+        return snapshot
+
+    def category_id(self, name, default=None):
+        return self.current().category_ids.get(name, default)
+
+    def stats(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'version': 0}
+        return {
+            'version': snapshot.version,
+            'loaded_at': snapshot.loaded_at,
+            'categories': len(snapshot.categories),
+            'account_types': len(snapshot.account_types),
+            'transaction_types': len(snapshot.transaction_types),
+        }
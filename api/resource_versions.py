@@ -0,0 +1,37 @@
+# Условные GET для данных пользователя (профиль, счета, тикеты, бонусы,
+# настройки). Версию ресурса поднимает delta_sync.ChangeLog в той же
+# транзакции, что пишет его таблицы (у получателя перевода - фоновый
+# обработчик sync_outbox.py, с задержкой до его интервала), поэтому
+# обработчику достаточно прочитать одну строку по первичному ключу: если
+# ETag клиента совпадает, ответ 304 отдаётся без запросов за данными.
+#
+# Версия читается до данных: запись, закоммиченная между двумя запросами,
+# попадёт в тело под старым ETag, и следующий запрос просто получит её ещё раз.
+
+# Ресурс -> таблица, чью версию он отражает
+RESOURCES = {
+    'profile': 'users',
+    'accounts': 'accounts',
+    'tickets': 'support_tickets',
+    'bonuses': 'bonus_operations',
+    'settings': 'app_settings',
+}
+
+VERSION_SQL = 'SELECT version FROM resource_versions WHERE user_id = %s AND resource = %s'
+
+
+def version_params(user_id, resource):
+    return user_id, RESOURCES[resource]
+
+
+def format_etag(resource, user_id, version, extra=None):
+    """Значение ETag (без кавычек). extra - то, что кроме строк пользователя
+    влияет на тело, например версия справочников"""
+    tag = f'{resource}-{user_id}-{version}'
+    return f'{tag}-{extra}' if extra is not None else tag
+
+
+def read_version(cursor, user_id, resource):
+    cursor.execute(VERSION_SQL, version_params(user_id, resource))
+    row = cursor.fetchone()
+    return row['version'] if row else 0
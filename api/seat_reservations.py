@@ -0,0 +1,139 @@
+# Бронирование мест на авиабилеты.
+# Место сначала захватывается условным UPDATE (is_available = 1 -> 0): из
+# одновременных запросов строку меняет только один, остальные сразу
+# получают отказ и не стоят в очереди на блокировках счетов. Захват
+# оформляется временной бронью в seat_holds; оплата проходит, только если
+# бронь ещё принадлежит покупателю. Просроченные брони возвращают место в
+# продажу. Каждое изменение доступности поднимает общую версию каталога
+# (см. flight_catalog.py).
+import threading
+
+import mysql.connector
+
+from flight_catalog import bump_catalog_version
+from transfer_engine import TransferError
+
+
+def claim_seat(cursor, ticket_id, user_id, ttl):
+    """Захватывает место или продлевает собственную бронь пользователя.
+    Возвращает {'ticket_id', 'expires_at', 'created'}"""
+    cursor.execute(
+        'UPDATE air_tickets SET is_available = 0 '
+        'WHERE ticket_id = %s AND is_available = 1 AND departure_time > NOW()',
+        (ticket_id,)
+    )
+    created = cursor.rowcount == 1
+    if created:
+        cursor.execute(
+            'INSERT INTO seat_holds (ticket_id, user_id, expires_at) '
+            'VALUES (%s, %s, NOW() + INTERVAL %s SECOND)',
+            (ticket_id, user_id, int(ttl))
+        )
+    else:
+        cursor.execute(
+            'UPDATE seat_holds SET expires_at = NOW() + INTERVAL %s SECOND '
+            'WHERE ticket_id = %s AND user_id = %s',
+            (int(ttl), ticket_id, user_id)
+        )
+        if cursor.rowcount != 1:
+            raise TransferError('Ticket not available!', 409)
+    cursor.execute('SELECT expires_at FROM seat_holds WHERE ticket_id = %s', (ticket_id,))
+    expires_at = cursor.fetchone()['expires_at']
+    if created:
+        bump_catalog_version(cursor)
+    return {'ticket_id': ticket_id, 'expires_at': expires_at, 'created': created}
+
+
+def consume_hold(cursor, ticket_id, user_id):
+    """Снимает бронь при оплате; False - брони уже нет (снята по истечении).
+    Место остаётся is_available = 0 - теперь оно продано."""
+    cursor.execute(
+        'DELETE FROM seat_holds WHERE ticket_id = %s AND user_id = %s',
+        (ticket_id, user_id)
+    )
+    return cursor.rowcount == 1
+
+
+def release_hold(cursor, ticket_id, user_id):
+    """Отменяет бронь пользователя и возвращает место в продажу"""
+    cursor.execute(
+        'DELETE FROM seat_holds WHERE ticket_id = %s AND user_id = %s',
+        (ticket_id, user_id)
+    )
+    if cursor.rowcount != 1:
+        return False
+    cursor.execute('UPDATE air_tickets SET is_available = 1 WHERE ticket_id = %s', (ticket_id,))
+    bump_catalog_version(cursor)
+    return True
+
+
+def sweep_expired(conn, batch_size=500):
+    """Снимает одну пачку просроченных броней; возвращает их число"""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # Бронь, которую сейчас оплачивают, заблокирована - пропускаем её
+        cursor.execute(
+            'SELECT ticket_id FROM seat_holds WHERE expires_at <= NOW() '
+            'ORDER BY expires_at LIMIT %s FOR UPDATE SKIP LOCKED',
+            (batch_size,)
+        )
+        ticket_ids = [row['ticket_id'] for row in cursor.fetchall()]
+        if ticket_ids:
+            placeholders = ', '.join(['%s'] * len(ticket_ids))
+            cursor.execute(f'DELETE FROM seat_holds WHERE ticket_id IN ({placeholders})', tuple(ticket_ids))
+            cursor.execute(
+                f'UPDATE air_tickets SET is_available = 1 WHERE ticket_id IN ({placeholders})',
+                tuple(ticket_ids)
+            )
+            bump_catalog_version(cursor)
+        conn.commit()
+        return len(ticket_ids)
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+class HoldSweeper(threading.Thread):
+    """Фоновый поток, возвращающий в продажу места с просроченной бронью.
+    on_release вызывается после каждой пачки, вернувшей места"""
+
+    def __init__(self, connect, interval=5.0, batch_size=500, on_release=None):
+        super().__init__(name='seat-hold-sweeper', daemon=True)
+        self._connect = connect
+        self.interval = interval
+        self.batch_size = batch_size
+        self.on_release = on_release
+        self._stop_event = threading.Event()
+        self.released = 0
+        self.errors = 0
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                conn = self._connect()
+                try:
+                    while not self._stop_event.is_set():
+                        count = sweep_expired(conn, self.batch_size)
+                        if count:
+                            self.released += count
+                            if self.on_release:
+                                self.on_release()
+                        if count < self.batch_size:
+                            break
+                finally:
+                    conn.close()
+            except mysql.connector.Error:
+                self.errors += 1
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        return {
+            'running': self.is_alive(),
+            'released': self.released,
+            'errors': self.errors,
+        }
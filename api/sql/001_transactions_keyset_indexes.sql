@@ -0,0 +1,11 @@
+-- Индексы для постраничной истории транзакций (GET /api/user/<id>/transactions).
+-- Каждая ветка UNION выбирает строки одного счета в порядке
+-- (transaction_date DESC, transaction_id DESC) прямо по индексу и
+-- останавливается через LIMIT строк.
+ALTER TABLE transactions
+    ADD INDEX idx_transactions_from_date (from_account_id, transaction_date, transaction_id),
+    ADD INDEX idx_transactions_to_date (to_account_id, transaction_date, transaction_id);
+
+-- Список счетов пользователя, с которого начинается запрос истории
+ALTER TABLE accounts
+    ADD INDEX idx_accounts_user (user_id, is_active);
@@ -0,0 +1,13 @@
+-- Сводка активности пользователей для /api/admin/user-activity.
+-- Поддерживается приращениями в переводах, пополнениях и покупке билетов.
+CREATE TABLE user_activity_rollup (
+    user_id INT NOT NULL PRIMARY KEY,
+    total_transfers INT NOT NULL DEFAULT 0,
+    total_balance DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    bonus_balance DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    last_activity_at DATETIME NULL,
+    CONSTRAINT fk_activity_rollup_user FOREIGN KEY (user_id) REFERENCES users (user_id)
+);
+
+-- После создания таблицы заполните её:
+--   cd api && flask --app app rebuild-activity-rollup
@@ -0,0 +1,11 @@
+-- Очередь начислений бонусов. Переводы только добавляют сюда строку,
+-- фоновый обработчик переносит начисления в users.bonus_balance и
+-- bonus_operations пачками (см. bonus_outbox.py).
+CREATE TABLE bonus_accrual_outbox (
+    outbox_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    amount DECIMAL(15, 2) NOT NULL,
+    description VARCHAR(255) NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_bonus_outbox_user (user_id, outbox_id)
+);
@@ -0,0 +1,11 @@
+-- Временные брони мест. Строка существует, пока место удерживается
+-- пользователем и ещё не оплачено; на это время air_tickets.is_available = 0.
+-- Просроченные брони снимает фоновый обработчик (см. seat_reservations.py).
+CREATE TABLE seat_holds (
+    ticket_id INT NOT NULL PRIMARY KEY,
+    user_id INT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at DATETIME NOT NULL,
+    INDEX idx_seat_holds_expires (expires_at),
+    INDEX idx_seat_holds_user (user_id)
+);
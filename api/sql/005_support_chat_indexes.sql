@@ -0,0 +1,7 @@
+-- Индексы для инкрементальной выборки чата поддержки (since=m<id>:r<id>):
+-- каждая ветка UNION читает только сообщения пользователя после позиции.
+ALTER TABLE support_messages
+    ADD INDEX idx_support_messages_user (user_id, message_id);
+
+ALTER TABLE support_replies
+    ADD INDEX idx_support_replies_message (message_id, reply_id);
@@ -0,0 +1,20 @@
+-- Очередь тикетов поддержки (GET /api/support/queue, POST /api/support/queue/claim).
+-- Свободный тикет - employee_id IS NULL. Раньше свободные тикеты получали
+-- employee_id = 0 по умолчанию; новые создаются с NULL.
+ALTER TABLE support_tickets MODIFY employee_id INT NULL DEFAULT NULL;
+UPDATE support_tickets SET employee_id = NULL WHERE employee_id = 0;
+
+-- Каждый фильтр очереди читает строки в порядке (created_at, ticket_id) по индексу
+ALTER TABLE support_tickets
+    ADD INDEX idx_support_tickets_queue (is_answered, employee_id, created_at, ticket_id),
+    ADD INDEX idx_support_tickets_assignee (employee_id, is_answered, created_at, ticket_id),
+    ADD INDEX idx_support_tickets_created (created_at, ticket_id);
+
+-- Счётчики тикетов по статусам (см. support_queue.py)
+CREATE TABLE support_ticket_counters (
+    status VARCHAR(20) NOT NULL PRIMARY KEY,
+    ticket_count INT NOT NULL DEFAULT 0
+);
+
+-- После создания таблицы заполните её:
+--   cd api && flask --app app rebuild-ticket-counters
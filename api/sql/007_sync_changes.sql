@@ -0,0 +1,25 @@
+-- Журнал изменений для дельта-синхронизации (GET /api/user/<id>/sync, см. delta_sync.py).
+-- Записи добавляет приложение (delta_sync.ChangeLog) последним шагом той же
+-- транзакции, блокируя строки sync_versions в порядке user_id; перевод между
+-- пользователями попадает в журнал обоих.
+-- Первичный ключ bonus_operations - operation_id, app_settings - user_id.
+
+-- Последняя выданная версия пользователя и граница удалённой части журнала
+CREATE TABLE sync_versions (
+    user_id INT NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    pruned_version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE sync_changes (
+    user_id INT NOT NULL,
+    version BIGINT NOT NULL,
+    entity VARCHAR(20) NOT NULL,
+    entity_id BIGINT NOT NULL,
+    changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, version),
+    INDEX idx_sync_changes_changed (changed_at)
+);
+
+-- Записи журнала старше SYNC_CHANGES_RETENTION_DAYS удаляет
+--   cd api && flask --app app prune-sync-changes
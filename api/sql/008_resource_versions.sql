@@ -0,0 +1,11 @@
+-- Версии ресурсов пользователя для условных GET (ETag / 304, см. resource_versions.py).
+-- Версию поднимает приложение вместе с записью журнала синхронизации
+-- (delta_sync.ChangeLog), после блокировок sync_versions, в порядке
+-- (user_id, resource).
+-- resource: users, accounts, transactions, bonus_operations, support_tickets, app_settings.
+CREATE TABLE resource_versions (
+    user_id INT NOT NULL,
+    resource VARCHAR(20) NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, resource)
+);
@@ -0,0 +1,27 @@
+-- Токены обновления и отзыв токенов доступа (см. auth_tokens.py).
+-- Все моменты времени - UTC, их пишет приложение.
+
+-- Хранится только SHA-256 токена. revoked_at заполняется при замене токена
+-- новым и при отзыве всех сессий пользователя
+CREATE TABLE refresh_tokens (
+    token_hash CHAR(64) NOT NULL PRIMARY KEY,
+    user_id INT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at DATETIME NOT NULL,
+    revoked_at DATETIME NULL,
+    INDEX idx_refresh_tokens_user (user_id, revoked_at),
+    INDEX idx_refresh_tokens_expires (expires_at)
+);
+
+-- jti IS NULL - недействительны все токены пользователя с iat < not_before
+-- (смена пароля или роли), иначе - один токен (выход). Строка нужна до
+-- expires_at: позже все затронутые токены доступа истекли сами
+CREATE TABLE token_revocations (
+    revocation_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    jti CHAR(32) NULL,
+    not_before DATETIME(6) NOT NULL,
+    expires_at DATETIME NOT NULL,
+    INDEX idx_token_revocations_not_before (not_before),
+    INDEX idx_token_revocations_expires (expires_at)
+);
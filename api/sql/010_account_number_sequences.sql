@@ -0,0 +1,28 @@
+-- Последовательности номеров счетов (см. account_numbers.py).
+-- next_value - первый ещё не зарезервированный порядковый номер префикса,
+-- legacy_max - наибольший хвост номера прежней схемы (без контрольной цифры).
+CREATE TABLE account_number_sequences (
+    prefix CHAR(8) NOT NULL PRIMARY KEY,
+    next_value BIGINT NOT NULL,
+    legacy_max BIGINT NOT NULL DEFAULT 0
+);
+
+-- Новые номера: префикс + 9 цифр порядкового номера + контрольная цифра,
+-- то есть последние 10 цифр равны serial * 10 + цифра. Старые номера -
+-- префикс + 10 цифр id. Начинаем выше всех существующих номеров префикса,
+-- чтобы новые не совпали со старыми
+INSERT INTO account_number_sequences (prefix, next_value, legacy_max)
+SELECT l.prefix, l.legacy_max DIV 10 + 1, l.legacy_max
+FROM (
+    SELECT p.prefix,
+           COALESCE((SELECT MAX(CAST(SUBSTRING(a.account_number, 9) AS UNSIGNED))
+                     FROM accounts a
+                     WHERE a.account_number LIKE CONCAT(p.prefix, '%')), 0) AS legacy_max
+    FROM (SELECT '40817810' AS prefix UNION ALL SELECT '40817820') p
+) l;
+
+-- Гарантия уникальности на уровне БД. Если создание падает на дубликатах,
+-- выданных прежней схемой (MAX(account_id) + 1 под конкурентной нагрузкой),
+-- их нужно сначала перенумеровать
+ALTER TABLE accounts
+    ADD UNIQUE INDEX uq_accounts_number (account_number);
@@ -0,0 +1,5 @@
+-- Общая версия каталога авиабилетов (см. flight_catalog.py): строка
+-- resource_versions с user_id = 0. Её поднимают захват, отмена и снятие
+-- просроченной брони; кэши каталога в процессах сервера сверяются с ней.
+INSERT INTO resource_versions (user_id, resource, version) VALUES (0, 'air_tickets', 0)
+ON DUPLICATE KEY UPDATE version = version;
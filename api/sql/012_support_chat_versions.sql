@@ -0,0 +1,16 @@
+-- Ожидание новых сообщений чата (support_chat.py) раз в несколько секунд
+-- читает только версию чата пользователя: строку resource_versions
+-- (user_id, 'support_messages'), которую поднимает запись сообщения или
+-- ответа. Строки создаются при первой записи, заполнять их не нужно.
+--
+-- Ветка ответов в CHAT_QUERY выбирает ответы пользователя после reply_id
+-- курсора. Владелец сообщения хранится и в support_replies, чтобы это было
+-- чтение диапазона индекса (user_id, reply_id), а не обход всех сообщений
+-- пользователя.
+ALTER TABLE support_replies
+    ADD COLUMN user_id INT NOT NULL DEFAULT 0,
+    ADD INDEX idx_support_replies_user (user_id, reply_id);
+
+UPDATE support_replies r
+JOIN support_messages m ON r.message_id = m.message_id
+SET r.user_id = m.user_id;
@@ -0,0 +1,10 @@
+-- Очередь изменений получателей переводов для журнала синхронизации.
+-- Перевод только добавляет сюда строки, фоновый обработчик переносит их в
+-- sync_changes и resource_versions пачками (см. sync_outbox.py).
+-- entity_id NULL - только версия ресурса entity.
+CREATE TABLE sync_change_outbox (
+    outbox_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    entity VARCHAR(20) NOT NULL,
+    entity_id BIGINT NULL
+);
@@ -0,0 +1,212 @@
+# Чат поддержки: инкрементальная выборка сообщений и оповещение ожидающих
+# клиентов о новых сообщениях.
+#
+# Позиция в переписке - пара (последний message_id из support_messages,
+# последний reply_id из support_replies), в строке вида "m<id>:r<id>".
+# Клиент передаёт её в since и получает только новые сообщения.
+#
+# ChatNotifier будит ожидающих только в своём процессе. Сообщение, записанное
+# другим воркером (gunicorn, отдельный процесс Quart), оповещения не даёт,
+# поэтому ожидание в wait_for_messages и stream_messages всё равно
+# проверяет переписку раз в recheck_interval секунд. Проверка - одно чтение
+# версии чата пользователя по первичному ключу (строка resource_versions
+# ресурса support_messages, её поднимает запись сообщения или ответа);
+# CHAT_QUERY выполняется, только когда версия изменилась (VersionedFetch).
+import threading
+import time
+
+CHAT_QUERY = '''
+    SELECT message_id, user_id, employee_id, message_text, send_time, is_read, is_answered, 'user' AS sender_type
+    FROM support_messages
+    WHERE user_id = %s AND message_id > %s
+    UNION ALL
+    SELECT r.reply_id AS message_id, m.user_id, r.employee_id, r.reply_text AS message_text, r.reply_time AS send_time, m.is_read, m.is_answered, 'support' AS sender_type
+    FROM support_replies r
+    JOIN support_messages m ON r.message_id = m.message_id
+    WHERE r.user_id = %s AND r.reply_id > %s
+    ORDER BY send_time ASC
+'''
+
+# Ресурс версии чата в resource_versions (имя ресурса - имя таблицы)
+CHAT_RESOURCE = 'support_messages'
+CHAT_VERSION_SQL = "SELECT version FROM resource_versions WHERE user_id = %s AND resource = 'support_messages'"
+
+
+def read_chat_version(cursor, user_id):
+    cursor.execute(CHAT_VERSION_SQL, (user_id,))
+    row = cursor.fetchone()
+    return row['version'] if row else 0
+
+
+def parse_chat_cursor(value):
+    """'m12:r7' -> (12, 7); пустая строка - с начала переписки"""
+    if not value:
+        return 0, 0
+    message_part, _, reply_part = value.partition(':')
+    if not message_part.startswith('m') or not reply_part.startswith('r'):
+        raise ValueError('invalid chat cursor')
+    return int(message_part[1:]), int(reply_part[1:])
+
+
+def format_chat_cursor(position):
+    return f'm{position[0]}:r{position[1]}'
+
+
+def fetch_messages(cursor, user_id, position):
+    """Сообщения после позиции и новая позиция"""
+    cursor.execute(CHAT_QUERY, chat_query_params(user_id, position))
+    messages = cursor.fetchall()
+    return messages, advance_position(messages, position)
+
+
+def chat_query_params(user_id, position):
+    return user_id, position[0], user_id, position[1]
+
+
+def advance_position(messages, position):
+    last_message_id, last_reply_id = position
+    for row in messages:
+        if row['sender_type'] == 'user':
+            last_message_id = max(last_message_id, row['message_id'])
+        else:
+            last_reply_id = max(last_reply_id, row['message_id'])
+    return last_message_id, last_reply_id
+
+
+class VersionedFetch:
+    """fetch(position) для ожидания: сначала читает версию чата и выполняет
+    исходный fetch, только если она изменилась с прошлого вызова.
+    version - версия, прочитанная до уже сделанной выборки (None - выборки
+    ещё не было)"""
+
+    def __init__(self, fetch, read_version, version=None):
+        self._fetch = fetch
+        self._read_version = read_version
+        self.version = version
+        self.skipped = 0
+
+    def __call__(self, position):
+        # Версия читается до переписки: сообщение, записанное между ними,
+        # не потеряется - следующая проверка увидит новую версию
+        version = self._read_version()
+        if version == self.version:
+            self.skipped += 1
+            return [], position
+        self.version = version
+        return self._fetch(position)
+
+
+def wait_for_messages(fetch, subscription, position, timeout, recheck_interval):
+    """Ждёт новых сообщений до timeout секунд; fetch(position) -> (сообщения,
+    позиция). Оповещение будит сразу, без него переписка перечитывается раз
+    в recheck_interval. Возвращает ([], position), если ничего не пришло"""
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return [], position
+        subscription.wait(min(recheck_interval, remaining))
+        messages, position = fetch(position)
+        if messages:
+            return messages, position
+
+
+def stream_messages(fetch, subscription, position, duration, keepalive, recheck_interval):
+    """Генератор для SSE: (сообщения, позиция) на каждую порцию новых
+    сообщений и ([], позиция), если keepalive секунд ничего не было.
+    Завершается через duration секунд"""
+    deadline = time.monotonic() + duration
+    last_event = time.monotonic()
+    messages, position = fetch(position)
+    while True:
+        now = time.monotonic()
+        if messages:
+            yield messages, position
+            last_event = now
+        elif now - last_event >= keepalive:
+            yield [], position
+            last_event = now
+        now = time.monotonic()
+        if now >= deadline:
+            return
+        subscription.wait(max(0, min(recheck_interval, deadline - now, last_event + keepalive - now)))
+        messages, position = fetch(position)
+
+
+class _Channel:
+    def __init__(self, lock):
+        self.version = 0
+        self.waiters = 0
+        self.condition = threading.Condition(lock)
+
+
+class ChatSubscription:
+    def __init__(self, notifier, user_id, channel):
+        self._notifier = notifier
+        self.user_id = user_id
+        self._channel = channel
+        self._seen = channel.version
+
+    def wait(self, timeout):
+        """Ждёт публикации для пользователя; True - были новые сообщения.
+        Публикации после создания подписки не теряются, даже если пришли
+        до вызова wait"""
+        channel = self._channel
+        with channel.condition:
+            changed = channel.condition.wait_for(lambda: channel.version != self._seen, timeout)
+            self._seen = channel.version
+            return changed
+
+    def close(self):
+        self._notifier._unsubscribe(self.user_id, self._channel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ChatNotifier:
+    """Оповещения о новых сообщениях в пределах одного процесса (сообщения
+    из других процессов находит периодическое перечитывание, см. выше).
+    Канал пользователя существует, только пока его кто-то ждёт, поэтому
+    публикация без подписчиков ничего не стоит"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self.published = 0
+        self.wakeups = 0
+
+    def subscribe(self, user_id):
+        with self._lock:
+            channel = self._channels.get(user_id)
+            if channel is None:
+                channel = self._channels[user_id] = _Channel(self._lock)
+            channel.waiters += 1
+            return ChatSubscription(self, user_id, channel)
+
+    def _unsubscribe(self, user_id, channel):
+        with self._lock:
+            channel.waiters -= 1
+            if channel.waiters == 0 and self._channels.get(user_id) is channel:
+                del self._channels[user_id]
+
+    def publish(self, user_id):
+        with self._lock:
+            self.published += 1
+            channel = self._channels.get(user_id)
+            if channel is not None:
+                channel.version += 1
+                self.wakeups += channel.waiters
+                channel.condition.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'channels': len(self._channels),
+                'waiters': sum(c.waiters for c in self._channels.values()),
+                'published': self.published,
+                'wakeups': self.wakeups,
+            }
@@ -0,0 +1,147 @@
+# Очередь тикетов поддержки для сотрудников.
+# Выборка идёт по индексам в порядке (created_at, ticket_id) с keyset-курсором,
+# счётчики по статусам хранятся в support_ticket_counters и меняются
+# приращениями в той же транзакции, что и сам тикет.
+#
+# Статусы счётчиков:
+#   open       - тикет без ответа
+#   unassigned - тикет без ответа и без исполнителя (employee_id IS NULL)
+#   answered   - тикет с ответом
+from delta_sync import ChangeLog
+
+TICKET_STATUSES = ('open', 'unassigned', 'answered')
+
+QUEUE_COLUMNS = '''
+    SELECT t.*, u.first_name, u.last_name
+    FROM support_tickets t
+    JOIN users u ON t.user_id = u.user_id
+'''
+
+
+def ticket_statuses(ticket):
+    if ticket['is_answered']:
+        return {'answered'}
+    if ticket['employee_id'] is None:
+        return {'open', 'unassigned'}
+    return {'open'}
+
+
+class TicketCounterDelta:
+    """Накопитель изменений счётчиков в рамках одной транзакции"""
+
+    def __init__(self):
+        self._deltas = {}
+
+    def add(self, status, delta):
+        self._deltas[status] = self._deltas.get(status, 0) + delta
+
+    # Тикет перешёл из состояния before в after (None - тикета не было)
+    def transition(self, before, after):
+        old = ticket_statuses(before) if before else set()
+        new = ticket_statuses(after) if after else set()
+        for status in old - new:
+            self.add(status, -1)
+        for status in new - old:
+            self.add(status, 1)
+
+    def apply(self, cursor):
+        rows = [(status, delta) for status, delta in sorted(self._deltas.items()) if delta]
+        if rows:
+            cursor.executemany(
+                '''INSERT INTO support_ticket_counters (status, ticket_count) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE ticket_count = ticket_count + VALUES(ticket_count)''',
+                rows
+            )
+
+
+def lock_ticket(cursor, ticket_id):
+    cursor.execute(
+        'SELECT ticket_id, user_id, is_answered, employee_id FROM support_tickets '
+        'WHERE ticket_id = %s FOR UPDATE',
+        (ticket_id,)
+    )
+    return cursor.fetchone()
+
+
+def build_queue_query(filters, after=None, limit=None):
+    """filters: is_answered (0/1), employee_id (число или 'none'),
+    created_before / created_after (datetime) для отбора по возрасту"""
+    conditions = []
+    params = []
+    if filters.get('is_answered') is not None:
+        conditions.append('t.is_answered = %s')
+        params.append(filters['is_answered'])
+    if filters.get('employee_id') == 'none':
+        conditions.append('t.employee_id IS NULL')
+    elif filters.get('employee_id') is not None:
+        conditions.append('t.employee_id = %s')
+        params.append(filters['employee_id'])
+    if filters.get('created_before'):
+        conditions.append('t.created_at <= %s')
+        params.append(filters['created_before'])
+    if filters.get('created_after'):
+        conditions.append('t.created_at >= %s')
+        params.append(filters['created_after'])
+    if after:
+        conditions.append('(t.created_at, t.ticket_id) > (%s, %s)')
+        params.extend(after)
+
+    query = QUEUE_COLUMNS
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY t.created_at ASC, t.ticket_id ASC'
+    if limit is not None:
+        query += ' LIMIT %s'
+        params.append(limit)
+    return query, tuple(params)
+
+
+def claim_next(cursor, employee_id):
+    """Назначает сотруднику самый старый свободный тикет без ответа.
+    Тикеты, которые сейчас забирают другие сотрудники, пропускаются"""
+    cursor.execute(
+        'SELECT ticket_id, user_id, is_answered, employee_id FROM support_tickets '
+        'WHERE is_answered = 0 AND employee_id IS NULL '
+        'ORDER BY created_at, ticket_id LIMIT 1 FOR UPDATE SKIP LOCKED'
+    )
+    ticket = cursor.fetchone()
+    if ticket is None:
+        return None
+    cursor.execute(
+        'UPDATE support_tickets SET employee_id = %s, updated_at = NOW() WHERE ticket_id = %s',
+        (employee_id, ticket['ticket_id'])
+    )
+    counters = TicketCounterDelta()
+    counters.transition(ticket, dict(ticket, employee_id=employee_id))
+    counters.apply(cursor)
+    changes = ChangeLog()
+    changes.add(ticket['user_id'], 'support_tickets', ticket['ticket_id'])
+    changes.apply(cursor)
+    cursor.execute(QUEUE_COLUMNS + ' WHERE t.ticket_id = %s', (ticket['ticket_id'],))
+    return cursor.fetchone()
+
+
+def read_counters(cursor):
+    cursor.execute('SELECT status, ticket_count FROM support_ticket_counters')
+    counts = {status: 0 for status in TICKET_STATUSES}
+    counts.update({row['status']: row['ticket_count'] for row in cursor.fetchall()})
+    return counts
+
+
+# Полный пересчёт счётчиков по support_tickets
+REBUILD_SQL = '''
+    INSERT INTO support_ticket_counters (status, ticket_count)
+    SELECT 'open', COUNT(*) FROM support_tickets WHERE is_answered = 0
+    UNION ALL
+    SELECT 'unassigned', COUNT(*) FROM support_tickets WHERE is_answered = 0 AND employee_id IS NULL
+    UNION ALL
+    SELECT 'answered', COUNT(*) FROM support_tickets WHERE is_answered = 1
+    ON DUPLICATE KEY UPDATE ticket_count = VALUES(ticket_count)
+'''
+
+
+def rebuild_counters(conn):
+    cursor = conn.cursor()
+    cursor.execute(REBUILD_SQL)
+    conn.commit()
+    cursor.close()
@@ -0,0 +1,86 @@
+# Отложенные записи журнала синхронизации (см. delta_sync.py).
+# Перевод только добавляет изменения получателя в sync_change_outbox и не
+# блокирует его строки sync_versions и resource_versions. Фоновый обработчик
+# забирает очередь пачками и пишет журнал одним блоком версий на
+# пользователя за пачку, уже без блокировок счетов.
+import threading
+
+import mysql.connector
+
+from delta_sync import ChangeLog
+
+
+def drain_batch(conn, batch_size=500):
+    """Переносит одну пачку изменений в журнал; возвращает число строк"""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # SKIP LOCKED позволяет нескольким обработчикам работать одновременно
+        cursor.execute(
+            'SELECT outbox_id, user_id, entity, entity_id '
+            'FROM sync_change_outbox ORDER BY outbox_id LIMIT %s FOR UPDATE SKIP LOCKED',
+            (batch_size,)
+        )
+        rows = cursor.fetchall()
+        if rows:
+            changes = ChangeLog()
+            for row in rows:
+                if row['entity_id'] is None:
+                    changes.touch(row['user_id'], row['entity'])
+                else:
+                    changes.add(row['user_id'], row['entity'], row['entity_id'])
+            changes.apply(cursor)
+            outbox_ids = [r['outbox_id'] for r in rows]
+            cursor.execute(
+                f'DELETE FROM sync_change_outbox WHERE outbox_id IN ({", ".join(["%s"] * len(outbox_ids))})',
+                tuple(outbox_ids)
+            )
+        conn.commit()
+        return len(rows)
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+class SyncOutboxWorker(threading.Thread):
+    """Фоновый поток, периодически разбирающий очередь изменений"""
+
+    def __init__(self, connect, interval=1.0, batch_size=500):
+        super().__init__(name='sync-outbox-worker', daemon=True)
+        self._connect = connect
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop_event = threading.Event()
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                conn = self._connect()
+                try:
+                    while not self._stop_event.is_set():
+                        count = drain_batch(conn, self.batch_size)
+                        if count:
+                            self.processed += count
+                            self.batches += 1
+                        if count < self.batch_size:
+                            break
+                finally:
+                    conn.close()
+            except mysql.connector.Error:
+                self.errors += 1
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        return {
+            'running': self.is_alive(),
+            'processed': self.processed,
+            'batches': self.batches,
+            'errors': self.errors,
+        }
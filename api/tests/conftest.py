@@ -0,0 +1,94 @@
+# Тесты API: cd api && python -m pytest tests
+#
+# Модульные тесты работают без БД. Тесты с фикстурами db, client и
+# make_user идут на отдельной тестовой базе MySQL 8 со схемой приложения и
+# миграциями api/sql/*.sql (как база для bench/seed.py) и пропускаются,
+# если она не задана: TEST_DB_HOST, TEST_DB_USER, TEST_DB_PASSWORD,
+# TEST_DB_NAME. Тесты создают собственных пользователей со случайными
+# телефонами, поэтому базу можно не очищать между прогонами.
+import os
+import sys
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DB_CONFIG = None
+if os.environ.get('TEST_DB_NAME'):
+    TEST_DB_CONFIG = {
+        'host': os.environ.get('TEST_DB_HOST', 'localhost'),
+        'user': os.environ.get('TEST_DB_USER', 'flutter_user'),
+        'password': os.environ.get('TEST_DB_PASSWORD', '1234'),
+        'database': os.environ['TEST_DB_NAME'],
+    }
+    # app.py читает подключение из DB_* при импорте
+    os.environ.update(
+        DB_HOST=TEST_DB_CONFIG['host'],
+        DB_USER=TEST_DB_CONFIG['user'],
+        DB_PASSWORD=TEST_DB_CONFIG['password'],
+        DB_NAME=TEST_DB_CONFIG['database'],
+    )
+
+# Фоновые потоки тесты запускают сами, когда нужно
+os.environ.setdefault('BACKGROUND_WORKERS', '0')
+
+# Хеширование в потоке запроса: тестам не нужен пул процессов
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+os.environ.setdefault('PASSWORD_HASH_COST', '10')
+
+
+@pytest.fixture
+def db():
+    if TEST_DB_CONFIG is None:
+        pytest.skip('TEST_DB_NAME не задана')
+    import mysql.connector
+    conn = mysql.connector.connect(**TEST_DB_CONFIG)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def client():
+    if TEST_DB_CONFIG is None:
+        pytest.skip('TEST_DB_NAME не задана')
+    import app
+    return app.app.test_client()
+
+
+def auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def make_user(client):
+    """Регистрирует и авторизует нового пользователя; balance - сумма
+    пополнения основного счёта"""
+
+    def create(user_type='individual', balance=0, password='password'):
+        phone = '7' + str(uuid.uuid4().int)[:10]
+        response = client.post('/api/register', json={
+            'phone': phone,
+            'password': password,
+            'first_name': 'Тест',
+            'last_name': 'Тестов',
+            'birth_date': '1990-01-01',
+            'user_type': user_type,
+            'history_type': 1,
+        })
+        assert response.status_code == 201, response.get_json()
+        login = client.post('/api/login', json={'phone': phone, 'password': password}).get_json()
+        headers = auth(login['token'])
+        user_id = login['user_id']
+        accounts = client.get(f'/api/user/{user_id}/accounts', headers=headers).get_json()
+        account_id = min(acc['account_id'] for acc in accounts if acc['type_id'] == 1)
+        if balance:
+            response = client.post(f'/api/accounts/{account_id}/deposit', json={'amount': balance},
+                                   headers=headers)
+            assert response.status_code == 200, response.get_json()
+        return SimpleNamespace(user_id=user_id, phone=phone, password=password, headers=headers,
+                               token=login['token'], refresh_token=login['refresh_token'],
+                               account_id=account_id, accounts=accounts)
+
+    return create
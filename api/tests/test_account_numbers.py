@@ -0,0 +1,174 @@
+from decimal import Decimal
+
+import pytest
+
+import app
+from account_numbers import (
+    CURRENT_ACCOUNT_PREFIX, AccountNumberAllocator, AccountNumberError, format_account_number,
+    is_valid_account_number, luhn_check_digit, normalize_account_number,
+)
+
+
+def legacy_number(account_id, prefix=CURRENT_ACCOUNT_PREFIX):
+    """Номер прежней схемы: префикс + 10 цифр id, без контрольной цифры"""
+    return f'{prefix}{account_id:010d}'
+
+
+def legacy_id(start):
+    """Первый id от start, номер которого не проходит проверку Луна"""
+    return next(i for i in range(start, start + 10) if luhn_check_digit(legacy_number(i)[:-1]) != str(i % 10))
+
+
+LEGACY_ID = legacy_id(1)
+
+
+def test_luhn_check_digit():
+    assert luhn_check_digit('7992739871') == '3'
+    assert luhn_check_digit('0') == '0'
+
+
+def test_formatted_number_is_valid():
+    number = format_account_number(CURRENT_ACCOUNT_PREFIX, 123)
+    assert number == '40817810000000123' + luhn_check_digit('40817810000000123')
+    assert len(number) == 18
+    assert is_valid_account_number(number)
+    broken = number[:-1] + str((int(number[-1]) + 1) % 10)
+    assert not is_valid_account_number(broken)
+
+
+@pytest.mark.parametrize('prefix, serial', [('4081781', 1), ('4081781x', 1), (CURRENT_ACCOUNT_PREFIX, 0),
+                                            (CURRENT_ACCOUNT_PREFIX, 10 ** 9)])
+def test_bad_prefix_or_serial_is_rejected(prefix, serial):
+    with pytest.raises(AccountNumberError):
+        format_account_number(prefix, serial)
+
+
+@pytest.mark.parametrize('value', [None, 42, '', '4081781000000012', '4081781000000012345', '40817810abcdefgh12'])
+def test_malformed_numbers_are_invalid(value):
+    assert not is_valid_account_number(value)
+
+
+def test_numbers_from_before_the_migration_are_valid_up_to_the_bound():
+    number = legacy_number(LEGACY_ID)
+    assert not is_valid_account_number(number)
+    assert is_valid_account_number(number, {CURRENT_ACCOUNT_PREFIX: 100})
+    assert not is_valid_account_number(number, {CURRENT_ACCOUNT_PREFIX: LEGACY_ID - 1})
+    assert not is_valid_account_number(number, {'40817820': 100})
+
+
+def test_number_is_normalized():
+    assert normalize_account_number('4081 7810-0000 0001 23') == '408178100000000123'
+    assert normalize_account_number(40817810000000123) is None
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = 1
+
+    def execute(self, query, params=None):
+        self.db.queries.append(query)
+        if query.startswith('UPDATE account_number_sequences'):
+            self.db.next_value += params[0]
+
+    def fetchone(self):
+        return (self.db.next_value,)
+
+    def fetchall(self):
+        return [(CURRENT_ACCOUNT_PREFIX, 100)]
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self, next_value=1):
+        self.next_value = next_value
+        self.queries = []
+
+    def __call__(self):
+        return self
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_allocator_hands_out_blocks():
+    db = FakeDatabase(next_value=10)
+    allocator = AccountNumberAllocator(db, block_size=2)
+    numbers = [allocator.allocate() for _ in range(3)]
+    assert numbers == [format_account_number(CURRENT_ACCOUNT_PREFIX, serial) for serial in (10, 11, 12)]
+    assert allocator.stats()['reserved_blocks'] == 2
+
+
+def test_allocator_reads_legacy_bounds_once():
+    db = FakeDatabase()
+    allocator = AccountNumberAllocator(db)
+    assert allocator.is_valid(format_account_number(CURRENT_ACCOUNT_PREFIX, 5))
+    assert db.queries == []  # верная контрольная цифра - без запроса
+    assert allocator.is_valid(legacy_number(LEGACY_ID))
+    assert not allocator.is_valid(legacy_number(legacy_id(101)))
+    assert db.queries.count('SELECT prefix, legacy_max FROM account_number_sequences') == 1
+
+
+def headers():
+    token = app.token_issuer.access_token({'user_id': 990020, 'role_id': 1, 'user_type': 'individual'})
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.mark.parametrize('body', [
+    {'to_account_number': '123'},
+    {'to_account_number': None, 'to_account_id': None},
+    {'to_account_number': format_account_number(CURRENT_ACCOUNT_PREFIX, 5), 'to_account_id': 2},
+])
+def test_transfer_rejects_bad_recipient_number(body, monkeypatch):
+    monkeypatch.setattr(app.account_numbers, '_legacy_bounds', {})
+    response = app.app.test_client().post('/api/transfer', json={
+        'from_account_id': 1, 'amount': 1, **body,
+    }, headers=headers())
+    assert response.status_code == 400
+
+
+def test_transfer_rejects_number_without_check_digit(monkeypatch):
+    monkeypatch.setattr(app.account_numbers, '_legacy_bounds', {CURRENT_ACCOUNT_PREFIX: LEGACY_ID - 1})
+    response = app.app.test_client().post('/api/transfer', json={
+        'from_account_id': 1, 'amount': 1, 'to_account_number': legacy_number(LEGACY_ID),
+    }, headers=headers())
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Неверный номер счета'
+
+
+def test_transfer_by_account_number(client, make_user):
+    payer = make_user(balance=100)
+    payee = make_user()
+    number = payee.accounts[0]['account_number']
+    spaced = ' '.join(number[i:i + 4] for i in range(0, len(number), 4))
+    response = client.post('/api/transfer', json={
+        'from_account_id': payer.account_id, 'to_account_number': spaced, 'amount': 10,
+    }, headers=payer.headers)
+    assert response.status_code == 200, response.get_json()
+    accounts = client.get(f'/api/user/{payee.user_id}/accounts', headers=payee.headers).get_json()
+    assert Decimal(accounts[0]['balance']) == Decimal('10.00')
+
+
+def test_batch_rejects_bad_account_number(client, make_user):
+    payer = make_user(user_type='business', balance=100)
+    payee = make_user()
+    response = client.post('/api/transfers/batch', json={
+        'from_account_id': payer.account_id,
+        'transfers': [
+            {'to_account_number': payee.accounts[0]['account_number'], 'amount': 1},
+            {'to_account_number': '40817810', 'amount': 1},
+        ],
+    }, headers=payer.headers)
+    assert response.status_code == 400
+    assert [r['status'] for r in response.get_json()['results']] == ['ok', 'error']
@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+import activity_rollup
+from activity_rollup import ActivityDelta
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.calls = []
+
+    def executemany(self, query, rows):
+        self.calls.append((query, rows))
+
+
+def test_deltas_are_merged_per_user_in_lock_order():
+    delta = ActivityDelta()
+    delta.add(7, transfers=1, balance='-10.50', active=True)
+    delta.add(3, balance=10.5)
+    delta.add(7, balance=Decimal('2.25'), bonus='0.10')
+
+    rows = delta.rows()
+    assert [row[0] for row in rows] == [3, 7]
+    assert rows[0][1:] == (0, Decimal('10.5'), Decimal('0'), None)
+    user_id, transfers, balance, bonus, last_activity = rows[1]
+    assert (transfers, balance, bonus) == (1, Decimal('-8.25'), Decimal('0.10'))
+    assert last_activity is not None
+
+
+def test_apply_writes_one_upsert():
+    cursor = RecordingCursor()
+    ActivityDelta().apply(cursor)
+    assert cursor.calls == []
+
+    delta = ActivityDelta()
+    delta.add(1, transfers=1)
+    delta.apply(cursor)
+    assert cursor.calls == [(activity_rollup.UPSERT_SQL, delta.rows())]
+
+
+def test_admin_activity_follows_transfers(client, make_user, db):
+    payer = make_user(balance=100)
+    payee = make_user()
+    client.post('/api/transfer-by-phone', json={
+        'from_account_id': payer.account_id, 'recipient_phone': payee.phone, 'amount': 40,
+    }, headers=payer.headers)
+
+    cursor = db.cursor(dictionary=True)
+    cursor.execute('SELECT * FROM user_activity_rollup WHERE user_id IN (%s, %s) ORDER BY user_id',
+                   (payer.user_id, payee.user_id))
+    rows = {row['user_id']: row for row in cursor.fetchall()}
+    cursor.close()
+    assert rows[payer.user_id]['total_transfers'] == 1
+    assert rows[payer.user_id]['total_balance'] == Decimal('60.00')
+    assert rows[payee.user_id]['total_balance'] == Decimal('40.00')
+    assert rows[payer.user_id]['last_activity_at'] is not None
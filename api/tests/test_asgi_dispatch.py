@@ -0,0 +1,95 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, request
+
+import app_async
+
+
+async def call(asgi_app, path, method='GET', body=b'', headers=(), query_string=b'', sent=None):
+    """Один HTTP-запрос к ASGI-приложению; возвращает (статус, тело)"""
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'path': path, 'root_path': '',
+             'query_string': query_string, 'headers': list(headers), 'server': ('localhost', 80)}
+    sent = [] if sent is None else sent
+    chunks = [body[:3], body[3:]]
+
+    async def receive():
+        return {'type': 'http.request', 'body': chunks.pop(0), 'more_body': bool(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    await asyncio.wait_for(asgi_app(scope, receive, send), 10)
+    status = next(m['status'] for m in sent if m['type'] == 'http.response.start')
+    return status, b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+
+
+def slow_app(barrier):
+    wsgi = Flask('slow')
+
+    @wsgi.route('/slow')
+    def slow():
+        # Оба запроса должны оказаться здесь одновременно
+        barrier.wait(timeout=5)
+        time.sleep(0.2)
+        return threading.current_thread().name
+
+    return wsgi
+
+
+def test_flask_requests_run_concurrently():
+    barrier = threading.Barrier(2)
+    executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='test-wsgi')
+    asgi_app = app_async.ThreadedWsgiToAsgi(slow_app(barrier), executor)
+
+    async def both():
+        return await asyncio.gather(call(asgi_app, '/slow'), call(asgi_app, '/slow'))
+
+    started = time.monotonic()
+    try:
+        results = asyncio.run(both())
+    finally:
+        executor.shutdown()
+    assert [status for status, _ in results] == [200, 200]
+    assert time.monotonic() - started < 0.39
+    names = {body.decode() for _, body in results}
+    assert len(names) == 2 and all(name.startswith('test-wsgi') for name in names)
+
+
+def test_request_and_streamed_response_reach_flask():
+    wsgi = Flask('echo')
+
+    @wsgi.route('/echo', methods=['POST'])
+    def echo():
+        return {'json': request.get_json(), 'q': request.args['q'], 'x': request.headers['X-Test']}
+
+    @wsgi.route('/stream')
+    def stream():
+        return wsgi.response_class((f'{i};' for i in range(3)), mimetype='text/event-stream')
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    asgi_app = app_async.ThreadedWsgiToAsgi(wsgi, executor)
+    sent = []
+    try:
+        status, body = asyncio.run(call(asgi_app, '/echo', 'POST', b'{"a": 1}', query_string=b'q=2', headers=[
+            (b'content-type', b'application/json'), (b'content-length', b'8'), (b'x-test', b'a'), (b'x-test', b'b'),
+        ]))
+        stream_status, stream_body = asyncio.run(call(asgi_app, '/stream', sent=sent))
+    finally:
+        executor.shutdown()
+    assert status == 200
+    assert json.loads(body) == {'json': {'a': 1}, 'q': '2', 'x': 'a,b'}
+    assert (stream_status, stream_body) == (200, b'0;1;2;')
+    # Каждая часть потокового ответа отправлена отдельным сообщением
+    assert [m.get('body') for m in sent[1:]] == [b'0;', b'1;', b'2;', None]
+
+
+def test_dispatcher_sends_other_routes_to_flask():
+    status, body = asyncio.run(call(app_async.asgi_app, '/metrics'))
+    assert status == 200
+    assert b'http_requests_total' in body
+    assert not app_async.asgi_app._is_async({'path': '/metrics', 'method': 'GET'})
+    assert app_async.asgi_app._is_async({'path': '/api/flights', 'method': 'GET'})
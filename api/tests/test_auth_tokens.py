@@ -0,0 +1,222 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import jwt
+import pytest
+
+import app
+import async_db
+import auth_tokens
+from auth_tokens import BloomFilter, RevocationSet, RevocationSync, TokenIssuer, hash_refresh_token
+
+SECRET = 'test-secret-key-of-at-least-32-bytes'
+USER = {'user_id': 7, 'role_id': 1, 'user_type': 'individual'}
+
+
+def test_access_token_round_trip():
+    issuer = TokenIssuer(SECRET, access_ttl=60)
+    claims = issuer.decode(issuer.access_token(USER))
+    assert {k: claims[k] for k in USER} == USER
+    assert claims['typ'] == 'access' and claims['jti']
+    assert claims['exp'] - claims['iat'] <= 60
+
+
+def test_foreign_expired_and_non_access_tokens_are_rejected():
+    issuer = TokenIssuer(SECRET, access_ttl=60)
+    with pytest.raises(jwt.InvalidTokenError):
+        TokenIssuer('other-secret-key-of-at-least-32-bytes').decode(issuer.access_token(USER))
+    expired = jwt.encode({'user_id': 7, 'exp': int(time.time()) - 1}, SECRET, 'HS256')
+    with pytest.raises(jwt.InvalidTokenError):
+        issuer.decode(expired)
+    refresh_like = jwt.encode({'typ': 'refresh', 'user_id': 7, 'exp': int(time.time()) + 60}, SECRET, 'HS256')
+    with pytest.raises(jwt.InvalidTokenError):
+        issuer.decode(refresh_like)
+    # Старый формат - только user_id и exp
+    legacy = jwt.encode({'user_id': 7, 'exp': int(time.time()) + 60}, SECRET, 'HS256')
+    assert issuer.decode(legacy)['user_id'] == 7
+
+
+def test_refresh_token_is_stored_as_hash():
+    token, token_hash, expires_at = TokenIssuer(SECRET, refresh_ttl=3600).refresh_token()
+    assert token_hash == hash_refresh_token(token) != token
+    assert len(token_hash) == 64
+    assert timedelta(seconds=3590) < expires_at - auth_tokens.utcnow() <= timedelta(seconds=3600)
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+
+class AsyncRecordingCursor(RecordingCursor):
+    async def execute(self, query, params=None):
+        super().execute(query, params)
+
+
+def test_sync_and_async_servers_issue_tokens_the_same_way():
+    issuer = TokenIssuer(SECRET)
+    cursor = RecordingCursor()
+    tokens = issuer.issue(cursor, USER)
+    async_cursor = AsyncRecordingCursor()
+    async_tokens = asyncio.run(async_db.issue_tokens(async_cursor, issuer, USER))
+
+    assert tokens.keys() == async_tokens.keys() == {'token', 'refresh_token', 'expires_in'}
+    for (query, params), refresh in ((cursor.executed[0], tokens['refresh_token']),
+                                     (async_cursor.executed[0], async_tokens['refresh_token'])):
+        assert query == auth_tokens.INSERT_REFRESH_SQL
+        assert params[:2] == (hash_refresh_token(refresh), USER['user_id'])
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f'u{i}' for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f'j{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_user_revocation_covers_tokens_issued_before_it():
+    revocations = RevocationSet()
+    now = time.time()
+    revocations.add_user(7, now, now + 60)
+    assert revocations.is_revoked({'user_id': 7, 'iat': now - 1})
+    assert not revocations.is_revoked({'user_id': 7, 'iat': now + 1})
+    assert not revocations.is_revoked({'user_id': 8, 'iat': now - 1})
+    # Более ранний отзыв не отменяет более поздний
+    revocations.add_user(7, now - 10, now + 60)
+    assert revocations.is_revoked({'user_id': 7, 'iat': now - 5})
+
+
+def test_single_token_revocation_and_prune():
+    revocations = RevocationSet()
+    now = time.time()
+    revocations.add_jti('a', now + 60)
+    revocations.add_jti('b', now - 1)
+    assert revocations.is_revoked({'user_id': 7, 'jti': 'a'})
+    assert not revocations.is_revoked({'user_id': 7, 'jti': 'c'})
+    revocations.prune(now)
+    assert revocations.stats()['jtis'] == 1
+    assert not revocations.is_revoked({'user_id': 7, 'jti': 'b'})
+    assert revocations.is_revoked({'user_id': 7, 'jti': 'a'})
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.commits = 0
+
+    def cursor(self, dictionary=False):
+        return self._cursor
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_sync_loads_rows_and_reads_new_ones_with_overlap():
+    now = auth_tokens.utcnow()
+    cursor = FakeCursor([
+        {'user_id': 7, 'jti': None, 'not_before': now, 'expires_at': now + timedelta(minutes=5)},
+        {'user_id': 8, 'jti': 'x', 'not_before': now, 'expires_at': now + timedelta(minutes=5)},
+    ])
+    revocations = RevocationSet()
+    sync = RevocationSync(None, revocations, overlap=60)
+    sync.sync_once(FakeConnection(cursor))
+    assert sync.loaded == 2
+    assert revocations.is_revoked({'user_id': 8, 'jti': 'x'})
+    assert revocations.is_revoked({'user_id': 7, 'iat': auth_tokens.to_timestamp(now) - 1})
+
+    cursor.executed.clear()
+    sync.sync_once(FakeConnection(cursor))
+    query, params = cursor.executed[0]
+    assert 'not_before > %s' in query
+    assert params[0] == now - timedelta(seconds=60)
+
+
+class FakeWorker:
+    def __init__(self):
+        self.starts = 0
+
+    def start(self):
+        self.starts += 1
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    fakes = {name: FakeWorker() for name in ('bonus_worker', 'sync_outbox_worker', 'hold_sweeper', 'revocation_sync')}
+    for name, fake in fakes.items():
+        monkeypatch.setattr(app, name, fake)
+    monkeypatch.setattr(app, '_workers_started', False)
+    return fakes
+
+
+def test_background_workers_start_once_on_first_request(workers, monkeypatch):
+    monkeypatch.setattr(app, 'BACKGROUND_WORKERS', True)
+    client = app.app.test_client()
+    client.get('/api/flights/unknown')
+    client.get('/api/flights/unknown')
+    app.ensure_background_workers()
+    assert [w.starts for w in workers.values()] == [1, 1, 1, 1]
+
+
+def test_background_workers_can_be_disabled(workers, monkeypatch):
+    monkeypatch.setattr(app, 'BACKGROUND_WORKERS', False)
+    app.ensure_background_workers()
+    assert [w.starts for w in workers.values()] == [0, 0, 0, 0]
+
+
+def test_revocation_reaches_another_process(client, make_user, db):
+    user = make_user()
+    old_claims = app.token_issuer.decode(user.token)
+    response = client.post(f'/api/user/{user.user_id}/change-password', json={
+        'old_password': user.password, 'new_password': 'new-password',
+    }, headers=user.headers)
+    assert response.status_code == 200
+    new_claims = app.token_issuer.decode(response.get_json()['token'])
+
+    # Второй экземпляр приложения узнаёт об отзыве только из token_revocations
+    other = RevocationSet()
+    RevocationSync(None, other).sync_once(db)
+    assert other.is_revoked(old_claims)
+    assert not other.is_revoked(new_claims)
+
+
+def test_refresh_token_rotation_and_reuse(client, make_user):
+    user = make_user()
+    response = client.post('/api/token/refresh', json={'refresh_token': user.refresh_token})
+    assert response.status_code == 200
+    rotated = response.get_json()
+    assert rotated['refresh_token'] != user.refresh_token
+    assert client.get(f'/api/user/{user.user_id}', headers={
+        'Authorization': f'Bearer {rotated["token"]}'
+    }).status_code == 200
+
+    # Повторное предъявление заменённого токена отзывает все сессии
+    response = client.post('/api/token/refresh', json={'refresh_token': user.refresh_token})
+    assert response.status_code == 401
+    response = client.post('/api/token/refresh', json={'refresh_token': rotated['refresh_token']})
+    assert response.status_code == 401
+    assert client.get(f'/api/user/{user.user_id}', headers={
+        'Authorization': f'Bearer {rotated["token"]}'
+    }).status_code == 401
@@ -0,0 +1,83 @@
+from decimal import Decimal
+
+import app
+
+
+def headers_for(user_type, user_id=990010):
+    token = app.token_issuer.access_token({'user_id': user_id, 'role_id': 1, 'user_type': user_type})
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_only_business_clients_may_batch():
+    response = app.app.test_client().post('/api/transfers/batch', json={
+        'from_account_id': 1, 'transfers': [{'to_account_id': 2, 'amount': 1}],
+    }, headers=headers_for('individual'))
+    assert response.status_code == 403
+
+
+def test_empty_and_oversized_batches_are_rejected():
+    client = app.app.test_client()
+    response = client.post('/api/transfers/batch', json={'from_account_id': 1, 'transfers': []},
+                           headers=headers_for('business'))
+    assert response.status_code == 400
+    items = [{'to_account_id': 2, 'amount': 1}] * (app.BATCH_TRANSFER_MAX_ITEMS + 1)
+    response = client.post('/api/transfers/batch', json={'from_account_id': 1, 'transfers': items},
+                           headers=headers_for('business'))
+    assert response.status_code == 400
+
+
+def balance(client, user, account_id=None):
+    accounts = client.get(f'/api/user/{user.user_id}/accounts', headers=user.headers).get_json()
+    account_id = account_id or user.account_id
+    return Decimal(next(acc['balance'] for acc in accounts if acc['account_id'] == account_id))
+
+
+def test_batch_moves_funds_atomically(client, make_user):
+    payer = make_user(user_type='business', balance=1000)
+    first, second = make_user(), make_user()
+    response = client.post('/api/transfers/batch', json={
+        'from_account_id': payer.account_id,
+        'transfers': [
+            {'to_account_id': first.account_id, 'amount': '100.00'},
+            {'recipient_phone': second.phone, 'amount': '50.25'},
+            {'to_account_id': first.account_id, 'amount': '10'},
+        ],
+    }, headers=payer.headers)
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert body['count'] == 3
+    assert Decimal(body['total_amount']) == Decimal('160.25')
+    assert all(r['status'] == 'ok' and r['transaction_uuid'] for r in body['results'])
+    assert balance(client, payer) == Decimal('839.75')
+    assert balance(client, first) == Decimal('110.00')
+    assert balance(client, second) == Decimal('50.25')
+
+
+def test_one_bad_item_rejects_the_whole_batch(client, make_user):
+    payer = make_user(user_type='business', balance=1000)
+    payee = make_user()
+    response = client.post('/api/transfers/batch', json={
+        'from_account_id': payer.account_id,
+        'transfers': [
+            {'to_account_id': payee.account_id, 'amount': 100},
+            {'recipient_phone': '70000000000', 'amount': 5},
+            {'to_account_id': payee.account_id, 'amount': -1},
+        ],
+    }, headers=payer.headers)
+    assert response.status_code == 400
+    statuses = [r['status'] for r in response.get_json()['results']]
+    assert statuses == ['ok', 'error', 'error']
+    assert balance(client, payer) == Decimal('1000.00')
+    assert balance(client, payee) == Decimal('0.00')
+
+
+def test_batch_over_balance_is_rejected(client, make_user):
+    payer = make_user(user_type='business', balance=100)
+    payee = make_user()
+    response = client.post('/api/transfers/batch', json={
+        'from_account_id': payer.account_id,
+        'transfers': [{'to_account_id': payee.account_id, 'amount': 60}] * 2,
+    }, headers=payer.headers)
+    assert response.status_code == 400
+    assert Decimal(response.get_json()['total_amount']) == Decimal('120')
+    assert balance(client, payer) == Decimal('100.00')
@@ -0,0 +1,149 @@
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+import mysql.connector
+
+import activity_rollup
+import bonus_outbox
+from delta_sync import INSERT_CHANGE_SQL, ChangeLog
+
+
+class RecordingCursor:
+    """results - ответы на fetchall по очереди, дальше пустые списки"""
+
+    lastrowid = 1
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def executemany(self, query, rows):
+        self.executed.append((query, rows))
+
+    def fetchall(self):
+        return self.results.pop(0) if self.results else []
+
+    def fetchone(self):
+        return {'last_id': 100}
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, dictionary=False):
+        return self._cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+def outbox_row(outbox_id, user_id, amount):
+    return {'outbox_id': outbox_id, 'user_id': user_id, 'amount': Decimal(amount),
+            'description': f'Бонус {outbox_id}', 'created_at': datetime(2024, 1, outbox_id)}
+
+
+def test_batch_is_settled_with_one_update_per_table():
+    rows = [outbox_row(1, 9, '0.50'), outbox_row(2, 4, '1.00'), outbox_row(3, 9, '0.25')]
+    inserted = [{'operation_id': 101, 'user_id': 9}, {'operation_id': 102, 'user_id': 4},
+                {'operation_id': 103, 'user_id': 9}]
+    cursor = RecordingCursor(inserted)
+    changes = ChangeLog()
+    bonus_outbox._settle(cursor, rows, changes)
+
+    (update, update_params), (last, last_params), (insert, operations), (select, select_params), \
+        (upsert, activity), (delete, deleted) = cursor.executed
+    assert update.startswith('UPDATE users SET bonus_balance')
+    # Суммы по пользователям в порядке user_id, затем список user_id для IN
+    assert update_params == (4, Decimal('1.00'), 9, Decimal('0.75'), 4, 9)
+    assert 'MAX(operation_id)' in last and last_params == (4, 9)
+    assert insert.startswith('INSERT INTO bonus_operations')
+    assert [op[0] for op in operations] == [9, 4, 9]
+    assert select_params == (4, 9, 100)
+    assert upsert == activity_rollup.UPSERT_SQL
+    assert [(row[0], row[3]) for row in activity] == [(4, Decimal('1.00')), (9, Decimal('0.75'))]
+    assert delete.startswith('DELETE FROM bonus_accrual_outbox')
+    assert deleted == (1, 2, 3)
+
+    # Новые операции в журнале владельцев, профиль - только версия ресурса
+    assert changes.version_rows() == [(4, 1), (9, 2)]
+    assert changes.change_rows(9, 2) == [(9, 1, 'bonus_operations', 101), (9, 2, 'bonus_operations', 103)]
+    assert changes.resource_rows() == [(4, 'bonus_operations'), (4, 'users'),
+                                       (9, 'bonus_operations'), (9, 'users')]
+
+
+def test_empty_batch_writes_nothing():
+    cursor = RecordingCursor()
+    conn = FakeConnection(cursor)
+    assert bonus_outbox.drain_batch(conn) == 0
+    assert len(cursor.executed) == 1  # только выборка очереди
+    assert conn.commits == 1
+
+
+def test_drain_batch_commits_settled_rows():
+    cursor = RecordingCursor([outbox_row(1, 9, '0.50')], [{'operation_id': 101, 'user_id': 9}])
+    conn = FakeConnection(cursor)
+    assert bonus_outbox.drain_batch(conn, batch_size=10) == 1
+    assert 'FOR UPDATE SKIP LOCKED' in cursor.executed[0][0]
+    assert cursor.executed[0][1] == (10,)
+    # Журнал синхронизации пишется последним, после удаления из очереди
+    queries = [query for query, params in cursor.executed]
+    assert queries.index(INSERT_CHANGE_SQL) \
+        > next(i for i, q in enumerate(queries) if q.startswith('DELETE FROM bonus_accrual_outbox'))
+    assert (conn.commits, conn.rollbacks) == (1, 0)
+
+
+def test_worker_survives_database_errors():
+    attempts = threading.Event()
+
+    def connect():
+        attempts.set()
+        raise mysql.connector.errors.InterfaceError(msg='Can\'t connect', errno=2003)
+
+    worker = bonus_outbox.BonusOutboxWorker(connect, interval=0.01)
+    worker.start()
+    attempts.wait(5)
+    worker.stop()
+    worker.join(5)
+    assert not worker.is_alive()
+    assert worker.stats()['errors'] >= 1
+
+
+def test_bonus_is_credited_after_drain(client, make_user, db):
+    payer = make_user(balance=1000)
+    payee = make_user()
+    client.post('/api/transfer-by-phone', json={
+        'from_account_id': payer.account_id, 'recipient_phone': payee.phone, 'amount': 200,
+    }, headers=payer.headers)
+
+    while bonus_outbox.drain_batch(db):
+        pass
+    cursor = db.cursor(dictionary=True)
+    cursor.execute('SELECT bonus_balance FROM users WHERE user_id = %s', (payer.user_id,))
+    assert cursor.fetchone()['bonus_balance'] == Decimal('1.00')
+    cursor.execute('SELECT COUNT(*) AS n FROM bonus_accrual_outbox WHERE user_id = %s', (payer.user_id,))
+    assert cursor.fetchone()['n'] == 0
+    cursor.close()
+
+
+def test_transfer_bonus_is_the_same_for_every_amount_type():
+    for amount in (1234.56, '1234.56', Decimal('1234.56')):
+        assert bonus_outbox.transfer_bonus(amount) == Decimal('6.17')
+    assert bonus_outbox.transfer_bonus(100) == Decimal('0.50')
+    # Меньше копейки - бонус не начисляется
+    assert bonus_outbox.transfer_bonus(0.5) == 0
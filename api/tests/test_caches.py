@@ -0,0 +1,93 @@
+import time
+
+import jwt
+import pytest
+
+import caches
+from caches import LRUTTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(caches.time, 'monotonic', clock)
+    return clock
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = LRUTTLCache(maxsize=10, ttl=60)
+    cache.set(1, 'a')
+    clock.now += 59
+    assert cache.get(1) == 'a'
+    clock.now += 2
+    assert cache.get(1) is None
+    assert cache.stats()['size'] == 0
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = LRUTTLCache(maxsize=2, ttl=60)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    cache.get(1)
+    cache.set(3, 'c')
+    assert cache.get(2) is None
+    assert cache.get(1) == 'a'
+    assert cache.get(3) == 'c'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidate_and_stats(clock):
+    cache = LRUTTLCache(maxsize=10, ttl=60)
+    cache.set(1, 'a')
+    cache.get(1)
+    cache.invalidate(1)
+    assert cache.get(1, 'missing') == 'missing'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_ratio']) == (1, 1, 0.5)
+
+
+def legacy_token(app, user_id):
+    """Токен старого формата - только user_id и exp"""
+    return jwt.encode({'user_id': user_id, 'exp': int(time.time()) + 60}, app.JWT_SECRET, app.JWT_ALGORITHM)
+
+
+def test_legacy_token_is_authorized_from_cache():
+    import app
+    app.principal_cache.set(990001, {'user_id': 990001, 'role_id': 3, 'user_type': 'individual'})
+    try:
+        response = app.app.test_client().get(
+            '/api/admin/stats', headers={'Authorization': f'Bearer {legacy_token(app, 990001)}'}
+        )
+        assert response.status_code == 200
+        assert response.get_json()['principal_cache']['hits'] >= 1
+    finally:
+        app.invalidate_principal(990001)
+
+
+def test_cached_role_is_enforced():
+    import app
+    app.principal_cache.set(990002, {'user_id': 990002, 'role_id': 1, 'user_type': 'individual'})
+    try:
+        response = app.app.test_client().get(
+            '/api/admin/stats', headers={'Authorization': f'Bearer {legacy_token(app, 990002)}'}
+        )
+        assert response.status_code == 403
+    finally:
+        app.invalidate_principal(990002)
+
+
+def test_update_user_invalidates_cached_principal(client, make_user):
+    import app
+    user = make_user()
+    app.principal_cache.set(user.user_id, {'user_id': user.user_id, 'role_id': 1, 'user_type': 'individual'})
+    response = client.put(f'/api/user/{user.user_id}', json={'first_name': 'Пётр'}, headers=user.headers)
+    assert response.status_code == 200
+    assert app.principal_cache.get(user.user_id) is None
@@ -0,0 +1,77 @@
+from decimal import Decimal
+
+import pytest
+
+from dashboard import DASHBOARD_SECTIONS, DashboardPlan, parse_fields, project
+
+PROFILE = {'user_id': 5, 'first_name': 'Анна', 'password_hash': 'x', 'bonus_balance': Decimal('3.00'),
+           'pending_bonus': Decimal('0.50')}
+ACCOUNTS = [{'account_id': 1, 'balance': Decimal('10.00'), 'is_active': 1},
+            {'account_id': 2, 'balance': Decimal('0.00'), 'is_active': 0}]
+
+
+def test_parse_fields():
+    assert parse_fields('') == dict.fromkeys(DASHBOARD_SECTIONS)
+    assert parse_fields('profile, transactions.amount,transactions.transaction_date,') == {
+        'profile': None, 'transactions': {'amount', 'transaction_date'},
+    }
+    # Раздел целиком поглощает отдельные поля в любом порядке
+    assert parse_fields('accounts.balance,accounts') == {'accounts': None}
+    assert parse_fields('accounts,accounts.balance') == {'accounts': None}
+    with pytest.raises(ValueError):
+        parse_fields('profile,passwords')
+
+
+def test_project():
+    assert project(None, {'a'}) is None
+    assert project({'a': 1, 'b': 2}, None) == {'a': 1, 'b': 2}
+    assert project({'a': 1, 'b': 2}, {'b'}) == {'b': 2}
+
+
+def test_plan_queries_only_what_is_needed():
+    plan = DashboardPlan(parse_fields('transactions.amount'))
+    assert (plan.needs_profile, plan.needs_accounts, plan.needs_transactions, plan.needs_settings) == \
+        (False, True, True, False)
+    plan = DashboardPlan(parse_fields('bonuses'))
+    assert plan.needs_profile and not plan.needs_accounts
+
+
+def test_private_sections_are_dropped_for_other_users():
+    plan = DashboardPlan(parse_fields(''), private=False)
+    assert set(plan.fields) == {'profile', 'accounts', 'transactions'}
+    assert not plan.needs_settings
+
+
+def test_build_hides_secrets_and_closed_accounts():
+    plan = DashboardPlan(parse_fields('profile.first_name,profile.password_hash,accounts.account_id,bonuses,'
+                                      'transactions,settings'))
+    result = plan.build(profile=PROFILE, accounts=ACCOUNTS, transactions=[{'transaction_id': 9}],
+                        next_cursor='c', settings={'theme': 'dark'}, sync_token='t')
+    assert result == {
+        'sync_token': 't',
+        'profile': {'first_name': 'Анна'},
+        'accounts': [{'account_id': 1}],
+        'transactions': [{'transaction_id': 9}],
+        'transactions_cursor': 'c',
+        'bonuses': {'balance': Decimal('3.50')},
+        'settings': {'theme': 'dark'},
+    }
+
+
+def test_bad_fields_are_rejected_before_queries():
+    import app
+    token = app.token_issuer.access_token({'user_id': 990020, 'role_id': 1, 'user_type': 'individual'})
+    response = app.app.test_client().get('/api/user/990020/dashboard?fields=nope',
+                                         headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+
+
+def test_dashboard_endpoint(client, make_user):
+    user = make_user(balance=50)
+    response = client.get(f'/api/user/{user.user_id}/dashboard?fields=accounts.balance,profile.user_id',
+                          headers=user.headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['profile'] == {'user_id': user.user_id}
+    assert {'balance': '50.00'} in body['accounts']
+    assert set(body) == {'sync_token', 'profile', 'accounts'}
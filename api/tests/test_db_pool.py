@@ -0,0 +1,148 @@
+import threading
+import time
+
+import mysql.connector
+import pytest
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeoutError, ScopedConnection
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.rollbacks = 0
+        self.ping_error = False
+        self.rollback_error = False
+
+    def ping(self, reconnect=False):
+        if self.ping_error:
+            raise mysql.connector.errors.InterfaceError('gone away')
+
+    def rollback(self):
+        if self.rollback_error:
+            raise mysql.connector.errors.OperationalError('lost connection')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+    def is_connected(self):
+        return not self.closed
+
+    def cursor(self, *args, **kwargs):
+        return object()
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    created = []
+
+    def connect(**config):
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    monkeypatch.setattr(db_pool.mysql.connector, 'connect', connect)
+    return created
+
+
+def make_pool(**kwargs):
+    kwargs.setdefault('size', 1)
+    kwargs.setdefault('max_overflow', 0)
+    kwargs.setdefault('timeout', 0.05)
+    return ConnectionPool({}, **kwargs)
+
+
+def test_released_connection_is_reused(connections):
+    pool = make_pool()
+    conn = pool.acquire()
+    conn.close()
+    conn.close()  # повторный close ничего не делает
+    again = pool.acquire()
+    assert again._raw is connections[0]
+    assert len(connections) == 1
+    assert connections[0].rollbacks == 1
+    assert pool.stats()['in_use'] == 1
+
+
+def test_exhausted_pool_times_out(connections):
+    pool = make_pool(size=1, max_overflow=1)
+    pool.acquire()
+    pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    stats = pool.stats()
+    assert stats['opened'] == 2
+    assert stats['timeouts'] == 1
+    assert stats['waits'] == 1
+
+
+def test_waiter_gets_connection_released_by_another_thread(connections):
+    pool = make_pool(timeout=2)
+    conn = pool.acquire()
+    threading.Timer(0.05, conn.close).start()
+    started = time.monotonic()
+    assert pool.acquire()._raw is connections[0]
+    assert time.monotonic() - started < 1
+    assert len(connections) == 1
+
+
+def test_overflow_connection_is_closed_on_return(connections):
+    pool = make_pool(size=1, max_overflow=1)
+    first = pool.acquire()
+    second = pool.acquire()
+    first.close()
+    second.close()
+    assert not connections[0].closed
+    assert connections[1].closed
+    assert pool.stats()['opened'] == 1
+
+
+def test_failed_ping_replaces_connection(connections):
+    pool = make_pool()
+    pool.acquire().close()
+    connections[0].ping_error = True
+    conn = pool.acquire()
+    assert conn._raw is connections[1]
+    assert connections[0].closed
+    assert pool.stats()['ping_failures'] == 1
+
+
+def test_idle_connection_is_recycled(connections):
+    pool = make_pool(recycle=0, pre_ping=False)
+    pool.acquire().close()
+    time.sleep(0.01)
+    assert pool.acquire()._raw is connections[1]
+    assert pool.stats()['recycled'] == 1
+
+
+def test_connection_failing_rollback_is_discarded(connections):
+    pool = make_pool()
+    conn = pool.acquire()
+    connections[0].rollback_error = True
+    conn.close()
+    assert connections[0].closed
+    assert pool.stats()['opened'] == 0
+    assert pool.acquire()._raw is connections[1]
+
+
+def test_scoped_connection_is_returned_only_by_release(connections):
+    pool = make_pool()
+    scoped = ScopedConnection(pool.acquire())
+    scoped.close()
+    assert pool.stats()['in_use'] == 1
+    scoped.release()
+    assert pool.stats()['in_use'] == 0
+
+
+def test_request_shares_one_connection(connections, monkeypatch):
+    import app
+    pool = make_pool()
+    monkeypatch.setattr(app, 'db_pool', pool)
+    with app.app.test_request_context('/'):
+        first = app.get_db_connection()
+        assert app.get_db_connection() is first
+        first.close()
+        assert pool.stats()['in_use'] == 1
+    assert pool.stats()['in_use'] == 0
@@ -0,0 +1,202 @@
+import threading
+
+import pytest
+
+import app
+import sync_outbox
+from delta_sync import (
+    BUMP_RESOURCE_VERSION_SQL, BUMP_SYNC_VERSION_SQL, ENQUEUE_CHANGE_SQL, INSERT_CHANGE_SQL, ChangeLog,
+    parse_sync_token,
+)
+
+
+class VersionCursor:
+    """Записывает запросы; на BUMP_SYNC_VERSION_SQL отдаёт в lastrowid
+    верх блока, как LAST_INSERT_ID(version + n)"""
+
+    def __init__(self, versions=None):
+        self.versions = dict(versions or {})
+        self.executed = []
+        self.lastrowid = None
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+        if query == BUMP_SYNC_VERSION_SQL:
+            user_id, count, _ = params
+            self.versions[user_id] = self.versions.get(user_id, 0) + count
+            self.lastrowid = self.versions[user_id]
+
+    def executemany(self, query, rows):
+        self.executed.append((query, rows))
+
+
+def test_transfer_is_logged_for_payer_and_queued_for_recipient():
+    changes = ChangeLog()
+    changes.add_transfer(77, 9, 90, 4, 40)
+    changes.touch(4, 'users')
+    assert changes.version_rows() == [(9, 2)]
+    assert changes.change_rows(9, 12) == [(9, 11, 'accounts', 90), (9, 12, 'transactions', 77)]
+    assert changes.resource_rows() == [(9, 'accounts'), (9, 'transactions')]
+    assert changes.outbox_rows() == [(4, 'accounts', 40), (4, 'transactions', 77), (4, 'users', None)]
+
+    # Строки получателя не блокируются: только вставка в очередь
+    cursor = VersionCursor()
+    changes.apply(cursor)
+    assert [params for query, params in cursor.executed if query == BUMP_SYNC_VERSION_SQL] == [(9, 2, 2)]
+    assert cursor.executed[-1] == (ENQUEUE_CHANGE_SQL, changes.outbox_rows())
+
+
+def test_recipient_who_also_pays_is_not_deferred():
+    changes = ChangeLog()
+    changes.add_transfer(1, 9, 90, 4, 40)
+    changes.add_transfer(2, 4, 41, 9, 91)
+    assert changes.version_rows() == [(4, 4), (9, 4)]
+    assert changes.outbox_rows() == []
+    # Пополнение и перевод между своими счетами - в той же транзакции
+    changes = ChangeLog()
+    changes.add_transfer(3, None, None, 5, 50)
+    changes.add_transfer(4, 6, 60, 6, 61)
+    assert changes.version_rows() == [(5, 2), (6, 3)]
+    assert changes.outbox_rows() == []
+
+
+def test_repeated_changes_and_missing_owner_are_skipped():
+    changes = ChangeLog()
+    changes.add_transfer(1, 5, 50, 5, 51)
+    changes.add_transfer(2, 5, 50, None, None)
+    changes.add(None, 'accounts', 3)
+    changes.touch(None, 'users')
+    assert changes.change_rows(5, 4) == [
+        (5, 1, 'accounts', 50), (5, 2, 'accounts', 51), (5, 3, 'transactions', 1), (5, 4, 'transactions', 2),
+    ]
+    assert changes.version_rows() == [(5, 4)]
+
+
+def test_touch_bumps_resource_without_log_entry():
+    changes = ChangeLog()
+    changes.touch(3, 'users')
+    changes.touch(3, 'users')
+    assert changes.version_rows() == []
+    assert changes.resource_rows() == [(3, 'users')]
+
+    cursor = VersionCursor()
+    changes.apply(cursor)
+    assert cursor.executed == [(BUMP_RESOURCE_VERSION_SQL, [(3, 'users')])]
+
+
+def test_apply_locks_versions_in_user_order():
+    changes = ChangeLog()
+    changes.add(10, 'accounts', 1)
+    changes.add(5, 'accounts', 6)
+    changes.add(10, 'transactions', 100)
+    changes.add(5, 'transactions', 100)
+    changes.touch(10, 'bonus_operations')
+    cursor = VersionCursor({5: 7})
+    changes.apply(cursor)
+
+    (bump5, params5), (bump10, params10), (insert, rows), (resources, resource_rows) = cursor.executed
+    assert bump5 == bump10 == BUMP_SYNC_VERSION_SQL
+    # Блок версий на пользователя, пользователи по возрастанию user_id
+    assert (params5, params10) == ((5, 2, 2), (10, 2, 2))
+    assert insert == INSERT_CHANGE_SQL
+    assert rows == [
+        (5, 8, 'accounts', 6), (5, 9, 'transactions', 100),
+        (10, 1, 'accounts', 1), (10, 2, 'transactions', 100),
+    ]
+    assert resources == BUMP_RESOURCE_VERSION_SQL
+    assert resource_rows == sorted(resource_rows)
+    assert (10, 'bonus_operations') in resource_rows
+
+
+def test_empty_log_writes_nothing():
+    cursor = VersionCursor()
+    ChangeLog().apply(cursor)
+    assert cursor.executed == []
+
+
+class OutboxCursor(VersionCursor):
+    def __init__(self, rows):
+        super().__init__()
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class OutboxConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.commits = 0
+
+    def cursor(self, dictionary=False):
+        return self._cursor
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_outbox_batch_is_logged_with_one_version_block_per_user():
+    cursor = OutboxCursor([
+        {'outbox_id': 1, 'user_id': 4, 'entity': 'accounts', 'entity_id': 40},
+        {'outbox_id': 2, 'user_id': 4, 'entity': 'transactions', 'entity_id': 77},
+        {'outbox_id': 3, 'user_id': 4, 'entity': 'accounts', 'entity_id': 40},
+        {'outbox_id': 4, 'user_id': 4, 'entity': 'transactions', 'entity_id': 78},
+        {'outbox_id': 5, 'user_id': 3, 'entity': 'users', 'entity_id': None},
+    ])
+    conn = OutboxConnection(cursor)
+    assert sync_outbox.drain_batch(conn, batch_size=5) == 5
+    queries = [query for query, _ in cursor.executed]
+    assert queries.count(BUMP_SYNC_VERSION_SQL) == 1
+    assert (INSERT_CHANGE_SQL, [(4, 1, 'accounts', 40), (4, 2, 'transactions', 77),
+                                (4, 3, 'transactions', 78)]) in cursor.executed
+    assert (BUMP_RESOURCE_VERSION_SQL, [(3, 'users'), (4, 'accounts'), (4, 'transactions')]) in cursor.executed
+    assert cursor.executed[-1][1] == (1, 2, 3, 4, 5)
+    assert conn.commits == 1
+
+
+@pytest.mark.parametrize('value', [None, '', '-1', 'abc'])
+def test_bad_sync_token_is_rejected(value):
+    with pytest.raises(ValueError):
+        parse_sync_token(value)
+
+
+def test_crossed_transfers_between_two_users_do_not_deadlock(client, make_user):
+    # X: счета x1 < x2, Y: счета y1 < y2. Переводы x1 -> y1 и y2 -> x2 блокируют
+    # счета без пересечения, а журнал обоих пользователей пишется в порядке user_id
+    x, y = make_user(balance=1000), make_user(balance=1000)
+    x2 = client.post(f'/api/user/{x.user_id}/accounts', json={'type_id': 1}, headers=x.headers).get_json()
+    y2 = client.post(f'/api/user/{y.user_id}/accounts', json={'type_id': 1}, headers=y.headers).get_json()
+    client.post(f'/api/accounts/{y2["account_id"]}/deposit', json={'amount': 1000}, headers=y.headers)
+    statuses = []
+
+    def send(payer, from_account_id, to_account_id):
+        for _ in range(10):
+            response = client.post('/api/transfer', json={
+                'from_account_id': from_account_id, 'to_account_id': to_account_id, 'amount': 1,
+            }, headers=payer.headers)
+            statuses.append(response.status_code)
+
+    pairs = [(x, x.account_id, y.account_id), (y, y2['account_id'], x2['account_id'])] * 4
+    threads = [threading.Thread(target=send, args=pair) for pair in pairs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert statuses == [200] * 80
+
+    # Каждый перевод попал в журнал обоих пользователей (журнал получателя -
+    # после разбора очереди)
+    conn = app.db_pool.acquire()
+    try:
+        while sync_outbox.drain_batch(conn, 1000):
+            pass
+    finally:
+        conn.close()
+    for user in (x, y):
+        body = client.get(f'/api/user/{user.user_id}/sync?since=0&limit=1000', headers=user.headers).get_json()
+        assert not body['has_more']
+        transfers = [tr for tr in body['changes']['transactions'] if tr['type_id'] == 1]
+        assert len(transfers) == 80
@@ -0,0 +1,152 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from flight_catalog import CATALOG_VERSION_SQL, FlightCatalog, FlightQuery, filter_flights
+
+
+def dumps(value):
+    return json.dumps(value, default=str, ensure_ascii=False).encode('utf-8')
+
+
+class FakeDatabase:
+    """queries - чтения каталога, version_reads - чтения общей версии"""
+
+    def __init__(self, flights):
+        self.flights = flights
+        self.version = 0
+        self.queries = 0
+        self.version_reads = 0
+
+    def connect(self):
+        return self
+
+    def cursor(self, dictionary=False):
+        return self
+
+    def execute(self, query):
+        if query == CATALOG_VERSION_SQL:
+            self.version_reads += 1
+        else:
+            self.queries += 1
+
+    def fetchone(self):
+        return {'version': self.version}
+
+    def fetchall(self):
+        return [dict(f) for f in self.flights]
+
+    def close(self):
+        pass
+
+
+def flight(ticket_id, departure_city, arrival_city, days):
+    departure = datetime.now().replace(microsecond=0) + timedelta(days=days)
+    return {'ticket_id': ticket_id, 'departure_city': departure_city, 'arrival_city': arrival_city,
+            'departure_time': departure}
+
+
+@pytest.fixture
+def db():
+    return FakeDatabase([
+        flight(1, 'Москва', 'Казань', 1),
+        flight(2, 'Москва', 'Сочи', 2),
+        flight(3, 'Казань', 'Сочи', 2),
+    ])
+
+
+def test_catalog_is_served_from_cache_until_invalidated(db):
+    catalog = FlightCatalog(db.connect, dumps)
+    assert catalog.cached() is None
+    first = catalog.current()
+    assert catalog.current() is first
+    assert catalog.cached() is first
+    assert db.queries == 1
+
+    catalog.invalidate()
+    assert catalog.cached() is None
+    db.flights = db.flights[1:]
+    second = catalog.current()
+    assert db.queries == 2
+    assert second.etag != first.etag
+    assert [f['ticket_id'] for f in json.loads(second.body)] == [2, 3]
+
+
+def test_change_in_another_process_is_seen_after_version_check(db, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('flight_catalog.time.monotonic', lambda: now[0])
+    catalog = FlightCatalog(db.connect, dumps, ttl=60, version_check=1)
+    first = catalog.current()
+    now[0] += 0.5
+    assert catalog.cached() is first
+    assert db.version_reads == 1
+
+    # Версия не менялась - снимок остаётся, каталог не перечитывается
+    now[0] += 1
+    assert catalog.cached() is None
+    assert catalog.current() is first
+    assert (db.version_reads, db.queries) == (2, 1)
+
+    # Другой процесс забронировал место и поднял версию
+    db.version += 1
+    db.flights = db.flights[1:]
+    assert catalog.current() is first
+    now[0] += 1
+    second = catalog.current()
+    assert (db.version_reads, db.queries) == (3, 2)
+    assert second.version == 1 and second.etag != first.etag
+
+
+def test_catalog_expires_when_nearest_flight_departs(db):
+    db.flights[0]['departure_time'] = datetime.now() - timedelta(seconds=1)
+    catalog = FlightCatalog(db.connect, dumps)
+    catalog.current()
+    assert catalog.cached() is None
+
+
+def test_filters_match_route_and_date(db):
+    snapshot = FlightCatalog(db.connect, dumps).current()
+    assert len(filter_flights(snapshot, departure_city='москва')) == 2
+    assert len(filter_flights(snapshot, departure_city='Москва', arrival_city='СОЧИ')) == 1
+    date = snapshot.flights[2]['departure_time'].date()
+    assert [json.loads(e)['ticket_id'] for e in filter_flights(snapshot, date=date)] == [2, 3]
+
+
+def test_query_pages_filtered_flights(db):
+    snapshot = FlightCatalog(db.connect, dumps).current()
+    query = FlightQuery(MultiDict({'arrival_city': 'Сочи', 'offset': '1', 'limit': '5'}),
+                        'arrival_city=Сочи&offset=1&limit=5'.encode('utf-8'))
+    body, total = query.render(snapshot)
+    assert total == 2
+    assert [f['ticket_id'] for f in json.loads(body)] == [3]
+    assert query.etag(snapshot).startswith(snapshot.etag + '-')
+
+    everything = FlightQuery(MultiDict(), b'')
+    assert everything.render(snapshot) == (snapshot.body, None)
+    assert everything.etag(snapshot) == snapshot.etag
+
+
+def test_bad_query_is_rejected():
+    with pytest.raises(ValueError):
+        FlightQuery(MultiDict({'date': 'завтра'}), b'')
+    with pytest.raises(ValueError):
+        FlightQuery(MultiDict({'limit': 'x'}), b'')
+
+
+def test_route_answers_not_modified(db, monkeypatch):
+    import app
+    catalog = FlightCatalog(db.connect, app.app.json.dumps_bytes)
+    monkeypatch.setattr(app, 'flight_catalog', catalog)
+    client = app.app.test_client()
+
+    response = client.get('/api/flights?departure_city=Москва')
+    assert response.status_code == 200
+    assert response.headers['X-Total-Count'] == '2'
+    etag = response.headers['ETag']
+
+    response = client.get('/api/flights?departure_city=Москва', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert client.get('/api/flights?date=x').status_code == 400
+    assert db.queries == 1
@@ -0,0 +1,68 @@
+import json
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+
+import pytest
+from flask import Flask
+
+import json_provider
+from json_provider import FastJSONProvider
+
+ROW = {
+    'amount': Decimal('1234.50'),
+    'when': datetime(2024, 5, 1, 12, 30, 15, 250000),
+    'day': date(2024, 5, 1),
+    'at': time(8, 15),
+    'raw': b'\x00\xff',
+    'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'name': 'Перевод',
+}
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def backend(request, monkeypatch):
+    if request.param == 'orjson':
+        if json_provider.orjson is None:
+            pytest.skip('orjson не установлен')
+    else:
+        monkeypatch.setattr(json_provider, 'orjson', None)
+    return request.param
+
+
+def test_types_are_encoded_the_same_by_both_backends(backend):
+    provider = FastJSONProvider(Flask(__name__))
+    assert json.loads(provider.dumps_bytes([ROW])) == [{
+        'amount': '1234.50',
+        'at': '08:15:00',
+        'day': '2024-05-01',
+        'id': '12345678-1234-5678-1234-567812345678',
+        'name': 'Перевод',
+        'raw': 'AP8=',
+        'when': '2024-05-01T12:30:15.250000',
+    }]
+    assert provider.dumps({'b': 1, 'a': 2}) == '{"a":2,"b":1}'
+    assert provider.dumps({2: 'b', 1: 'a'}) == '{"1":"a","2":"b"}'
+    assert provider.loads('{"a": [1, 2]}') == {'a': [1, 2]}
+
+
+def test_number_mode_keeps_decimals_numeric(backend):
+    provider = FastJSONProvider(Flask(__name__), decimal_mode='number')
+    assert json.loads(provider.dumps_bytes({'amount': Decimal('10.25')})) == {'amount': 10.25}
+
+
+def test_unknown_types_and_modes_are_rejected(backend):
+    provider = FastJSONProvider(Flask(__name__))
+    with pytest.raises(TypeError):
+        provider.dumps_bytes({'value': object()})
+    with pytest.raises(ValueError):
+        FastJSONProvider(Flask(__name__), decimal_mode='float')
+
+
+def test_jsonify_uses_provider(backend):
+    flask_app = Flask(__name__)
+    flask_app.json = FastJSONProvider(flask_app)
+    with flask_app.app_context():
+        response = flask_app.json.response({'amount': Decimal('1.10')})
+    assert response.mimetype == 'application/json'
+    assert response.get_data() == b'{"amount":"1.10"}\n'
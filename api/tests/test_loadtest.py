@@ -0,0 +1,57 @@
+import argparse
+import os
+import random
+
+import pytest
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench')
+
+
+@pytest.fixture
+def bench(monkeypatch):
+    # Скрипты bench импортируют друг друга как модули верхнего уровня
+    monkeypatch.syspath_prepend(BENCH_DIR)
+    import common
+    import loadtest
+    return common, loadtest
+
+
+class RecordingClient:
+    def __init__(self, next_cursor):
+        self.next_cursor = next_cursor
+        self.paths = []
+
+    def request(self, method, path):
+        self.paths.append(path)
+        return 200, b'[]', {'X-Next-Cursor': self.next_cursor}
+
+
+def test_parse_mix(bench):
+    _, loadtest = bench
+    assert loadtest.parse_mix('login=1,flights=2.5') == {'login': 1.0, 'flights': 2.5}
+    assert set(loadtest.parse_mix(loadtest.DEFAULT_MIX)) == set(loadtest.OPERATIONS)
+    with pytest.raises(argparse.ArgumentTypeError):
+        loadtest.parse_mix('login=1,unknown=1')
+
+
+def test_percentile_interpolates(bench):
+    common, _ = bench
+    assert common.percentile([], 95) == 0.0
+    assert common.percentile([5], 99) == 5
+    values = list(range(1, 101))
+    assert common.percentile(values, 50) == pytest.approx(50.5)
+    assert common.percentile(values, 100) == 100
+    assert common.percentile(list(reversed(values)), 0) == 1
+
+
+def test_history_pages_with_the_api_cursor(bench):
+    _, loadtest = bench
+    user = loadtest.VirtualUser('http://localhost', '70000000000', 'password', random.Random(1), None)
+    user.user_id = 5
+    user.client = RecordingClient('2024-05-01T12:30:15,42')
+    for _ in range(10):
+        user.history()
+    first_page = '/api/user/5/transactions?limit=50'
+    paged = [path for path in user.client.paths if path != first_page]
+    assert paged
+    assert set(paged) == {first_page + '&after=2024-05-01T12:30:15,42'}
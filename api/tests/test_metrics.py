@@ -0,0 +1,79 @@
+import pytest
+
+from metrics import Histogram, InstrumentedCursor, Metrics, RequestMetrics, normalize_sql
+
+
+class FakeCursor:
+    rowcount = 3
+
+    def execute(self, operation, params=None):
+        if operation == 'FAIL':
+            raise RuntimeError(operation)
+
+    def executemany(self, operation, seq_params):
+        pass
+
+    def __iter__(self):
+        return iter([1, 2])
+
+
+def test_normalize_sql_groups_queries_of_one_shape():
+    assert normalize_sql("SELECT * FROM users WHERE phone = '7900'  AND  id = 15") == \
+        'SELECT * FROM users WHERE phone = ? AND id = ?'
+    assert normalize_sql(b'DELETE FROM t WHERE id IN (%s, %s, %s)') == 'DELETE FROM t WHERE id IN (...)'
+    assert normalize_sql('SELECT "a\\"b", 1.5') == 'SELECT ?, ?'
+
+
+def test_histogram_counts_each_value_once():
+    hist = Histogram((1, 5, 10))
+    for value in (0.5, 1, 3, 7, 100):
+        hist.observe(value)
+    assert hist.counts == [2, 1, 1]
+    assert (hist.count, hist.sum) == (5, 111.5)
+
+
+def test_cursor_queries_are_counted_per_request():
+    current = RequestMetrics()
+    metrics = Metrics(lambda: current, slow_query_ms=10000)
+    cursor = metrics.cursor_wrapper(FakeCursor())
+    assert isinstance(cursor, InstrumentedCursor)
+    cursor.execute('SELECT 1')
+    cursor.executemany('INSERT INTO t VALUES (%s)', [(1,), (2,)])
+    with pytest.raises(RuntimeError):
+        cursor.execute('FAIL')
+    assert current.queries == 3
+    assert cursor.rowcount == 3
+    assert list(cursor) == [1, 2]
+
+
+def test_background_and_slow_queries():
+    metrics = Metrics(lambda: None, slow_query_ms=0)
+    metrics.observe_query('SELECT * FROM t WHERE id = 1', 0.002)
+    metrics.observe_query('SELECT * FROM t WHERE id = 2', 0.004)
+    [slow] = metrics.slow_queries()
+    assert slow == {'query': 'SELECT * FROM t WHERE id = ?', 'count': 2, 'total_ms': 6.0, 'max_ms': 4.0}
+    assert 'db_background_queries_total 2' in metrics.render()
+
+
+def test_render_prometheus_text():
+    metrics = Metrics(lambda: None)
+    request_metrics = RequestMetrics()
+    request_metrics.queries = 2
+    metrics.observe_request('get_flights', 'GET', 200, request_metrics)
+    metrics.observe_acquire(0.001)
+    text = metrics.render({'db_pool_in_use': 1})
+    assert 'http_requests_total{endpoint="get_flights",method="GET",status="200"} 1' in text
+    assert 'http_request_db_queries_bucket{endpoint="get_flights",le="2"} 1' in text
+    assert 'db_pool_acquire_seconds_count{} 1' in text
+    assert text.endswith('# TYPE db_pool_in_use gauge\ndb_pool_in_use 1\n')
+
+
+def test_metrics_endpoint_requires_token(monkeypatch):
+    import app
+    client = app.app.test_client()
+    monkeypatch.setattr(app, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 403
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert 'db_pool_in_use' in response.get_data(as_text=True)
@@ -0,0 +1,161 @@
+import binascii
+import threading
+from concurrent.futures import Future
+from hashlib import pbkdf2_hmac
+
+import pytest
+
+from passwords import SCHEMES, BcryptScheme, HashingPoolSaturated, PasswordHasher
+
+
+def test_hash_and_verify_in_process():
+    hasher = PasswordHasher(workers=0, cost=10)
+    stored = hasher.hash('secret')
+    assert stored.startswith('$2b$10$')
+    assert hasher.verify(stored, 'secret')
+    assert not hasher.verify(stored, 'wrong')
+    assert not hasher.verify('not a hash', 'secret')
+    assert hasher.submit_verify(stored, 'secret').result()
+    assert hasher.stats()['completed'] == 5
+
+
+def test_full_queue_is_rejected_immediately():
+    hasher = PasswordHasher(workers=0, max_pending=1, cost=10)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    worker = threading.Thread(target=hasher._run, args=(slow,))
+    worker.start()
+    started.wait(5)
+    try:
+        with pytest.raises(HashingPoolSaturated):
+            hasher.hash('secret')
+        with pytest.raises(HashingPoolSaturated):
+            hasher.submit_hash('secret')
+        assert hasher.stats()['in_flight'] == 1
+    finally:
+        release.set()
+        worker.join()
+    assert hasher.stats()['rejected'] == 2
+    # Место освободилось - следующая операция проходит
+    assert hasher.verify(hasher.hash('secret'), 'secret')
+
+
+class StuckExecutor:
+    """Задачи считаются запущенными в процессе: cancel() их не отменяет"""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.futures.append(future)
+        return future
+
+
+def test_timed_out_hash_keeps_its_slot_until_it_finishes(monkeypatch):
+    hasher = PasswordHasher(workers=1, max_pending=1, timeout=0.01, cost=10)
+    executor = StuckExecutor()
+    monkeypatch.setattr(hasher, '_get_executor', lambda: executor)
+
+    with pytest.raises(HashingPoolSaturated):
+        hasher.hash('secret')
+    # Задача ещё считается в процессе - новая отклоняется, не попадая в пул
+    with pytest.raises(HashingPoolSaturated):
+        hasher.hash('secret')
+    assert len(executor.futures) == 1
+    assert hasher.stats()['in_flight'] == 1
+
+    executor.futures[0].set_result('hash')
+    assert hasher.stats()['in_flight'] == 0
+    with pytest.raises(HashingPoolSaturated):
+        hasher.hash('secret')
+    assert len(executor.futures) == 2
+
+
+def test_process_pool_hashes_off_thread():
+    hasher = PasswordHasher(workers=1, cost=10)
+    try:
+        stored = hasher.hash('secret')
+        assert hasher.submit_verify(stored, 'secret').result(timeout=10)
+    finally:
+        hasher.shutdown()
+    assert hasher.stats()['in_flight'] == 0
+
+
+def test_cost_is_deterministic_and_bounded():
+    assert PasswordHasher(workers=0).cost == PasswordHasher(workers=0).cost == BcryptScheme.default_cost
+    assert PasswordHasher(workers=0, cost=4).cost == BcryptScheme.min_cost
+    assert PasswordHasher(workers=0, scheme='pbkdf2_sha256', cost=200000).cost == 200000
+
+
+def test_only_cheaper_hashes_are_upgraded():
+    hasher = PasswordHasher(workers=0, cost=11)
+    assert hasher.needs_rehash(bcrypt_hash(10))
+    assert not hasher.needs_rehash(bcrypt_hash(11))
+    # Хеш дороже целевой стоимости не понижаем
+    assert not hasher.needs_rehash(bcrypt_hash(12))
+
+
+def test_other_schemes_are_migrated():
+    hasher = PasswordHasher(workers=0, cost=10)
+    assert hasher.needs_rehash(SCHEMES['pbkdf2_sha256'].hash('secret', 100000))
+    legacy = '00' * 16 + ':' + '11' * 32
+    assert hasher.needs_rehash(legacy)
+    assert hasher.needs_rehash('$2b$xx$broken')
+
+    pbkdf2 = PasswordHasher(workers=0, scheme='pbkdf2_sha256', cost=200000)
+    assert pbkdf2.needs_rehash(SCHEMES['pbkdf2_sha256'].hash('secret', 100000))
+    assert not pbkdf2.needs_rehash(SCHEMES['pbkdf2_sha256'].hash('secret', 300000))
+    assert pbkdf2.verify(pbkdf2.hash('secret'), 'secret')
+
+
+def test_verify_only_scheme_cannot_be_selected():
+    assert 'pbkdf2_legacy' not in SCHEMES
+    with pytest.raises(ValueError, match='только для проверки'):
+        PasswordHasher(workers=0, scheme='pbkdf2_legacy')
+    with pytest.raises(ValueError, match='Неизвестная схема'):
+        PasswordHasher(workers=0, scheme='md5')
+
+
+def test_legacy_hash_is_verified():
+    salt = bytes(range(16))
+    key = pbkdf2_hmac('sha256', b'secret', salt, 100000)
+    legacy = f'{binascii.hexlify(salt).decode()}:{binascii.hexlify(key).decode()}'
+    hasher = PasswordHasher(workers=0, cost=10)
+    assert hasher.verify(legacy, 'secret')
+    assert not hasher.verify(legacy, 'wrong')
+
+
+def bcrypt_hash(cost):
+    # Соль с нужным числом раундов; сам хеш для needs_rehash не важен
+    return f'$2b${cost:02d}$' + 'a' * 53
+
+
+def stored_hash(db, user_id):
+    cursor = db.cursor()
+    cursor.execute('SELECT password_hash FROM users WHERE user_id = %s', (user_id,))
+    (value,) = cursor.fetchone()
+    cursor.close()
+    db.commit()
+    return value
+
+
+def test_login_upgrades_but_never_downgrades_cost(client, db, make_user, monkeypatch):
+    import app
+    user = make_user()
+    assert stored_hash(db, user.user_id).startswith('$2b$10$')
+
+    monkeypatch.setattr(app.password_hasher, 'cost', 11)
+    assert client.post('/api/login', json={'phone': user.phone, 'password': user.password}).status_code == 200
+    upgraded = stored_hash(db, user.user_id)
+    assert upgraded.startswith('$2b$11$')
+
+    # Воркер со старой конфигурацией не понижает стоимость обратно
+    monkeypatch.setattr(app.password_hasher, 'cost', 10)
+    assert client.post('/api/login', json={'phone': user.phone, 'password': user.password}).status_code == 200
+    assert stored_hash(db, user.user_id) == upgraded
@@ -0,0 +1,98 @@
+import mysql.connector
+import pytest
+
+import reference_data
+from reference_data import ReferenceData
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCursor:
+    def __init__(self, tables):
+        self.tables = tables
+        self.rows = []
+
+    def execute(self, query):
+        table = next(name for name in self.tables if name in query)
+        self.rows = self.tables[table]
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.categories = [{'category_id': 1, 'category_name': 'Переводы'}]
+        self.connects = 0
+        self.down = False
+
+    def connect(self):
+        if self.down:
+            raise mysql.connector.errors.InterfaceError(msg='Can\'t connect', errno=2003)
+        self.connects += 1
+        return self
+
+    def cursor(self, dictionary=False):
+        return FakeCursor({
+            'transaction_categories': self.categories,
+            'account_types': [{'type_id': 1, 'type_name': 'Дебетовый'}],
+            'transaction_types': [{'type_id': 3, 'type_name': 'Перевод'}],
+        })
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(reference_data.time, 'monotonic', clock)
+    return clock
+
+
+def test_snapshot_is_reused_until_ttl(clock):
+    db = FakeDatabase()
+    data = ReferenceData(db.connect, ttl=60)
+    assert data.category_id('Переводы') == 1
+    clock.now += 30
+    assert data.category_id('Покупки', 'нет') == 'нет'
+    assert db.connects == 1
+
+    db.categories = db.categories + [{'category_id': 2, 'category_name': 'Покупки'}]
+    clock.now += 31
+    assert data.category_id('Покупки') == 2
+    assert db.connects == 2
+    assert data.stats()['version'] == 2
+
+
+def test_old_snapshot_survives_failed_reload(clock):
+    db = FakeDatabase()
+    data = ReferenceData(db.connect, ttl=60)
+    first = data.current()
+    db.down = True
+    clock.now += 61
+    assert data.current() is first
+    # Следующая попытка не раньше чем через 10 секунд
+    db.down = False
+    clock.now += 5
+    assert data.current() is first
+    clock.now += 6
+    assert data.current() is not first
+
+
+def test_fingerprint_depends_only_on_content(clock):
+    db = FakeDatabase()
+    first = ReferenceData(db.connect).load()
+    second = ReferenceData(db.connect).load()
+    assert first.fingerprint == second.fingerprint
+    db.categories = [{'category_id': 1, 'category_name': 'Другое'}]
+    assert ReferenceData(db.connect).load().fingerprint != first.fingerprint
@@ -0,0 +1,73 @@
+import app
+import resource_versions
+from resource_versions import VERSION_SQL, format_etag, read_version, version_params
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchone(self):
+        return self.row
+
+
+def test_etag_format():
+    assert format_etag('accounts', 5, 12) == 'accounts-5-12'
+    assert format_etag('accounts', 5, 12, 'ab12') == 'accounts-5-12-ab12'
+    assert format_etag('profile', 5, 0, None) == 'profile-5-0'
+
+
+def test_resources_map_to_tables():
+    assert version_params(5, 'tickets') == (5, 'support_tickets')
+    assert set(resource_versions.RESOURCES.values()) == {
+        'users', 'accounts', 'support_tickets', 'bonus_operations', 'app_settings',
+    }
+
+
+def test_missing_version_row_reads_as_zero():
+    cursor = FakeCursor(None)
+    assert read_version(cursor, 5, 'settings') == 0
+    assert cursor.executed == [(VERSION_SQL, (5, 'app_settings'))]
+    assert read_version(FakeCursor({'version': 7}), 5, 'settings') == 7
+
+
+def test_matching_etag_is_not_modified():
+    cursor = FakeCursor({'version': 3})
+    with app.app.test_request_context('/', headers={'If-None-Match': '"bonuses-5-3"'}):
+        etag, response = app.check_resource_etag(cursor, 5, 'bonuses')
+    assert etag == 'bonuses-5-3'
+    assert response.status_code == 304
+    assert response.headers['ETag'] == '"bonuses-5-3"'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert cursor.executed == [(VERSION_SQL, (5, 'bonus_operations'))]
+
+
+def test_stale_etag_is_answered_in_full():
+    cursor = FakeCursor({'version': 4})
+    with app.app.test_request_context('/', headers={'If-None-Match': '"bonuses-5-3"'}):
+        etag, response = app.check_resource_etag(cursor, 5, 'bonuses')
+    assert (etag, response) == ('bonuses-5-4', None)
+
+    with app.app.test_request_context('/'):
+        assert app.check_resource_etag(FakeCursor(None), 5, 'accounts', 'ab')[1] is None
+
+
+def test_accounts_etag_changes_after_transfer(client, make_user):
+    payer = make_user(balance=100)
+    payee = make_user()
+    path = f'/api/user/{payer.user_id}/accounts'
+    etag = client.get(path, headers=payer.headers).headers['ETag']
+
+    response = client.get(path, headers={**payer.headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+
+    client.post('/api/transfer', json={
+        'from_account_id': payer.account_id, 'to_account_id': payee.account_id, 'amount': 1,
+    }, headers=payer.headers)
+    response = client.get(path, headers={**payer.headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
@@ -0,0 +1,183 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from delta_sync import BUMP_RESOURCE_VERSION_SQL
+from flight_catalog import CATALOG_VERSION_KEY
+from seat_reservations import claim_seat, consume_hold, release_hold, sweep_expired
+from transfer_engine import TransferError
+
+
+class SeatDatabase:
+    """Места и брони в памяти; понимает только запросы seat_reservations.py.
+    Время - целые секунды в now"""
+
+    def __init__(self, ticket_ids):
+        self.available = dict.fromkeys(ticket_ids, True)
+        self.holds = {}  # ticket_id -> [user_id, expires_at]
+        self.now = 0
+        self.commits = 0
+        self.catalog_version = 0
+
+    def cursor(self, dictionary=False):
+        return SeatCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class SeatCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = 0
+        self.rows = []
+
+    def execute(self, query, params):
+        db = self.db
+        self.rowcount = 0
+        if query.startswith('UPDATE air_tickets SET is_available = 0'):
+            if db.available.get(params[0]):
+                db.available[params[0]] = False
+                self.rowcount = 1
+        elif query.startswith('INSERT INTO seat_holds'):
+            ticket_id, user_id, ttl = params
+            db.holds[ticket_id] = [user_id, db.now + ttl]
+        elif query.startswith('UPDATE seat_holds'):
+            ttl, ticket_id, user_id = params
+            hold = db.holds.get(ticket_id)
+            if hold and hold[0] == user_id:
+                hold[1] = db.now + ttl
+                self.rowcount = 1
+        elif query.startswith('SELECT expires_at'):
+            self.rows = [{'expires_at': db.holds[params[0]][1]}]
+        elif query.startswith('DELETE FROM seat_holds WHERE ticket_id = %s'):
+            hold = db.holds.get(params[0])
+            if hold and hold[0] == params[1]:
+                del db.holds[params[0]]
+                self.rowcount = 1
+        elif query.startswith('UPDATE air_tickets SET is_available = 1 WHERE ticket_id = %s'):
+            db.available[params[0]] = True
+        elif query.startswith('SELECT ticket_id FROM seat_holds'):
+            expired = sorted((h[1], t) for t, h in db.holds.items() if h[1] <= db.now)
+            self.rows = [{'ticket_id': t} for _, t in expired[:params[0]]]
+        elif query.startswith('DELETE FROM seat_holds WHERE ticket_id IN'):
+            for ticket_id in params:
+                del db.holds[ticket_id]
+        elif query.startswith('UPDATE air_tickets SET is_available = 1 WHERE ticket_id IN'):
+            for ticket_id in params:
+                db.available[ticket_id] = True
+        elif query == BUMP_RESOURCE_VERSION_SQL and params == CATALOG_VERSION_KEY:
+            db.catalog_version += 1
+        else:
+            raise AssertionError(query)
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def seats():
+    return SeatDatabase([1, 2, 3])
+
+
+def test_seat_goes_to_first_claimant(seats):
+    cursor = seats.cursor()
+    hold = claim_seat(cursor, 1, user_id=10, ttl=300)
+    assert hold == {'ticket_id': 1, 'expires_at': 300, 'created': True}
+    assert not seats.available[1]
+    with pytest.raises(TransferError) as err:
+        claim_seat(cursor, 1, user_id=11, ttl=300)
+    assert err.value.status == 409
+
+
+def test_own_hold_is_extended(seats):
+    cursor = seats.cursor()
+    claim_seat(cursor, 1, user_id=10, ttl=300)
+    seats.now = 100
+    assert claim_seat(cursor, 1, user_id=10, ttl=300) == {'ticket_id': 1, 'expires_at': 400, 'created': False}
+
+
+def test_paid_hold_keeps_seat_sold(seats):
+    cursor = seats.cursor()
+    claim_seat(cursor, 1, user_id=10, ttl=300)
+    assert not consume_hold(cursor, 1, user_id=11)
+    assert consume_hold(cursor, 1, user_id=10)
+    assert not consume_hold(cursor, 1, user_id=10)
+    assert not seats.available[1]
+    assert not release_hold(cursor, 1, user_id=10)
+
+
+def test_released_hold_returns_seat(seats):
+    cursor = seats.cursor()
+    claim_seat(cursor, 2, user_id=10, ttl=300)
+    assert not release_hold(cursor, 2, user_id=11)
+    assert release_hold(cursor, 2, user_id=10)
+    assert seats.available[2]
+    assert claim_seat(cursor, 2, user_id=11, ttl=300)['created']
+
+
+def test_sweeper_releases_only_expired_holds(seats):
+    cursor = seats.cursor()
+    claim_seat(cursor, 1, user_id=10, ttl=60)
+    claim_seat(cursor, 2, user_id=10, ttl=600)
+    claim_seat(cursor, 3, user_id=11, ttl=30)
+    seats.now = 120
+    assert sweep_expired(seats, batch_size=1) == 1
+    assert sweep_expired(seats) == 1
+    assert sweep_expired(seats) == 0
+    assert seats.available == {1: True, 2: False, 3: True}
+    # Оплата после снятия брони не проходит
+    assert not consume_hold(cursor, 1, user_id=10)
+
+
+def test_availability_changes_bump_catalog_version(seats):
+    cursor = seats.cursor()
+    claim_seat(cursor, 1, user_id=10, ttl=60)
+    claim_seat(cursor, 1, user_id=10, ttl=60)  # продление не меняет каталог
+    assert seats.catalog_version == 1
+    consume_hold(cursor, 1, user_id=10)
+    assert seats.catalog_version == 1
+    claim_seat(cursor, 2, user_id=10, ttl=60)
+    release_hold(cursor, 2, user_id=10)
+    assert seats.catalog_version == 3
+    claim_seat(cursor, 3, user_id=10, ttl=60)
+    seats.now = 120
+    sweep_expired(seats)
+    sweep_expired(seats)
+    assert seats.catalog_version == 5
+
+
+def test_concurrent_holds_have_one_winner(client, make_user, db):
+    departure = datetime.now() + timedelta(days=3)
+    cursor = db.cursor()
+    cursor.execute(
+        'INSERT INTO air_tickets (departure_city, arrival_city, departure_time, arrival_time, '
+        'price, airline, is_available) VALUES (%s, %s, %s, %s, %s, %s, 1)',
+        ('Москва', 'Сочи', departure, departure + timedelta(hours=3), 5000, 'Тест')
+    )
+    ticket_id = cursor.lastrowid
+    db.commit()
+    cursor.close()
+
+    users = [make_user() for _ in range(6)]
+    statuses = []
+
+    def hold(user):
+        statuses.append(client.post(f'/api/flights/{ticket_id}/hold', headers=user.headers).status_code)
+
+    threads = [threading.Thread(target=hold, args=(user,)) for user in users]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(statuses) == [200] + [409] * 5
@@ -0,0 +1,67 @@
+import json
+from decimal import Decimal
+
+import app
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        self.closed = True
+
+
+def test_wants_stream():
+    with app.app.test_request_context('/?stream=1'):
+        assert app.wants_stream()
+    with app.app.test_request_context('/', headers={'Accept': 'application/x-ndjson'}):
+        assert app.wants_stream()
+    with app.app.test_request_context('/', headers={'Accept': 'application/json'}):
+        assert not app.wants_stream()
+
+
+def test_rows_are_streamed_one_per_line():
+    cursor = FakeCursor([{'id': 2, 'amount': Decimal('10.50')}, {'id': 3, 'amount': Decimal('1.00')}])
+
+    def prepare(row):
+        row['prepared'] = True
+
+    with app.app.test_request_context('/'):
+        response = app.stream_rows(cursor, prepare, headers={'X-Bonus-Balance': '5'}, prefix=[{'id': 1}])
+        assert response.mimetype == 'application/x-ndjson'
+        assert response.headers['X-Bonus-Balance'] == '5'
+        assert not cursor.closed
+        body = response.get_data(as_text=True)
+
+    lines = body.splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {'id': 1, 'prepared': True},
+        {'id': 2, 'amount': '10.50', 'prepared': True},
+        {'id': 3, 'amount': '1.00', 'prepared': True},
+    ]
+    assert body.endswith('\n')
+    assert cursor.closed
+
+
+def test_cursor_is_closed_when_client_disconnects():
+    cursor = FakeCursor([{'id': 1}, {'id': 2}])
+    with app.app.test_request_context('/'):
+        response = app.stream_rows(cursor)
+        chunks = iter(response.response)
+        next(chunks)
+        response.close()
+    assert cursor.closed
+
+
+def test_streamed_history_matches_paged_history(client, make_user):
+    user = make_user(balance=100)
+    paged = client.get(f'/api/user/{user.user_id}/transactions', headers=user.headers).get_json()
+    response = client.get(f'/api/user/{user.user_id}/transactions?stream=1', headers=user.headers)
+    assert response.mimetype == 'application/x-ndjson'
+    streamed = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert streamed == paged
@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+from delta_sync import BUMP_RESOURCE_VERSION_SQL
+from support_chat import (CHAT_RESOURCE, ChatNotifier, VersionedFetch, advance_position, format_chat_cursor,
+                          parse_chat_cursor, stream_messages, wait_for_messages)
+
+
+class Conversation:
+    """Переписка в памяти; fetch ведёт себя как fetch_messages, version -
+    как версия чата, которую поднимает каждая запись"""
+
+    def __init__(self):
+        self.rows = []
+        self.fetches = 0
+        self.version = 0
+        self.version_reads = 0
+
+    def add(self, sender_type, message_id):
+        self.rows.append({'message_id': message_id, 'sender_type': sender_type})
+        self.version += 1
+
+    def read_version(self):
+        self.version_reads += 1
+        return self.version
+
+    def fetch(self, position):
+        self.fetches += 1
+        messages = [row for row in self.rows if row['message_id'] > (
+            position[0] if row['sender_type'] == 'user' else position[1])]
+        return messages, advance_position(messages, position)
+
+
+def later(seconds, action):
+    timer = threading.Timer(seconds, action)
+    timer.start()
+    return timer
+
+
+def test_chat_cursor_round_trip():
+    assert parse_chat_cursor('') == (0, 0)
+    assert parse_chat_cursor(format_chat_cursor((12, 7))) == (12, 7)
+    with pytest.raises(ValueError):
+        parse_chat_cursor('12:7')
+
+
+def test_publish_wakes_waiter_immediately():
+    notifier, chat = ChatNotifier(), Conversation()
+    with notifier.subscribe(5) as subscription:
+        def reply():
+            chat.add('support', 3)
+            notifier.publish(5)
+        later(0.05, reply)
+        started = time.monotonic()
+        messages, position = wait_for_messages(chat.fetch, subscription, (0, 0), timeout=5, recheck_interval=5)
+    assert time.monotonic() - started < 1
+    assert [m['message_id'] for m in messages] == [3]
+    assert position == (0, 3)
+    assert notifier.stats()['channels'] == 0
+
+
+def test_message_from_another_process_is_found_by_recheck():
+    notifier, chat = ChatNotifier(), Conversation()
+    # Другой процесс пишет ответ, но не может оповестить этот
+    later(0.05, lambda: chat.add('support', 8))
+    with notifier.subscribe(5) as subscription:
+        messages, position = wait_for_messages(chat.fetch, subscription, (0, 0), timeout=5, recheck_interval=0.1)
+    assert [m['message_id'] for m in messages] == [8]
+    assert position == (0, 8)
+
+
+def test_idle_wait_reads_only_the_version():
+    notifier, chat = ChatNotifier(), Conversation()
+    chat.add('user', 1)
+    fetch = VersionedFetch(chat.fetch, chat.read_version, version=chat.version)
+    later(0.3, lambda: chat.add('support', 4))
+    with notifier.subscribe(5) as subscription:
+        messages, position = wait_for_messages(fetch, subscription, (1, 0), timeout=5, recheck_interval=0.05)
+    assert [m['message_id'] for m in messages] == [4]
+    assert position == (1, 4)
+    # Переписка прочитана один раз - после смены версии
+    assert chat.fetches == 1
+    assert chat.version_reads == fetch.skipped + 1 >= 3
+
+
+def test_wait_times_out_without_messages():
+    notifier, chat = ChatNotifier(), Conversation()
+    with notifier.subscribe(5) as subscription:
+        assert wait_for_messages(chat.fetch, subscription, (4, 2), timeout=0.2, recheck_interval=0.05) == ([], (4, 2))
+    assert chat.fetches >= 3
+
+
+def test_stream_sends_history_keepalive_and_foreign_messages():
+    notifier, chat = ChatNotifier(), Conversation()
+    chat.add('user', 1)
+    later(0.25, lambda: chat.add('support', 2))
+    with notifier.subscribe(5) as subscription:
+        batches = list(stream_messages(chat.fetch, subscription, (0, 0), duration=0.5,
+                                       keepalive=0.15, recheck_interval=0.05))
+    ids = [[m['message_id'] for m in messages] for messages, _ in batches]
+    assert ids[0] == [1]
+    assert [] in ids[1:ids.index([2])]
+    assert batches[ids.index([2])][1] == (1, 2)
+
+
+def test_poll_sees_message_written_without_notification(client, make_user, db, monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'CHAT_RECHECK_INTERVAL', 0.1)
+    user = make_user()
+    cursor = client.get('/api/support/chat', headers=user.headers).headers['X-Chat-Cursor']
+
+    def insert_elsewhere():
+        writer = db.cursor()
+        writer.execute(
+            'INSERT INTO support_messages (user_id, employee_id, message_text, is_read, is_answered) '
+            'VALUES (%s, 0, %s, 0, 0)',
+            (user.user_id, 'из другого процесса')
+        )
+        writer.execute(BUMP_RESOURCE_VERSION_SQL, (user.user_id, CHAT_RESOURCE))
+        db.commit()
+        writer.close()
+
+    later(0.2, insert_elsewhere)
+    started = time.monotonic()
+    response = client.get(f'/api/support/chat/poll?since={cursor}&timeout=10', headers=user.headers)
+    assert time.monotonic() - started < 5
+    assert [m['message_text'] for m in response.get_json()] == ['из другого процесса']
+    assert response.headers['X-Chat-Cursor'] != cursor
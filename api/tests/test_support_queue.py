@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import support_queue
+from support_queue import TicketCounterDelta, build_queue_query, ticket_statuses
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.calls = []
+
+    def executemany(self, query, rows):
+        self.calls.append(rows)
+
+
+def test_ticket_statuses():
+    assert ticket_statuses({'is_answered': 0, 'employee_id': None}) == {'open', 'unassigned'}
+    assert ticket_statuses({'is_answered': 0, 'employee_id': 7}) == {'open'}
+    assert ticket_statuses({'is_answered': 1, 'employee_id': None}) == {'answered'}
+
+
+def test_counter_deltas_follow_transitions():
+    free = {'is_answered': 0, 'employee_id': None}
+    claimed = dict(free, employee_id=7)
+    answered = dict(claimed, is_answered=1)
+
+    counters = TicketCounterDelta()
+    counters.transition(None, free)
+    counters.transition(free, claimed)
+    counters.transition(claimed, answered)
+    cursor = RecordingCursor()
+    counters.apply(cursor)
+    # open: +1 -1, unassigned: +1 -1 - нулевые приращения не пишутся
+    assert cursor.calls == [[('answered', 1)]]
+
+    cursor = RecordingCursor()
+    TicketCounterDelta().apply(cursor)
+    assert cursor.calls == []
+
+
+def test_queue_query_filters_and_pages():
+    after = (datetime(2024, 3, 1, 9), 15)
+    query, params = build_queue_query({'is_answered': 0, 'employee_id': 'none'}, after, limit=21)
+    assert 't.employee_id IS NULL' in query
+    assert '(t.created_at, t.ticket_id) > (%s, %s)' in query
+    assert query.endswith('ORDER BY t.created_at ASC, t.ticket_id ASC LIMIT %s')
+    assert params == (0, after[0], 15, 21)
+
+    query, params = build_queue_query({'employee_id': 7, 'created_before': after[0]})
+    assert 't.employee_id = %s' in query and 'LIMIT' not in query
+    assert params == (7, after[0])
+
+    query, params = build_queue_query({})
+    assert query == support_queue.QUEUE_COLUMNS + ' ORDER BY t.created_at ASC, t.ticket_id ASC'
+
+
+def test_new_ticket_can_be_claimed(client, make_user, db):
+    customer = make_user()
+    employee = make_user()
+    cursor = db.cursor(dictionary=True)
+    cursor.execute('UPDATE users SET role_id = 2 WHERE user_id = %s', (employee.user_id,))
+    db.commit()
+    login = client.post('/api/login', json={'phone': employee.phone, 'password': employee.password}).get_json()
+    headers = {'Authorization': f'Bearer {login["token"]}'}
+
+    response = client.post('/api/support/tickets', json={'subject': 'Карта', 'message': 'Не работает'},
+                           headers=customer.headers)
+    assert response.status_code == 201
+    cursor.execute('SELECT ticket_id, employee_id FROM support_tickets WHERE user_id = %s', (customer.user_id,))
+    ticket = cursor.fetchone()
+    cursor.close()
+    db.commit()
+    assert ticket['employee_id'] is None
+
+    # Очередь общая: сначала разбираются тикеты, оставшиеся от прошлых прогонов
+    for _ in range(100):
+        response = client.post('/api/support/queue/claim', headers=headers)
+        assert response.status_code == 200
+        claimed = response.get_json()
+        if claimed['ticket_id'] == ticket['ticket_id']:
+            break
+    assert claimed['employee_id'] == employee.user_id
@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import app
+
+
+def test_keyset_cursor_round_trip():
+    value = app.format_keyset_cursor(datetime(2024, 5, 1, 12, 30, 15), 42)
+    assert value == '2024-05-01T12:30:15,42'
+    assert app.parse_keyset_cursor(value) == (datetime(2024, 5, 1, 12, 30, 15), 42)
+
+
+@pytest.mark.parametrize('value', ['42', 'yesterday,42', '2024-05-01T12:30:15,x'])
+def test_bad_cursor_is_rejected(value):
+    with pytest.raises(ValueError):
+        app.parse_keyset_cursor(value)
+
+
+def test_filters_are_parsed():
+    filters = app.parse_transaction_filters(MultiDict({
+        'date_from': '2024-01-01', 'date_to': '2024-02-01', 'category_id': '7', 'type_id': '1',
+        'after': '2024-01-15T10:00:00,99',
+    }))
+    assert filters == {
+        'date_from': datetime(2024, 1, 1),
+        'date_to': datetime(2024, 2, 1),
+        'category_id': 7,
+        'type_id': 1,
+        'after': (datetime(2024, 1, 15, 10), 99),
+    }
+
+
+def test_query_has_a_limited_branch_per_account_and_direction():
+    after = (datetime(2024, 1, 15, 10), 99)
+    query, params = app.transactions_query([1, 2], {'category_id': 7, 'after': after}, limit=11)
+    assert query.count('(SELECT t.* FROM transactions t WHERE') == 4
+    assert query.count('LIMIT %s') == 5
+    # Ветка: счёт, категория, курсор (дата, дата, id), limit; в конце общий limit
+    branch = [1, 7, after[0], after[0], 99, 11]
+    assert params[:6] == branch
+    assert len(params) == 4 * len(branch) + 1
+    assert params[-1] == 11
+
+
+def test_unlimited_query_has_no_limit():
+    query, params = app.transactions_query([1], {})
+    assert 'LIMIT' not in query
+    assert params == [1, 1]
+
+
+def test_history_pages_without_gaps_or_repeats(client, make_user):
+    payer = make_user(balance=1000)
+    payee = make_user()
+    for amount in (1, 2, 3, 4, 5):
+        response = client.post('/api/transfer-by-phone', json={
+            'from_account_id': payer.account_id, 'recipient_phone': payee.phone, 'amount': amount,
+        }, headers=payer.headers)
+        assert response.status_code == 200
+
+    seen = []
+    path = f'/api/user/{payer.user_id}/transactions?limit=2'
+    pages = 0
+    while path:
+        response = client.get(path, headers=payer.headers)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page) <= 2
+        seen.extend(page)
+        pages += 1
+        cursor = response.headers.get('X-Next-Cursor')
+        path = f'/api/user/{payer.user_id}/transactions?limit=2&after={cursor}' if cursor else None
+
+    ids = [tr['transaction_id'] for tr in seen]
+    assert len(ids) == 6 == len(set(ids))  # пополнение и пять переводов
+    assert pages == 3
+    keys = [(tr['transaction_date'], tr['transaction_id']) for tr in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_history_filters_by_type(client, make_user):
+    payer = make_user(balance=100)
+    payee = make_user()
+    client.post('/api/transfer-by-phone', json={
+        'from_account_id': payer.account_id, 'recipient_phone': payee.phone, 'amount': 10,
+    }, headers=payer.headers)
+    response = client.get(f'/api/user/{payer.user_id}/transactions?type_id=3', headers=payer.headers)
+    assert [tr['type_id'] for tr in response.get_json()] == [3]
@@ -0,0 +1,138 @@
+import threading
+from decimal import Decimal
+
+import mysql.connector
+import pytest
+
+import transfer_engine
+from transfer_engine import TransferEngine, TransferError, lock_accounts_query
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+        self.cursors = []
+
+    def cursor(self, **kwargs):
+        cursor = FakeCursor()
+        self.cursors.append(cursor)
+        return cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeCursor:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def deadlock(errno=1213):
+    return mysql.connector.errors.DatabaseError(msg='Deadlock found', errno=errno)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(transfer_engine.time, 'sleep', lambda seconds: None)
+
+
+def test_deadlock_is_retried_until_commit():
+    engine = TransferEngine(max_retries=5)
+    conn = FakeConnection()
+    errors = [deadlock(1213), deadlock(1205)]
+
+    def work(cursor):
+        if errors:
+            raise errors.pop(0)
+        return 'done'
+
+    assert engine.run(conn, work) == 'done'
+    assert (conn.rollbacks, conn.commits) == (2, 1)
+    assert all(c.closed for c in conn.cursors)
+    stats = engine.stats()
+    assert stats['retries'] == 2
+    assert stats['retried_transactions'] == 1
+    assert stats['retries_by_errno'] == {1213: 1, 1205: 1}
+
+
+def test_retries_are_bounded():
+    engine = TransferEngine(max_retries=2)
+    conn = FakeConnection()
+
+    def work(cursor):
+        raise deadlock()
+
+    with pytest.raises(mysql.connector.Error):
+        engine.run(conn, work)
+    assert conn.rollbacks == 3
+    assert engine.stats()['retries_exhausted'] == 1
+
+
+def test_other_database_errors_are_not_retried():
+    engine = TransferEngine()
+    conn = FakeConnection()
+
+    def work(cursor):
+        raise mysql.connector.errors.IntegrityError(msg='Duplicate entry', errno=1062)
+
+    with pytest.raises(mysql.connector.errors.IntegrityError):
+        engine.run(conn, work)
+    assert conn.rollbacks == 1
+    assert engine.stats()['retries'] == 0
+
+
+def test_business_error_rolls_back_without_retry():
+    engine = TransferEngine()
+    conn = FakeConnection()
+
+    def work(cursor):
+        raise TransferError('Insufficient funds!', 400, {'total_amount': '10'})
+
+    with pytest.raises(TransferError) as err:
+        engine.run(conn, work)
+    assert err.value.payload == {'total_amount': '10'}
+    assert (conn.rollbacks, conn.commits) == (1, 0)
+
+
+def test_backoff_is_capped():
+    engine = TransferEngine(base_delay=0.01, max_delay=0.05)
+    assert all(0 <= engine.backoff(attempt) <= 0.05 for attempt in range(1, 20))
+
+
+def test_accounts_are_locked_in_ascending_order_once():
+    query, params = lock_accounts_query([10, None, 3, 10, 7])
+    assert params == (3, 7, 10)
+    assert query.endswith('ORDER BY account_id FOR UPDATE')
+    assert lock_accounts_query([None]) == (None, None)
+
+
+def test_opposite_transfers_do_not_deadlock(client, make_user):
+    first = make_user(balance=1000)
+    second = make_user(balance=1000)
+    statuses = []
+
+    def send(payer, payee):
+        for _ in range(10):
+            response = client.post('/api/transfer', json={
+                'from_account_id': payer.account_id, 'to_account_id': payee.account_id, 'amount': 1,
+            }, headers=payer.headers)
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=send, args=pair) for pair in [(first, second), (second, first)] * 4]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert statuses == [200] * 80
+    balances = []
+    for user in (first, second):
+        accounts = client.get(f'/api/user/{user.user_id}/accounts', headers=user.headers).get_json()
+        balances.append(Decimal(next(a['balance'] for a in accounts if a['account_id'] == user.account_id)))
+    assert balances == [Decimal('1000.00'), Decimal('1000.00')]
@@ -0,0 +1,93 @@
+import importlib
+import os
+
+import pytest
+
+from passwords import _verify
+
+LIB_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'lib')
+
+
+@pytest.fixture
+def script(monkeypatch):
+    # Модуль должен импортироваться по имени, иначе пул процессов не передаст _hash_chunk
+    monkeypatch.syspath_prepend(LIB_DIR)
+    return importlib.import_module('script')
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, query, params):
+        self.db.reads.append((query, params))
+        last_user_id, limit = params
+        self.rows = [(uid,) for uid in sorted(self.db.users) if uid > last_user_id][:limit]
+
+    def fetchall(self):
+        return self.rows
+
+    def executemany(self, query, updates):
+        self.db.pending.extend(updates)
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.autocommit = False
+        db.connections.append(self)
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        for password_hash, user_id in self.db.pending:
+            self.db.users[user_id] = password_hash
+        self.db.pending = []
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self, user_ids):
+        self.users = dict.fromkeys(user_ids)
+        self.pending = []
+        self.reads = []
+        self.connections = []
+
+
+def test_checkpoint_round_trip(script, tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    assert script.load_checkpoint(path) == 0
+    script.save_checkpoint(path, 42, 1000)
+    assert script.load_checkpoint(path) == 42
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_chunk_hashes_are_accepted_by_the_api(script):
+    pairs = script._hash_chunk(([1, 2], 'secret'))
+    assert [user_id for _, user_id in pairs] == [1, 2]
+    assert pairs[0][0] != pairs[1][0]
+    assert all(_verify(password_hash, 'secret') for password_hash, _ in pairs)
+
+
+def test_update_resumes_after_checkpoint(script, tmp_path, monkeypatch):
+    db = FakeDatabase([1, 2, 3, 5, 8])
+    monkeypatch.setattr(script.mysql.connector, 'connect', lambda **config: FakeConnection(db))
+    path = str(tmp_path / 'checkpoint.json')
+    script.save_checkpoint(path, 2, 2)
+
+    script.update_passwords('secret', chunk_size=2, workers=1, checkpoint=path)
+
+    assert db.users[1] is None and db.users[2] is None
+    assert all(_verify(db.users[uid], 'secret') for uid in (3, 5, 8))
+    assert not os.path.exists(path)
+    # Каждая пачка - отдельный запрос по ключу на соединении в autocommit
+    assert [params for _, params in db.reads] == [(2, 2), (5, 2), (8, 2)]
+    assert all('LIMIT' in query for query, _ in db.reads)
+    assert db.connections[0].autocommit
@@ -0,0 +1,124 @@
+# Общий механизм денежных операций: блокировка счетов в едином порядке
+# и повтор транзакции при взаимоблокировке
+import random
+import threading
+import time
+
+import mysql.connector
+
+# 1213 - ER_LOCK_DEADLOCK, 1205 - ER_LOCK_WAIT_TIMEOUT
+RETRYABLE_ERRNOS = {1213, 1205}
+
+
+class TransferError(Exception):
+    """Бизнес-ошибка операции: транзакция откатывается, клиенту уходит message"""
+
+    def __init__(self, message, status=400, payload=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.payload = payload or {}
+
+
+class TransferEngine:
+    """Выполняет функцию work(cursor) в транзакции с повтором при deadlock"""
+
+    def __init__(self, max_retries=5, base_delay=0.01, max_delay=0.5):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._transactions = 0
+        self._retries = 0
+        self._retried_transactions = 0
+        self._exhausted = 0
+        self._retries_by_errno = {}
+
+    def run(self, conn, work):
+        attempt = 0
+        while True:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                result = work(cursor)
+                conn.commit()
+                self.record(attempt)
+                return result
+            except TransferError:
+                conn.rollback()
+                self.record(attempt)
+                raise
+            except mysql.connector.Error as err:
+                conn.rollback()
+                if not self.should_retry(err.errno, attempt):
+                    self.record(attempt)
+                    raise
+                attempt += 1
+                time.sleep(self.backoff(attempt))
+            finally:
+                cursor.close()
+
+    # Учёт попыток вынесен в отдельные методы, чтобы асинхронный сервер
+    # (async_db.run_transaction) вёл ту же статистику
+    def should_retry(self, errno, attempt):
+        if errno not in RETRYABLE_ERRNOS:
+            return False
+        with self._lock:
+            if attempt >= self.max_retries:
+                self._exhausted += 1
+                return False
+            self._retries += 1
+            self._retries_by_errno[errno] = self._retries_by_errno.get(errno, 0) + 1
+        return True
+
+    # Экспоненциальная задержка со случайным разбросом (full jitter)
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def record(self, attempts):
+        with self._lock:
+            self._transactions += 1
+            if attempts:
+                self._retried_transactions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'transactions': self._transactions,
+                'retries': self._retries,
+                'retried_transactions': self._retried_transactions,
+                'retries_exhausted': self._exhausted,
+                'retries_by_errno': dict(self._retries_by_errno),
+            }
+
+
+# Блокирует строки счетов в порядке возрастания account_id, чтобы встречные
+# переводы между одними и теми же счетами не образовывали взаимоблокировку
+def lock_accounts_query(account_ids):
+    ids = sorted({a for a in account_ids if a is not None})
+    if not ids:
+        return None, None
+    placeholders = ', '.join(['%s'] * len(ids))
+    return (
+        f'SELECT account_id, user_id, type_id, balance, is_active FROM accounts '
+        f'WHERE account_id IN ({placeholders}) ORDER BY account_id FOR UPDATE',
+        tuple(ids)
+    )
+
+
+def lock_accounts(cursor, account_ids):
+    query, params = lock_accounts_query(account_ids)
+    if query is None:
+        return {}
+    cursor.execute(query, params)
+    return {row['account_id']: row for row in cursor.fetchall()}
+
+
+DEBIT_SQL = 'UPDATE accounts SET balance = balance - %s WHERE account_id = %s'
+CREDIT_SQL = 'UPDATE accounts SET balance = balance + %s WHERE account_id = %s'
+
+
+def move_funds(cursor, from_account_id, to_account_id, amount):
+    if from_account_id is not None:
+        cursor.execute(DEBIT_SQL, (amount, from_account_id))
+    if to_account_id is not None:
+        cursor.execute(CREDIT_SQL, (amount, to_account_id))
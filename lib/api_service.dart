@@ -16,6 +16,28 @@ class ApiService {
     return json.decode(decoded);
   }
 
+  // Последние ответы GET с ETag: url -> (etag, тело). На 304 сервер не
+  // отдаёт тело, и используется сохранённое
+  static final Map<String, (String, String)> _etagCache = {};
+
+  static Future<http.Response> _conditionalGet(Uri uri, String token) async {
+    final key = uri.toString();
+    final cached = _etagCache[key];
+    final response = await http.get(uri, headers: {
+      'Authorization': 'Bearer $token',
+      if (cached != null) 'If-None-Match': cached.$1,
+    });
+    if (response.statusCode == 304 && cached != null) {
+      return http.Response.bytes(utf8.encode(cached.$2), 200,
+          headers: {'content-type': 'application/json; charset=utf-8'});
+    }
+    final etag = response.headers['etag'];
+    if (response.statusCode == 200 && etag != null) {
+      _etagCache[key] = (etag, response.body);
+    }
+    return response;
+  }
+
   // Сохранение и получение токена
   static Future<void> saveToken(String token) async {
     final prefs = await SharedPreferences.getInstance();
@@ -25,6 +47,8 @@ class ApiService {
     print('Token saved: ${token.substring(0, displayLength)}...');
   }
 
+  // Токен доступа живёт несколько минут; за минуту до истечения он
+  // заменяется через refresh_token, так что вызывающим методам это не видно
   static Future<String> getToken() async {
     final prefs = await SharedPreferences.getInstance();
     final token = prefs.getString('auth_token');
@@ -32,10 +56,86 @@ class ApiService {
       print("❌ Токен не найден");
       throw Exception('Токен не найден');
     }
+    if (_expiresSoon(token) && prefs.getString('refresh_token') != null) {
+      final refreshed = await refreshTokens();
+      if (refreshed != null) return refreshed;
+    }
     print("✅ Токен найден: ${token.substring(0, min(token.length, 20))}...");
     return token;
   }
 
+  static bool _expiresSoon(String token) {
+    try {
+      final exp = parseJwt(token)['exp'] as int?;
+      if (exp == null) return false;
+      final expiresAt = DateTime.fromMillisecondsSinceEpoch(exp * 1000);
+      return DateTime.now().isAfter(expiresAt.subtract(const Duration(minutes: 1)));
+    } catch (e) {
+      return false;
+    }
+  }
+
+  static Future<void> _saveTokens(Map<String, dynamic> data) async {
+    await saveToken(data['token']);
+    if (data['refresh_token'] != null) {
+      final prefs = await SharedPreferences.getInstance();
+      await prefs.setString('refresh_token', data['refresh_token']);
+    }
+  }
+
+  static Future<String?>? _refreshing;
+
+  // Новая пара токенов; null - токен обновления недействителен (отозван
+  // после смены пароля или истёк), нужен повторный вход.
+  // Параллельные вызовы ждут один запрос: токен обновления одноразовый
+  static Future<String?> refreshTokens() {
+    return _refreshing ??= _refreshTokens().whenComplete(() => _refreshing = null);
+  }
+
+  static Future<String?> _refreshTokens() async {
+    final prefs = await SharedPreferences.getInstance();
+    final refreshToken = prefs.getString('refresh_token');
+    if (refreshToken == null) return null;
+    final response = await http.post(
+      Uri.parse('$_baseUrl/token/refresh'),
+      headers: {'Content-Type': 'application/json'},
+      body: jsonEncode({'refresh_token': refreshToken}),
+    );
+    if (response.statusCode == 200) {
+      final data = jsonDecode(response.body);
+      await _saveTokens(data);
+      return data['token'] as String;
+    }
+    if (response.statusCode == 401) {
+      await prefs.remove('refresh_token');
+    }
+    return null;
+  }
+
+  // Выход: сервер отзывает текущий токен доступа и токен обновления
+  static Future<void> logout() async {
+    final prefs = await SharedPreferences.getInstance();
+    final token = prefs.getString('auth_token');
+    final refreshToken = prefs.getString('refresh_token');
+    if (token != null) {
+      try {
+        await http.post(
+          Uri.parse('$_baseUrl/logout'),
+          headers: {
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer $token',
+          },
+          body: jsonEncode({'refresh_token': refreshToken}),
+        );
+      } catch (e) {
+        print('Error in logout: $e');
+      }
+    }
+    await prefs.remove('auth_token');
+    await prefs.remove('refresh_token');
+    _etagCache.clear();
+  }
+
   static Future<void> closeAccount(int accountId) async {
     final token = await getToken();
     final response = await http.post(
@@ -79,8 +179,8 @@ class ApiService {
     if (response.statusCode == 200) {
       final data = jsonDecode(response.body);
 
-      // Сохраняем токен в SharedPreferences
-      await saveToken(data['token']); // <-- ключевой момент
+      // Сохраняем токены в SharedPreferences
+      await _saveTokens(data);
 
       return data;
     } else {
@@ -124,10 +224,7 @@ class ApiService {
   static Future<User> getUser(int userId) async {
     try {
       final token = await getToken();
-      final response = await http.get(
-        Uri.parse('$_baseUrl/user/$userId'),
-        headers: {'Authorization': 'Bearer $token'},
-      );
+      final response = await _conditionalGet(Uri.parse('$_baseUrl/user/$userId'), token);
       print('getUser response status: ${response.statusCode}');
       print('getUser response body: ${response.body}');
       if (response.statusCode == 200) {
@@ -145,13 +242,52 @@ class ApiService {
     }
   }
 
-  // Получение счетов пользователя
-  static Future<List<Account>> getUserAccounts(int userId) async {
+  // Сводка главного экрана одним запросом вместо getUser, getUserAccounts,
+  // getUserTransactions, бонусов и настроек. fields - разделы и поля через
+  // запятую ("accounts,transactions"), по умолчанию все разделы
+  static Future<Dashboard> getDashboard(int userId,
+      {String? fields, int? transactionsLimit}) async {
+    final token = await getToken();
+    final response = await http.get(
+      Uri.parse('$_baseUrl/user/$userId/dashboard').replace(queryParameters: {
+        if (fields != null) 'fields': fields,
+        if (transactionsLimit != null) 'transactions_limit': '$transactionsLimit',
+      }),
+      headers: {'Authorization': 'Bearer $token'},
+    );
+    if (response.statusCode == 200) {
+      final dynamic json = jsonDecode(response.body);
+      if (json == null || json is! Map<String, dynamic>) {
+        throw Exception('Пустой или некорректный ответ сервера');
+      }
+      return Dashboard.fromJson(json);
+    } else {
+      throw Exception('Failed to load dashboard: ${response.statusCode}');
+    }
+  }
+
+  // Изменения после токена из getDashboard или прошлого syncUser.
+  // null - токен устарел (410), нужно заново загрузить сводку
+  static Future<SyncDelta?> syncUser(int userId, String since) async {
     final token = await getToken();
     final response = await http.get(
-      Uri.parse('$_baseUrl/user/$userId/accounts'),
+      Uri.parse('$_baseUrl/user/$userId/sync')
+          .replace(queryParameters: {'since': since}),
       headers: {'Authorization': 'Bearer $token'},
     );
+    if (response.statusCode == 200) {
+      return SyncDelta.fromJson(jsonDecode(response.body));
+    } else if (response.statusCode == 410) {
+      return null;
+    } else {
+      throw Exception('Failed to sync: ${response.statusCode}');
+    }
+  }
+
+  // Получение счетов пользователя
+  static Future<List<Account>> getUserAccounts(int userId) async {
+    final token = await getToken();
+    final response = await _conditionalGet(Uri.parse('$_baseUrl/user/$userId/accounts'), token);
     if (response.statusCode == 200) {
       final dynamic jsonData = jsonDecode(response.body);
       if (jsonData == null || jsonData is! List) {
@@ -293,6 +429,27 @@ class ApiService {
     }
   }
 
+  // Страница истории после курсора (transactions_cursor из сводки или
+  // курсор прошлой страницы); курсор null - более старых транзакций нет
+  static Future<(List<Transaction>, String?)> getTransactionsPage(
+      int userId, String after, {int limit = 100}) async {
+    final token = await getToken();
+    final response = await http.get(
+      Uri.parse('$_baseUrl/user/$userId/transactions')
+          .replace(queryParameters: {'after': after, 'limit': '$limit'}),
+      headers: {'Authorization': 'Bearer $token'},
+    );
+    if (response.statusCode == 200) {
+      final List<dynamic> data = jsonDecode(response.body);
+      return (
+        data.map((json) => Transaction.fromJson(json)).toList(),
+        response.headers['x-next-cursor'],
+      );
+    } else {
+      throw Exception('Failed to load transactions: ${response.statusCode}');
+    }
+  }
+
 
   // Получение доступных авиабилетов
   static Future<List<AirTicket>> getFlights() async {
@@ -337,7 +494,8 @@ class ApiService {
   }
 
 
-  static Future<List<SupportMessage>> getSupportChat() async {
+  // Переписка с поддержкой и курсор для получения следующих сообщений
+  static Future<(List<SupportMessage>, String?)> getSupportChat() async {
     final token = await getToken();
     final response = await http.get(
       Uri.parse('$_baseUrl/support/chat'),
@@ -345,12 +503,37 @@ class ApiService {
     );
     if (response.statusCode == 200) {
       final List<dynamic> data = jsonDecode(response.body);
-      return data.map((json) => SupportMessage.fromJson(json)).toList();
+      return (
+        data.map((json) => SupportMessage.fromJson(json)).toList(),
+        response.headers['x-chat-cursor'],
+      );
     } else {
       throw Exception('Failed to load support chat');
     }
   }
 
+  // Новые сообщения после курсора. Сервер держит запрос, пока не появится
+  // сообщение или не истечёт таймаут (тогда список пустой)
+  static Future<(List<SupportMessage>, String?)> pollSupportChat(
+      String? since) async {
+    final token = await getToken();
+    final query =
+        since == null ? '' : '?since=${Uri.encodeQueryComponent(since)}';
+    final response = await http.get(
+      Uri.parse('$_baseUrl/support/chat/poll$query'),
+      headers: {'Authorization': 'Bearer $token'},
+    );
+    if (response.statusCode == 200) {
+      final List<dynamic> data = jsonDecode(response.body);
+      return (
+        data.map((json) => SupportMessage.fromJson(json)).toList(),
+        response.headers['x-chat-cursor'],
+      );
+    } else {
+      throw Exception('Failed to poll support chat');
+    }
+  }
+
   static Future<void> sendSupportMessage(String messageText) async {
     final token = await getToken();
     final response = await http.post(
@@ -445,10 +628,7 @@ class ApiService {
   // Получение тикетов пользователя
   static Future<List<SupportTicket>> getUserTickets(int userId) async {
     final token = await getToken();
-    final response = await http.get(
-      Uri.parse('$_baseUrl/support/tickets'),
-      headers: {'Authorization': 'Bearer $token'},
-    );
+    final response = await _conditionalGet(Uri.parse('$_baseUrl/support/tickets'), token);
     if (response.statusCode == 200) {
       final List<dynamic> data = jsonDecode(response.body);
       return data.map((json) => SupportTicket.fromJson(json)).toList();
@@ -509,6 +689,8 @@ class ApiService {
       final errorData = jsonDecode(response.body);
       throw Exception(errorData['message'] ?? 'Ошибка изменения пароля');
     }
+    // Старые сессии отозваны, сервер выдал этому устройству новые токены
+    await _saveTokens(jsonDecode(response.body));
   }
 
 
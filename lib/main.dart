@@ -21,20 +21,26 @@ void main() {
 // Упрощенный провайдер для управления состоянием пользователя
 class UserProvider with ChangeNotifier {
   User? _currentUser;
+  Dashboard? _dashboard;
   bool _isLoading = false;
 
   User? get currentUser => _currentUser;
+  // Счета, последние транзакции и настройки, полученные при запуске
+  Dashboard? get dashboard => _dashboard;
   bool get isLoading => _isLoading;
 
   Future<User?> loadUser(int userId) async {
     _isLoading = true;
     notifyListeners();
     try {
-      final user = await ApiService.getUser(userId);
-      _currentUser = user;
-      return user;
+      // Профиль и данные главного экрана одним запросом
+      final dashboard = await ApiService.getDashboard(userId, transactionsLimit: 100);
+      _dashboard = dashboard;
+      _currentUser = dashboard.user;
+      return dashboard.user;
     } catch (e) {
       _currentUser = null;
+      _dashboard = null;
       rethrow;
     } finally {
       _isLoading = false;
@@ -43,8 +49,34 @@ class UserProvider with ChangeNotifier {
   }
 
 
+  // Обновление сводки: только изменения после последней синхронизации,
+  // полная загрузка - если токена нет или он устарел
+  Future<void> refresh() async {
+    final dashboard = _dashboard;
+    final userId = _currentUser?.userId;
+    if (userId == null) return;
+    if (dashboard == null || dashboard.syncToken == null) {
+      await loadUser(userId);
+      return;
+    }
+    var current = dashboard;
+    while (true) {
+      final delta = await ApiService.syncUser(userId, current.syncToken!);
+      if (delta == null) {
+        await loadUser(userId);
+        return;
+      }
+      current = current.applySync(delta);
+      if (!delta.hasMore) break;
+    }
+    _dashboard = current;
+    _currentUser = current.user ?? _currentUser;
+    notifyListeners();
+  }
+
   Future<void> clearUser() async {
     _currentUser = null;
+    _dashboard = null;
     notifyListeners();
   }
 }
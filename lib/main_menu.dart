@@ -81,7 +81,9 @@ class _MainMenuScreenState extends State<MainMenuScreen> {
                               ),
                               IconButton(
                                 icon: const Icon(Icons.logout, color: Colors.white),
-                                onPressed: () {
+                                onPressed: () async {
+                                  await ApiService.logout();
+                                  if (!context.mounted) return;
                                   Navigator.pushReplacementNamed(context, '/');
                                 },
                               ),
@@ -939,6 +941,10 @@ class _TransactionHistoryScreenState extends State<TransactionHistoryScreen> {
   Future<List<TransactionWithDirection>>? _transactionsWithDirectionFuture;
   int? _userId;
   List<Account> _userAccounts = [];
+  List<TransactionWithDirection> _transactions = [];
+  // Курсор следующей страницы /transactions; null - история загружена целиком
+  String? _nextCursor;
+  bool _isLoadingMore = false;
 
   @override
   void didChangeDependencies() {
@@ -950,25 +956,32 @@ class _TransactionHistoryScreenState extends State<TransactionHistoryScreen> {
     }
   }
 
+  List<TransactionWithDirection> _decorate(List<Transaction> transactions) {
+    final userAccountIds = _userAccounts.map((a) => a.accountId).toSet();
+    return transactions.map((tr) {
+      final isOutgoing = userAccountIds.contains(tr.fromAccountId);
+      return TransactionWithDirection(transaction: tr, isOutgoing: isOutgoing);
+    }).toList();
+  }
+
   Future<void> _loadAccountsAndTransactions() async {
     if (_userId == null) return;
 
     try {
-      // Загружаем счета
-      _userAccounts = await ApiService.getUserAccounts(_userId!);
-      final userAccountIds = _userAccounts.map((a) => a.accountId).toSet();
-
-      // Загружаем транзакции
-      final transactions = await ApiService.getUserTransactions(_userId!);
-
-      // Формируем список с флагом isOutgoing
-      final decoratedTransactions = transactions.map((tr) {
-        final isOutgoing = userAccountIds.contains(tr.fromAccountId);
-        return TransactionWithDirection(transaction: tr, isOutgoing: isOutgoing);
-      }).toList();
+      // Первая страница - из сводки, загруженной при запуске: с сервера
+      // приходят только изменения после прошлой синхронизации. Более старые
+      // транзакции догружаются по transactions_cursor в конце списка
+      final userProvider = Provider.of<UserProvider>(context, listen: false);
+      await userProvider.refresh();
+      final dashboard = userProvider.dashboard ??
+          await ApiService.getDashboard(_userId!,
+              fields: 'accounts,transactions', transactionsLimit: 100);
+      _userAccounts = dashboard.accounts ?? [];
+      _transactions = _decorate(dashboard.transactions ?? []);
+      _nextCursor = dashboard.transactionsCursor;
 
       setState(() {
-        _transactionsWithDirectionFuture = Future.value(decoratedTransactions);
+        _transactionsWithDirectionFuture = Future.value(_transactions);
       });
     } catch (e) {
       setState(() {
@@ -977,6 +990,36 @@ class _TransactionHistoryScreenState extends State<TransactionHistoryScreen> {
     }
   }
 
+  Future<void> _loadMore() async {
+    final cursor = _nextCursor;
+    if (_userId == null || cursor == null || _isLoadingMore) return;
+    setState(() => _isLoadingMore = true);
+    try {
+      final (page, nextCursor) =
+          await ApiService.getTransactionsPage(_userId!, cursor);
+      if (!mounted) return;
+      final loadedIds =
+          _transactions.map((t) => t.transaction.transactionId).toSet();
+      setState(() {
+        _transactions = [
+          ..._transactions,
+          ..._decorate(page
+              .where((t) => !loadedIds.contains(t.transactionId))
+              .toList()),
+        ];
+        _nextCursor = nextCursor;
+      });
+    } catch (e) {
+      if (mounted) {
+        ScaffoldMessenger.of(context).showSnackBar(
+          SnackBar(content: Text('Ошибка загрузки истории: $e')),
+        );
+      }
+    } finally {
+      if (mounted) setState(() => _isLoadingMore = false);
+    }
+  }
+
   @override
   Widget build(BuildContext context) {
     return Scaffold(
@@ -988,14 +1031,25 @@ class _TransactionHistoryScreenState extends State<TransactionHistoryScreen> {
             return const Center(child: CircularProgressIndicator());
           } else if (snapshot.hasError) {
             return Center(child: Text('Ошибка: ${snapshot.error}'));
-          } else if (!snapshot.hasData || snapshot.data!.isEmpty) {
+          } else if (!snapshot.hasData || _transactions.isEmpty) {
             return const Center(child: Text('Транзакции не найдены'));
           }
 
-          final transactionsWithDirection = snapshot.data!;
+          final transactionsWithDirection = _transactions;
+          final hasMore = _nextCursor != null;
           return ListView.builder(
-            itemCount: transactionsWithDirection.length,
+            itemCount: transactionsWithDirection.length + (hasMore ? 1 : 0),
             itemBuilder: (context, index) {
+              if (index == transactionsWithDirection.length) {
+                // Дошли до конца загруженного - запрашиваем следующую страницу
+                if (!_isLoadingMore) {
+                  WidgetsBinding.instance.addPostFrameCallback((_) => _loadMore());
+                }
+                return const Padding(
+                  padding: EdgeInsets.all(16),
+                  child: Center(child: CircularProgressIndicator()),
+                );
+              }
               final trWithDir = transactionsWithDirection[index];
               return TransactionCard(
                 transaction: trWithDir.transaction,
@@ -1283,6 +1337,7 @@ class _SupportChatScreenState extends State<SupportChatScreen> {
   final ScrollController _scrollController = ScrollController();
   List<SupportMessage> _messages = [];
   bool _loading = true;
+  String? _cursor;
 
   @override
   void initState() {
@@ -1292,12 +1347,15 @@ class _SupportChatScreenState extends State<SupportChatScreen> {
 
   Future<void> _loadMessages() async {
     try {
-      final messages = await ApiService.getSupportChat();
+      final (messages, cursor) = await ApiService.getSupportChat();
+      if (!mounted) return;
       setState(() {
         _messages = messages;
+        _cursor = cursor;
         _loading = false;
       });
       _scrollToBottom();
+      _pollMessages();
     } catch (e) {
       setState(() => _loading = false);
       ScaffoldMessenger.of(context).showSnackBar(
@@ -1306,6 +1364,29 @@ class _SupportChatScreenState extends State<SupportChatScreen> {
     }
   }
 
+  // Ожидание новых сообщений, пока экран открыт
+  Future<void> _pollMessages() async {
+    while (mounted) {
+      try {
+        final (messages, cursor) = await ApiService.pollSupportChat(_cursor);
+        if (!mounted) return;
+        _cursor = cursor ?? _cursor;
+        if (messages.isEmpty) continue;
+        setState(() {
+          // Убираем локальные копии отправленных сообщений, пришедших с сервера
+          _messages.removeWhere((m) =>
+              m.messageId == 0 &&
+              messages.any((n) =>
+                  n.senderType == 'user' && n.messageText == m.messageText));
+          _messages.addAll(messages);
+        });
+        _scrollToBottom();
+      } catch (e) {
+        await Future.delayed(const Duration(seconds: 5));
+      }
+    }
+  }
+
   void _scrollToBottom() {
     WidgetsBinding.instance.addPostFrameCallback((_) {
       if (_scrollController.hasClients) {
@@ -1333,7 +1414,6 @@ class _SupportChatScreenState extends State<SupportChatScreen> {
 
     try {
       await ApiService.sendSupportMessage(text);
-      await _loadMessages();
     } catch (e) {
       ScaffoldMessenger.of(context).showSnackBar(
         SnackBar(content: Text('Ошибка отправки сообщения: $e')),
@@ -319,3 +319,138 @@ class SupportTicket {
     );
   }
 }
+
+// Сводка главного экрана (/user/<id>/dashboard): разделы, не запрошенные
+// через fields, остаются null
+class Dashboard {
+  final User? user;
+  final List<Account>? accounts;
+  final List<Transaction>? transactions;
+  final String? transactionsCursor;
+  final double? bonusBalance;
+  final Map<String, dynamic>? settings;
+  // Токен для ApiService.syncUser: изменения после чтения сводки
+  final String? syncToken;
+
+  Dashboard({
+    this.user,
+    this.accounts,
+    this.transactions,
+    this.transactionsCursor,
+    this.bonusBalance,
+    this.settings,
+    this.syncToken,
+  });
+
+  // Сводка с применёнными изменениями из /sync
+  Dashboard applySync(SyncDelta delta) {
+    List<T>? merge<T>(List<T>? current, List<T> changed, List<int> deleted,
+        int Function(T) idOf) {
+      if (current == null) return null;
+      final changedIds = changed.map(idOf).toSet();
+      final merged = [
+        ...changed,
+        ...current.where((item) =>
+            !changedIds.contains(idOf(item)) && !deleted.contains(idOf(item))),
+      ];
+      return merged;
+    }
+
+    final accounts = merge<Account>(this.accounts, delta.accounts,
+            delta.deleted['accounts'] ?? const [], (a) => a.accountId)
+        ?.where((a) => a.isActive)
+        .toList();
+    final transactions = merge<Transaction>(this.transactions, delta.transactions,
+        delta.deleted['transactions'] ?? const [], (t) => t.transactionId);
+    transactions?.sort((a, b) {
+      final byDate = b.transactionDate.compareTo(a.transactionDate);
+      return byDate != 0 ? byDate : b.transactionId.compareTo(a.transactionId);
+    });
+    final bonusBalance = delta.bonusBalance ?? this.bonusBalance;
+    return Dashboard(
+      user: user != null && bonusBalance != null
+          ? User.fromJson({...user!.toJson(), 'bonus_balance': bonusBalance})
+          : user,
+      accounts: accounts,
+      transactions: transactions,
+      transactionsCursor: transactionsCursor,
+      bonusBalance: bonusBalance,
+      settings: delta.settings ?? settings,
+      syncToken: delta.token,
+    );
+  }
+
+  factory Dashboard.fromJson(Map<String, dynamic> json) {
+    final profile = json['profile'] as Map<String, dynamic>?;
+    final bonuses = json['bonuses'] as Map<String, dynamic>?;
+    final bonusBalance = bonuses != null
+        ? double.tryParse(bonuses['balance']?.toString() ?? '0') ?? 0.0
+        : null;
+    return Dashboard(
+      user: profile != null
+          ? User.fromJson({
+              ...profile,
+              if (bonusBalance != null) 'bonus_balance': bonusBalance,
+            })
+          : null,
+      accounts: (json['accounts'] as List?)
+          ?.map((a) => Account.fromJson(a as Map<String, dynamic>))
+          .toList(),
+      transactions: (json['transactions'] as List?)
+          ?.map((t) => Transaction.fromJson(t as Map<String, dynamic>))
+          .toList(),
+      transactionsCursor: json['transactions_cursor'] as String?,
+      bonusBalance: bonusBalance,
+      settings: json['settings'] as Map<String, dynamic>?,
+      syncToken: json['sync_token'] as String?,
+    );
+  }
+}
+
+// Изменения после токена (/user/<id>/sync): новые и изменённые строки,
+// id удалённых и новый токен
+class SyncDelta {
+  final String token;
+  final bool hasMore;
+  final List<Account> accounts;
+  final List<Transaction> transactions;
+  final List<SupportTicket> tickets;
+  final List<Map<String, dynamic>> bonusOperations;
+  final Map<String, dynamic>? settings;
+  final Map<String, List<int>> deleted;
+  final double? bonusBalance;
+
+  SyncDelta({
+    required this.token,
+    required this.hasMore,
+    required this.accounts,
+    required this.transactions,
+    required this.tickets,
+    required this.bonusOperations,
+    this.settings,
+    required this.deleted,
+    this.bonusBalance,
+  });
+
+  factory SyncDelta.fromJson(Map<String, dynamic> json) {
+    final changes = json['changes'] as Map<String, dynamic>? ?? {};
+    List<T> parse<T>(String key, T Function(Map<String, dynamic>) fromJson) =>
+        (changes[key] as List? ?? [])
+            .map((item) => fromJson(item as Map<String, dynamic>))
+            .toList();
+    return SyncDelta(
+      token: json['token'] as String,
+      hasMore: json['has_more'] as bool? ?? false,
+      accounts: parse('accounts', Account.fromJson),
+      transactions: parse('transactions', Transaction.fromJson),
+      tickets: parse('support_tickets', SupportTicket.fromJson),
+      bonusOperations: parse('bonus_operations', (item) => item),
+      settings: changes['settings'] as Map<String, dynamic>?,
+      deleted: (json['deleted'] as Map<String, dynamic>? ?? {}).map(
+          (key, ids) => MapEntry(key, (ids as List).cast<int>())),
+      bonusBalance: json['bonus_balance'] != null
+          ? double.tryParse(json['bonus_balance'].toString())
+          : null,
+    );
+  }
+}
@@ -1,17 +1,11 @@
 import mysql.connector
-from flask import Flask, jsonify, request, make_response
-from flask_cors import CORS
-import mysql.connector
-import bcrypt
-import datetime
-from functools import wraps
-import re
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 from hashlib import pbkdf2_hmac
 import binascii
 import os
-import jwt
-import uuid
-from datetime import datetime, timedelta
 
 def hash_password(password):
     """Генерация хеша пароля"""
@@ -27,43 +21,99 @@ db_config = {
     'database': 'mbapp'
 }
 
-def update_passwords():
+CHECKPOINT_FILE = 'update_passwords.checkpoint.json'
+
+def _hash_chunk(args):
+    """Хеширование пачки пользователей в процессе пула"""
+    user_ids, password = args
+    return [(hash_password(password), user_id) for user_id in user_ids]
+
+def load_checkpoint(path):
+    """ID последнего обработанного пользователя (0, если начинаем заново)"""
+    try:
+        with open(path) as f:
+            return json.load(f)['last_user_id']
+    except FileNotFoundError:
+        return 0
+
+def save_checkpoint(path, last_user_id, processed):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'last_user_id': last_user_id, 'processed': processed}, f)
+    os.replace(tmp_path, path)
+
+def update_passwords(new_password="password", chunk_size=1000, workers=None,
+                     checkpoint=CHECKPOINT_FILE, resume=True):
+    """Массовая смена паролей: пользователи читаются пачками по user_id,
+    хешируются в пуле процессов и записываются с фиксацией после каждой
+    пачки. Прерванный запуск продолжается с контрольной точки."""
+    last_user_id = load_checkpoint(checkpoint) if resume else 0
+    if last_user_id:
+        print(f"Продолжаем с пользователя ID > {last_user_id}")
+
+    reader = writer = None
     try:
-        # Подключаемся к базе данных
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-        
-        # Получаем всех пользователей
-        cursor.execute("SELECT user_id, phone_number FROM users")
-        users = cursor.fetchall()
-        
-        # Новый пароль
-        new_password = "password"
-        
-        for user in users:
-            user_id, phone_number = user
-            print(f"Обновление пароля для пользователя {phone_number} (ID: {user_id})")
-            
-            # Хешируем новый пароль
-            hashed_password = hash_password(new_password)
-            
-            # Обновляем запись в базе данных
-            cursor.execute(
-                "UPDATE users SET password_hash = %s WHERE user_id = %s",
-                (hashed_password, user_id)
-            )
-        
-        # Фиксируем изменения
-        conn.commit()
+        # Отдельные соединения: каждая пачка читается своим запросом по
+        # ключу в режиме autocommit, чтобы не держать один снимок чтения
+        # на весь проход, а записи фиксируются пачками
+        reader = mysql.connector.connect(**db_config)
+        reader.autocommit = True
+        writer = mysql.connector.connect(**db_config)
+        read_cursor = reader.cursor()
+        write_cursor = writer.cursor()
+
+        processed = 0
+        started = time.monotonic()
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                read_cursor.execute(
+                    "SELECT user_id FROM users WHERE user_id > %s ORDER BY user_id LIMIT %s",
+                    (last_user_id, chunk_size)
+                )
+                rows = read_cursor.fetchall()
+                if not rows:
+                    break
+                user_ids = [row[0] for row in rows]
+
+                # Делим пачку между процессами
+                step = max(1, -(-len(user_ids) // workers))
+                parts = [(user_ids[i:i + step], new_password) for i in range(0, len(user_ids), step)]
+                updates = [pair for part in pool.map(_hash_chunk, parts) for pair in part]
+
+                write_cursor.executemany(
+                    "UPDATE users SET password_hash = %s WHERE user_id = %s",
+                    updates
+                )
+                writer.commit()
+
+                processed += len(user_ids)
+                last_user_id = user_ids[-1]
+                save_checkpoint(checkpoint, last_user_id, processed)
+
+                elapsed = time.monotonic() - started
+                print(f"Обновлено {processed} пользователей (последний ID {last_user_id}), "
+                      f"{processed / elapsed:.1f} польз./с")
+
         print("Все пароли успешно обновлены!")
-        
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
     except mysql.connector.Error as err:
         print(f"Ошибка: {err}")
-        
+        print(f"Запустите скрипт повторно, чтобы продолжить с пользователя ID > {last_user_id}")
+
     finally:
-        if conn and conn.is_connected():
-            cursor.close()
-            conn.close()
+        for conn in (reader, writer):
+            if conn and conn.is_connected():
+                conn.close()
 
 if __name__ == "__main__":
-    update_passwords()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Массовая смена паролей пользователей")
+    parser.add_argument("--password", default="password", help="новый пароль для всех пользователей")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию - число ядер)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--restart", action="store_true", help="игнорировать контрольную точку")
+    args = parser.parse_args()
+    update_passwords(args.password, args.chunk_size, args.workers, args.checkpoint, not args.restart)